@@ -1,69 +1,212 @@
 import os
 import csv
 import base64
-import pandas as pd
-from flask import Flask, render_template, request, jsonify
-from werkzeug.utils import secure_filename
-import requests
-from PIL import Image
-import io
 import json
+import uuid
+import threading
+from flask import Flask, Response, g, render_template, request, jsonify, send_from_directory, stream_with_context
+from werkzeug.utils import secure_filename
+import store
+import llm_stub
+from chat_context import build_data_context, read_cached_context, write_cached_context, window_messages
+from conversation_store import open_store
+from image_prep import image_key, prepare_image, read_cached_analysis, write_cached_analysis
+from query_tools import TOOLS, run_tool
+
+# pandas, requests and the ingestion code are imported on first use, so a
+# worker boots and serves its first pages without loading them
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg'}
 
-# Create uploads folder if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
 # Groq API configuration
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY', '')
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.environ.get('GROQ_API_URL', "https://api.groq.com/openai/v1/chat/completions")
+
+# Shared keep-alive client for all requests to the API, created by get_llm
+llm = None
+
+# Model that describes uploaded images; it is part of the image analysis cache key
+IMAGE_MODEL = "llama-3.1-8b-instant"
+
+# Answer chats with the offline stub instead of the remote API
+USE_LLM_STUB = os.environ.get('LLM_STUB') == '1'
+
+# Most rounds of tool calls the model may make for one answer
+MAX_TOOL_ROUNDS = 3
+
+# Conversation history of each browser session: 'memory' or 'sqlite:<path>' to share it between workers
+conversations = open_store(os.environ.get('CONVERSATION_STORE', 'memory'))
+SESSION_COOKIE = 'chat_session'
+
+# Data summary sent to the model, rebuilt when the CSV files change
+data_lock = threading.Lock()
+data_context = None
+data_context_signature = None
 
-# Store conversation history
-conversation_history = []
-csv_data = {}
+# Circulation database, opened by get_db
+db = None
+
+# Background ingestion of uploaded CSVs, created by get_upload_jobs
+upload_jobs = None
+
+# Guards the lazy creation of the shared objects above
+init_lock = threading.Lock()
+
+# Static dashboard, its data files written by dashboard_data.py and the figures it falls back to
+DASHBOARD_DIR = 'dashboard'
+PLOTS_DIR = 'plots'
+
+# Figure formats plotting.py renders; nothing else under PLOTS_DIR is served
+PLOT_EXTENSIONS = ('.png', '.svg')
+
+# Dashboard data files are named by content version, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def load_csv_files():
-    """Load all CSV files from the data directory"""
-    global csv_data
-    data_dir = 'data'
-    
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-        print(f"Created {data_dir} directory. Please add your CSV files there.")
-        return
-    
-    for filename in os.listdir(data_dir):
+def upload_message(job):
+    """What the assistant says about a finished upload job"""
+    if job['state'] == 'done':
+        return f"I've loaded your CSV file '{job['filename']}' with {job['rows_done']} records. You can now ask questions about this data."
+    return f"I couldn't load your CSV file '{job['filename']}': {job['error']}"
+
+def get_db():
+    """Open the circulation store on first use, ingesting the reports in the data directory if they changed"""
+    global db
+    if db is not None:
+        return db
+    with init_lock:
+        if db is None:
+            data_dir = 'data'
+            if not os.path.exists(data_dir):
+                os.makedirs(data_dir)
+                print(f"Created {data_dir} directory. Please add your CSV files there.")
+            
+            conn = store.connect()
+            rows = store.ingest_reports(conn, data_dir)
+            if rows:
+                print(f"Ingested {rows} circulation records into {store.DB_FILE}")
+            elif not store.has_summaries(conn):
+                store.refresh_summaries(conn)
+            db = conn
+    return db
+
+def get_llm():
+    global llm
+    if llm is None:
+        with init_lock:
+            if llm is None:
+                from llm_client import LLMClient
+                llm = LLMClient(GROQ_API_URL, GROQ_API_KEY)
+    return llm
+
+def get_upload_jobs():
+    global upload_jobs
+    if upload_jobs is None:
+        with init_lock:
+            if upload_jobs is None:
+                from upload_jobs import UploadJobs
+                upload_jobs = UploadJobs()
+    return upload_jobs
+
+def scan_csv_files(data_dir='data'):
+    """Return the columns and number of records of every CSV in the data directory"""
+    csv_columns, csv_rows = {}, {}
+    for filename in sorted(os.listdir(data_dir)):
         if filename.endswith('.csv'):
             file_path = os.path.join(data_dir, filename)
             try:
-                df = pd.read_csv(file_path)
-                csv_data[filename] = df.to_dict(orient='records')
-                print(f"Loaded {filename} with {len(df)} records")
+                with open(file_path, newline='', encoding='utf-8', errors='replace') as f:
+                    csv_columns[filename] = next(csv.reader(f), [])
+                with open(file_path, 'rb') as f:
+                    csv_rows[filename] = max(sum(1 for _ in f) - 1, 0)
             except Exception as e:
                 print(f"Error loading {filename}: {e}")
+    return csv_columns, csv_rows
+
+def data_signature(data_dir='data'):
+    """Name, size and modification time of every CSV, which changes with any upload in any worker"""
+    if not os.path.exists(data_dir):
+        return ()
+    signature = []
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.endswith('.csv'):
+            stat = os.stat(os.path.join(data_dir, filename))
+            signature.append((filename, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+def get_data_context():
+    """Return the data summary, building it once per version of the data files and the store"""
+    global data_context, data_context_signature
+    with data_lock:
+        # An upload is saved to data/ before its rows are in the store, so both are part of the key
+        signature = (data_signature(), store.rows_version(get_db()))
+        if data_context is None or data_context_signature != signature:
+            # Another worker or an earlier run may have built it already
+            context = read_cached_context(signature)
+            if context is None:
+                csv_columns, csv_rows = scan_csv_files() if signature[0] else ({}, {})
+                context = build_data_context(get_db(), csv_columns, csv_rows)
+                write_cached_context(signature, context)
+            data_context = context
+            data_context_signature = signature
+        return data_context
+
+@app.before_request
+def load_session():
+    """Find the browser's chat session, starting a new one if it has none"""
+    g.session_id = request.cookies.get(SESSION_COOKIE) or uuid.uuid4().hex
+
+@app.after_request
+def save_session(response):
+    """Set the session cookie, pushing its expiry forward with every response as the store's TTL slides"""
+    if getattr(g, 'session_id', None):
+        response.set_cookie(SESSION_COOKIE, g.session_id, max_age=conversations.ttl, httponly=True, samesite='Lax')
+    return response
 
-def encode_image(image_path):
-    """Encode image to base64 for API request"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def encode_image(image):
+    """Encode a prepared image to base64 for API request"""
+    return base64.b64encode(image.data).decode('utf-8')
 
-def analyze_image_with_groq(image_path):
-    """Send image to Groq for analysis"""
-    base64_image = encode_image(image_path)
+def chat_completion(payload):
+    """Post a chat completion request and return the parsed response"""
+    if USE_LLM_STUB:
+        return llm_stub.complete(payload)
+    return get_llm().complete(payload)
+
+def chat_completion_stream(payload):
+    """Post a streaming chat completion request and yield its parsed chunks"""
+    if USE_LLM_STUB:
+        return llm_stub.stream(payload)
+    return get_llm().stream(payload)
+
+def analyze_image(data):
+    """
+    Describe an uploaded image, reusing the analysis of an identical earlier upload.
+
+    Raises ValueError if the data isn't an image. Returns None if the model
+    couldn't be reached; such failures aren't cached.
+    """
+    key = image_key(data, model=IMAGE_MODEL)
+    analysis = read_cached_analysis(key)
+    if analysis is not None:
+        return analysis
     
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    image = prepare_image(data)
+    analysis = analyze_image_with_groq(image)
+    if analysis is not None:
+        write_cached_analysis(key, analysis)
+    return analysis
+
+def analyze_image_with_groq(image):
+    """Send a prepared image to Groq for analysis"""
+    base64_image = encode_image(image)
     
     payload = {
-        "model": "llama-3.1-8b-instant",  # Use a model that supports image analysis
+        "model": IMAGE_MODEL,  # Use a model that supports image analysis
         "messages": [
             {
                 "role": "system",
@@ -73,7 +216,7 @@ def analyze_image_with_groq(image_path):
                 "role": "user",
                 "content": [
                     {"type": "text", "text": "Please analyze this image and describe what you see in detail."},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                    {"type": "image_url", "image_url": {"url": f"data:{image.mime};base64,{base64_image}"}}
                 ]
             }
         ],
@@ -81,28 +224,16 @@ def analyze_image_with_groq(image_path):
     }
     
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
+        result = chat_completion(payload)
         return result['choices'][0]['message']['content']
     except Exception as e:
         print(f"Error analyzing image: {e}")
-        return "Sorry, I couldn't analyze the image. Please try again."
+        return None
 
-def query_groq(messages):
-    """Send query to Groq API"""
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Add CSV context to system message
-    csv_context = "Here's the data from CSV files you can reference:\n"
-    for filename, data in csv_data.items():
-        csv_context += f"\n--- {filename} ---\n"
-        # Limit to first 5 records to avoid token limits
-        for i, record in enumerate(data[:5]):
-            csv_context += f"Record {i+1}: {json.dumps(record)}\n"
+def chat_payload(messages):
+    """Build the chat request for the conversation so far"""
+    # Add a summary of the loaded data to the system message
+    csv_context = "Here's a summary of the library data you can reference:\n" + get_data_context()
     
     system_message = {
         "role": "system",
@@ -111,7 +242,7 @@ def query_groq(messages):
 IMPORTANT INSTRUCTIONS:
 1. DO NOT generate SQL code or queries in your responses
 2. ALWAYS respond in plain English without code snippets
-3. Provide direct answers based on your understanding of the data
+3. Use the provided tools to look up counts in the full circulation data before answering
 4. Format responses using Markdown for readability (bold, lists, etc.)
 5. If calculations are needed, perform them yourself and show only the results
 6. Focus on insights that would be valuable to librarians
@@ -119,8 +250,8 @@ IMPORTANT INSTRUCTIONS:
 {csv_context}"""
     }
     
-    # Prepare messages for API
-    api_messages = [system_message] + messages
+    # Prepare messages for API, keeping only the recent conversation
+    api_messages = [system_message] + window_messages(messages)
     
     payload = {
         "model": "llama-3.1-8b-instant",
@@ -128,16 +259,50 @@ IMPORTANT INSTRUCTIONS:
         "temperature": 0.2,  # Lower temperature for more focused responses
         "max_tokens": 800
     }
+    payload["tools"] = TOOLS
+    payload["tool_choice"] = "auto"
+    return payload
+
+def answer_tool_calls(payload, message, tool_round):
+    """Add the model's tool calls and their results to the request for its next round"""
+    payload["messages"].append(message)
+    for call in message['tool_calls']:
+        payload["messages"].append({
+            "role": "tool",
+            "tool_call_id": call['id'],
+            "content": run_tool(get_db(), call['function']['name'], call['function'].get('arguments'))
+        })
+    if tool_round + 1 == MAX_TOOL_ROUNDS:
+        # Last round: the model has to answer with what it has
+        payload.pop("tools", None)
+        payload.pop("tool_choice", None)
+
+def query_groq(messages):
+    """Send query to Groq API, running the data tools the model calls"""
+    payload = chat_payload(messages)
     
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        for tool_round in range(MAX_TOOL_ROUNDS + 1):
+            message = chat_completion(payload)['choices'][0]['message']
+            if not message.get('tool_calls'):
+                return message['content']
+            answer_tool_calls(payload, message, tool_round)
+        return message.get('content') or "Sorry, I couldn't find an answer in the data."
     except Exception as e:
         print(f"Error querying Groq: {e}")
         return "Sorry, I encountered an error. Please try again."
 
+def stream_groq(messages):
+    """Like query_groq, but yield the answer's text as the model produces it"""
+    from llm_client import stream_message
+    payload = chat_payload(messages)
+    
+    for tool_round in range(MAX_TOOL_ROUNDS + 1):
+        message = yield from stream_message(chat_completion_stream(payload))
+        if not message.get('tool_calls'):
+            return
+        answer_tool_calls(payload, message, tool_round)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -154,21 +319,22 @@ def upload_file():
     
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
         
-        # Analyze the image
-        analysis = analyze_image_with_groq(file_path)
+        # Analyze the image, downsized and stripped of metadata
+        try:
+            analysis = analyze_image(file.read())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if analysis is None:
+            analysis = "Sorry, I couldn't analyze the image. Please try again."
         
         # Add to conversation history
-        conversation_history.append({
+        conversations.append(g.session_id, {
             "role": "user",
             "content": [
                 {"type": "text", "text": "I uploaded an image for analysis."}
             ]
-        })
-        
-        conversation_history.append({
+        }, {
             "role": "assistant",
             "content": analysis
         })
@@ -200,33 +366,40 @@ def upload_csv():
         file_path = os.path.join('data', filename)
         file.save(file_path)
         
-        # Load the newly uploaded CSV
-        try:
-            df = pd.read_csv(file_path)
-            csv_data[filename] = df.to_dict(orient='records')
-            
-            # Add to conversation history
-            conversation_history.append({
+        # Ingest it in the background; the client polls the job for progress
+        session_id = g.session_id
+        
+        def upload_done(job):
+            conversations.append(session_id, {
                 "role": "user",
                 "content": f"I uploaded a CSV file named {filename}."
-            })
-            
-            conversation_history.append({
+            }, {
                 "role": "assistant",
-                "content": f"I've loaded your CSV file '{filename}' with {len(df)} records. You can now ask questions about this data."
+                "content": upload_message(job)
             })
-            
-            return jsonify({
-                "message": "CSV file uploaded successfully",
-                "filename": filename,
-                "records": len(df),
-                "response": f"I've loaded your CSV file '{filename}' with {len(df)} records. You can now ask questions about this data."
-            })
-        except Exception as e:
-            return jsonify({"error": f"Error processing CSV: {str(e)}"}), 400
+        
+        job_id = get_upload_jobs().submit(file_path, filename, on_done=upload_done)
+        
+        return jsonify({
+            "message": "CSV file uploaded, loading it in the background",
+            "filename": filename,
+            "job_id": job_id,
+            "status_url": f"/upload-csv/{job_id}"
+        }), 202
     
     return jsonify({"error": "File type not allowed. Please upload a CSV file."}), 400
 
+@app.route('/upload-csv/<job_id>')
+def upload_csv_status(job_id):
+    """Progress of a background CSV upload"""
+    job = upload_jobs.status(job_id) if upload_jobs is not None else None
+    if job is None:
+        return jsonify({"error": "Unknown upload job"}), 404
+    
+    if job['finished'] is not None:
+        job['response'] = upload_message(job)
+    return jsonify(job)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
@@ -236,28 +409,104 @@ def chat():
         return jsonify({"error": "No message provided"}), 400
     
     # Add user message to conversation history
-    conversation_history.append({
+    conversations.append(g.session_id, {
         "role": "user",
         "content": user_message
     })
+    history = conversations.get(g.session_id)
+    
+    if data.get('stream'):
+        return Response(stream_with_context(stream_chat_events(g.session_id, history)), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     
     # Get response from Groq
-    response = query_groq(conversation_history)
+    response = query_groq(history)
     
     # Add assistant response to conversation history
-    conversation_history.append({
+    conversations.append(g.session_id, {
         "role": "assistant",
         "content": response
     })
     
     return jsonify({"response": response})
 
+def stream_chat_events(session_id, history):
+    """Server-sent events with each piece of the answer, then [DONE]"""
+    pieces = []
+    try:
+        for text in stream_groq(history):
+            pieces.append(text)
+            yield f"data: {json.dumps({'text': text})}\n\n"
+    except Exception as e:
+        print(f"Error streaming from Groq: {e}")
+        message = "Sorry, I encountered an error. Please try again."
+        pieces = [message]
+        yield f"event: error\ndata: {json.dumps({'text': message})}\n\n"
+    
+    # Add assistant response to conversation history
+    conversations.append(session_id, {
+        "role": "assistant",
+        "content": ''.join(pieces)
+    })
+    yield "data: [DONE]\n\n"
+
+@app.route('/api/counts')
+def api_counts():
+    """Grouped counts from the circulation store, e.g. /api/counts?by=Subject&transaction=Check out"""
+    db = get_db()
+    by = request.args.getlist('by') or ['Subject']
+    filters = {column: value for column, value in request.args.items()
+               if column in store.QUERY_COLUMNS and column not in by}
+    try:
+        counts = store.group_counts(db, by,
+                                    transaction=request.args.get('transaction'),
+                                    start=request.args.get('start'),
+                                    end=request.args.get('end'),
+                                    filters=filters,
+                                    limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(counts.to_dict(orient='records'))
+
+@app.route('/dashboard/')
+@app.route('/dashboard/<path:filename>')
+def dashboard(filename='index.html'):
+    """
+    Serve the dashboard and its data files.
+
+    Versioned data files are sent gzipped when the browser accepts it and
+    cached as immutable; everything else is revalidated by ETag.
+    """
+    data_file = filename.startswith('data/') and filename.endswith('.json')
+    # index.json is revalidated; the files it names carry their version in the name
+    versioned = data_file and filename.count('.') > 1
+    max_age = IMMUTABLE_MAX_AGE if versioned else None
+
+    gzipped = (data_file and request.accept_encodings['gzip'] > 0
+               and os.path.exists(os.path.join(app.root_path, DASHBOARD_DIR, filename + '.gz')))
+    if gzipped:
+        response = send_from_directory(DASHBOARD_DIR, filename + '.gz', mimetype='application/json', max_age=max_age)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(DASHBOARD_DIR, filename, max_age=max_age)
+
+    if data_file:
+        response.vary.add('Accept-Encoding')
+    if versioned:
+        response.cache_control.immutable = True
+    return response
+
+@app.route('/plots/<path:filename>')
+def plots(filename):
+    if os.path.splitext(filename)[1].lower() not in PLOT_EXTENSIONS:
+        return jsonify({"error": "Not found"}), 404
+    return send_from_directory(PLOTS_DIR, filename)
+
 @app.route('/reset', methods=['POST'])
 def reset_conversation():
-    global conversation_history
-    conversation_history = []
+    conversations.reset(g.session_id)
     return jsonify({"message": "Conversation reset successfully"})
 
 if __name__ == '__main__':
-    load_csv_files()
     app.run(debug=True)
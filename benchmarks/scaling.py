@@ -0,0 +1,196 @@
+"""
+Benchmark how the analyses scale with the number of transactions.
+
+For each row count a synthetic report is generated (see synthetic_data),
+parsed and classified, and every analyze_* function and
+generate_insights_summary is timed, taking the best of a few runs. A
+further run of each under tracemalloc records its peak memory. Results are
+written as JSON; compare them with an earlier file to catch regressions.
+
+Run from the repository root:
+    python -m benchmarks.scaling
+    python -m benchmarks.scaling --rows 10000 100000 1000000 10000000 --keep-data synthetic
+    python -m benchmarks.scaling --baseline benchmarks/results/scaling-<before>.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+from data_utils import AnalysisContext, parse_report, split_checkouts
+from subject_analysis import analyze_subject_popularity
+from reading_journey import analyze_reading_journeys
+from patron_analysis import analyze_patron_patterns
+from temporal_analysis import analyze_temporal_patterns
+from community_engagement import analyze_community_engagement
+from loans import analyze_loans
+from main import generate_insights_summary
+from benchmarks.synthetic_data import base_titles, write_report
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+# Slowdown or memory growth over the baseline reported as a regression
+TOLERANCE = 0.25
+
+# Runs below this many seconds are too noisy to compare
+MIN_COMPARED_SECONDS = 0.005
+
+ANALYSES = [
+    ('analyze_subject_popularity', analyze_subject_popularity),
+    ('analyze_reading_journeys', analyze_reading_journeys),
+    ('analyze_patron_patterns', analyze_patron_patterns),
+    ('analyze_temporal_patterns', analyze_temporal_patterns),
+    ('analyze_community_engagement', analyze_community_engagement),
+    ('analyze_loans', analyze_loans),
+]
+
+def measure(func, repeat, memory):
+    """
+    Time func, best of repeat runs, then run it once more under tracemalloc.
+
+    Returns:
+        result, stats: The last return value and a dict of timings and peak MB
+    """
+    timings = []
+    # Output of the analyses would drown the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+
+        peak_mb = None
+        if memory:
+            tracemalloc.start()
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+    return result, {'seconds': min(timings), 'median_seconds': float(np.median(timings)), 'peak_mb': peak_mb}
+
+def benchmark_rows(report_path, n_rows, repeat, memory):
+    """Benchmark loading and every analysis on one report; returns a list of result rows."""
+    rows = []
+
+    def record(function, stats):
+        rows.append({'rows': n_rows, 'function': function, **stats,
+                     'rows_per_second': n_rows / stats['seconds'] if stats['seconds'] else None})
+        peak = f"{stats['peak_mb']:>10.1f}" if stats['peak_mb'] is not None else f"{'-':>10}"
+        print(f"{n_rows:>10,} {function:<30} {stats['seconds'] * 1000:>10.1f} {peak}")
+
+    df, stats = measure(lambda: parse_report(report_path), 1, memory)
+    record('parse_report', stats)
+    checkouts, stats = measure(lambda: split_checkouts(df, use_cache=False), 1, memory)
+    record('split_checkouts', stats)
+    ctx = AnalysisContext(df, checkouts)
+
+    results = {}
+    for name, analyze in ANALYSES:
+        results[name], stats = measure(lambda: analyze(ctx), repeat, memory)
+        record(name, stats)
+
+    _, top_subjects, _ = results['analyze_subject_popularity']
+    _, transition_matrix, common_paths = results['analyze_reading_journeys']
+    dept_interests, _, _ = results['analyze_patron_patterns']
+    activity_by_hour_day, top_combinations, _ = results['analyze_community_engagement']
+    _, stats = measure(lambda: generate_insights_summary(top_subjects, transition_matrix, common_paths, dept_interests,
+                                                         top_combinations, activity_by_hour_day), repeat, memory)
+    record('generate_insights_summary', stats)
+    return rows
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit or None,
+    }
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare results with a baseline run of the same rows and functions.
+
+    Returns:
+        regressions: Descriptions of the timings or peaks that grew by more than tolerance
+    """
+    before = {(row['rows'], row['function']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = before.get((row['rows'], row['function']))
+        if old is None:
+            continue
+        if old['seconds'] >= MIN_COMPARED_SECONDS and row['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append(f"{row['function']} at {row['rows']:,} rows: "
+                               f"{old['seconds'] * 1000:.1f} -> {row['seconds'] * 1000:.1f} ms")
+        if old.get('peak_mb') and row.get('peak_mb') and row['peak_mb'] > old['peak_mb'] * (1 + tolerance):
+            regressions.append(f"{row['function']} at {row['rows']:,} rows: "
+                               f"{old['peak_mb']:.1f} -> {row['peak_mb']:.1f} MB peak")
+    return regressions
+
+def run_benchmark(row_counts=DEFAULT_ROWS, repeat=3, memory=True, seed=0, data_dir=None, output=None, baseline=None):
+    titles = base_titles()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'rows':>10} {'function':<30} {'ms':>10} {'peak MB':>10}")
+        for n_rows in row_counts:
+            report_path = write_report(data_dir or workdir, n_rows, seed=seed, titles=titles)
+
+            # generate_insights_summary writes its text file to the working directory
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                results += benchmark_rows(os.path.join(cwd, report_path), n_rows, repeat, memory)
+            finally:
+                os.chdir(cwd)
+
+    doc = {
+        'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': {'repeat': repeat, 'seed': seed},
+        'results': results,
+    }
+    output = output or os.path.join(RESULTS_DIR, f"scaling-{pd.Timestamp.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"\n{len(regressions)} regressions against {baseline}:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print(f"\nNo regressions against {baseline}")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and memory-profile the analyses on synthetic reports")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="Report sizes to benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per function; the best is kept")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc runs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep-data', default=None, help="Directory to keep generated reports in for later runs")
+    parser.add_argument('--output', default=None, help="Results file (default: benchmarks/results/scaling-<time>.json)")
+    parser.add_argument('--baseline', default=None, help="Earlier results file; exit 1 on regressions")
+    args = parser.parse_args()
+    sys.exit(run_benchmark(args.rows, args.repeat, not args.no_memory, args.seed, args.keep_data,
+                           args.output, args.baseline))
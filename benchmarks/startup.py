@@ -0,0 +1,59 @@
+"""
+Benchmark the web app's cold start.
+
+Each run starts a fresh interpreter, imports app and times the first GET /
+and the first POST /chat through Flask's test client, answered by the
+offline model stub. Runs are made with the on-disk caches (store, chat
+summary) cold and warm.
+
+Run from the repository root:
+    python -m benchmarks.startup
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import time
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+assert client.get('/').status_code == 200
+index = time.perf_counter()
+response = client.post('/chat', json={'message': 'What are the busiest hours?'})
+assert response.status_code == 200, response.data
+chat = time.perf_counter()
+heavy = [name for name in ('pandas', 'numpy', 'scipy', 'PIL') if name in sys.modules]
+print(json.dumps({'import': imported - start, 'index': index - imported, 'chat': chat - index, 'heavy': heavy}))
+"""
+
+def run_child(workdir):
+    env = {**os.environ, 'LLM_STUB': '1', 'PYTHONPATH': os.getcwd()}
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - start
+    return {**json.loads(output.strip().splitlines()[-1]), 'total': total}
+
+def report(label, timings):
+    print(f"{label:<24} {timings['import'] * 1000:>8.0f} {timings['index'] * 1000:>8.0f} "
+          f"{timings['chat'] * 1000:>8.0f} {timings['total'] * 1000:>8.0f}   {', '.join(timings['heavy']) or '-'}")
+
+def run_benchmark(runs=3):
+    with tempfile.TemporaryDirectory() as workdir:
+        # Templates are found next to app.py; data and cache are relative to the working directory
+        shutil.copytree('data', os.path.join(workdir, 'data'))
+
+        print(f"{'':<24} {'import':>8} {'GET /':>8} {'/chat':>8} {'total':>8}   heavy modules loaded")
+        print(f"{'':<24} {'ms':>8} {'ms':>8} {'ms':>8} {'ms':>8}")
+        report("cold caches", run_child(workdir))
+        for run in range(runs):
+            report(f"warm caches, run {run + 1}", run_child(workdir))
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,102 @@
+"""
+Measure the streaming sketches against exact pandas results on the bundled reports.
+
+Each bundled report is sketched separately, as a branch or a day would be,
+and the sketches are merged. The recall and overcounts of the top titles and
+barcodes, the error of the distinct patron counts overall and per department
+and subject, the time taken and the saved size are printed. The accuracy
+guarantees themselves are asserted by tests/test_streaming.py on a small
+synthetic frame.
+
+Run from the repository root:
+    python -m benchmarks.streaming_accuracy
+"""
+import os
+import glob
+import time
+import tempfile
+import numpy as np
+from data_utils import DATA_DIR, REPORT_PATTERN, load_report, combine_reports, split_checkouts
+from streaming import CirculationSketch, CMS_WIDTH, HLL_PRECISION
+
+# Exact top keys whose recall is reported
+TOP_N = 10
+
+# Standard error of the HyperLogLog, for comparison with the errors printed
+HLL_ERROR = 1.04 / np.sqrt(2 ** HLL_PRECISION)
+
+# Groups with fewer patrons are left out of the per-group numbers
+MIN_GROUP_PATRONS = 100
+
+def report_heavy_hitters(label, estimated, exact, total, k):
+    """
+    Print the recall of the exact top TOP_N and the overcounts against the Count-Min bound.
+
+    A key is safe when its exact count beats the k-th largest by more than
+    the bound, as no overestimated key can then push it out of the heap.
+    """
+    estimated = dict(estimated)
+    exact.index = exact.index.astype(str)
+    bound = np.e / CMS_WIDTH * total
+    threshold = (exact.iloc[k - 1] if len(exact) >= k else 0) + bound
+    safe = exact[exact > threshold]
+    recall = np.mean([key in estimated for key in exact.head(TOP_N).index])
+    found = sum(key in estimated for key in safe.index)
+    errors = [estimated[key] - count for key, count in exact.items() if key in estimated]
+    print(f"{label:<16} top {TOP_N} recall {recall:>5.0%}   {found:>3} of {len(safe)} keys above {threshold:.0f} found   "
+          f"worst overcount {max(errors, default=0):>3} (bound {bound:.0f})")
+
+def report_distinct(label, estimated, exact):
+    error = abs(estimated - exact) / exact
+    print(f"{label:<40} {estimated:>7,} vs {exact:>7,} exact   error {error:>6.2%}")
+
+def run_benchmark():
+    paths = sorted(glob.glob(os.path.join(DATA_DIR, REPORT_PATTERN)))
+    reports = [load_report(path) for path in paths]
+    df = combine_reports(reports)
+    checkouts = split_checkouts(df)
+    print(f"{len(df):,} transactions in {len(paths)} reports\n")
+
+    # One sketch per report, merged; the bundled reports cover separate periods
+    start = time.perf_counter()
+    sketches = []
+    for report in reports:
+        sketch = CirculationSketch()
+        sketch.update(report)
+        sketches.append(sketch)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+    print(f"Sketched and merged in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+    report_heavy_hitters("top titles", merged.top_titles(merged.k), checkouts['Title'].value_counts(),
+                         len(checkouts), merged.k)
+    report_heavy_hitters("top barcodes", merged.top_barcodes(merged.k), checkouts['Barcode'].value_counts(),
+                         len(checkouts), merged.k)
+
+    print(f"\nHyperLogLog standard error {HLL_ERROR:.2%}")
+    report_distinct("distinct patrons", merged.distinct_patrons(), df['Card Number'].nunique())
+    by_department = df.groupby('Department', observed=True)['Card Number'].nunique()
+    for department, exact in by_department[by_department >= MIN_GROUP_PATRONS].items():
+        report_distinct(f"  department {department}", merged.distinct_patrons(department=department), exact)
+    by_subject = checkouts.groupby('Subject', observed=True)['Card Number'].nunique()
+    for subject, exact in by_subject[by_subject >= MIN_GROUP_PATRONS].items():
+        report_distinct(f"  subject {subject}", merged.distinct_patrons(subject=subject), exact)
+
+    # Row at a time, as a live feed would arrive
+    sample = df.iloc[:5000]
+    start = time.perf_counter()
+    one_by_one = CirculationSketch()
+    for row in sample.to_dict('records'):
+        one_by_one.add(row)
+    one_by_one.flush()
+    print(f"\n{len(sample):,} rows added one at a time in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sketch.json')
+        merged.save(path)
+        size = os.path.getsize(path)
+    print(f"Saved sketch: {size / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,84 @@
+"""
+Benchmark subject classification on the bundled circulation reports.
+
+Compares the original row-by-row categorize_book with the taxonomy matcher,
+cold, with a warm title cache and after a taxonomy edit.
+
+Run from the repository root:
+    python -m benchmarks.subject_classifier
+"""
+import glob
+import os
+import tempfile
+import time
+import pandas as pd
+from data_utils import DATA_DIR, REPORT_PATTERN
+from subject_taxonomy import SubjectTaxonomy
+
+def legacy_categorize_book(title):
+    """categorize_book as it was before the taxonomy file, rebuilding its table on every call."""
+    if pd.isna(title):
+        return "Unknown"
+
+    title = str(title).lower()
+
+    categories = {
+        "Computer Science & Programming": ['programming', 'python', 'c++', 'java', 'computer', 'data structure',
+                                           'algorithm', 'database', 'software', 'network', 'digital', 'operating system',
+                                           'ai', 'machine learning', 'artificial intelligence'],
+        "Mathematics": ['mathematics', 'calculus', 'algebra', 'linear', 'statistic', 'discrete', 'engineering mathematics',
+                        'laplace', 'differential'],
+        "Engineering": ['engineering', 'mechanical', 'electrical', 'civil', 'electronic', 'circuit', 'machine element',
+                        'manufacturing', 'fluid', 'thermodynamics', 'cad', 'cam', 'control system', 'hydraulic', 'drawing'],
+        "Physics": ['physics', 'optics', 'semiconductor', 'mechanics'],
+        "Chemistry": ['chemistry', 'organic', 'engineering chemistry'],
+        "Biology & Biotechnology": ['biology', 'biotechnology', 'microbiology', 'biochemistry', 'immunology'],
+        "Management & Business": ['management', 'business', 'analytics', 'entrepreneurship', 'economics', 'project management',
+                                  'marketing', 'sales'],
+        "Constitution & Ethics": ['constitution', 'ethics', 'human rights', 'professional ethics'],
+        "Design & Architecture": ['design', 'architecture', 'drawing', 'planning', 'town planning', 'urban', 'buildings'],
+        "Communication Skills": ['communication', 'language', 'english', 'kannada', 'kali']
+    }
+
+    for category, keywords in categories.items():
+        if any(keyword in title for keyword in keywords):
+            return category
+
+    return "Other"
+
+def timed(label, func, n_titles):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed * 1000:>9.1f} ms {n_titles / elapsed:>14,.0f} titles/s")
+    return result
+
+def run_benchmark():
+    titles = pd.concat([pd.read_csv(path, usecols=['Title'])['Title']
+                        for path in sorted(glob.glob(os.path.join(DATA_DIR, REPORT_PATTERN)))],
+                       ignore_index=True)
+    n_titles = len(titles)
+    print(f"{n_titles:,} titles, {titles.nunique():,} distinct\n")
+
+    taxonomy = SubjectTaxonomy.load()
+
+    # Same taxonomy with one extra keyword on the last subject
+    edited = SubjectTaxonomy(taxonomy.subjects[:-1] +
+                             [(taxonomy.subjects[-1][0], taxonomy.subjects[-1][1] + ['grammar'])],
+                             taxonomy.version)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        legacy = timed("legacy apply(categorize_book)", lambda: titles.apply(legacy_categorize_book), n_titles)
+        cold = timed("taxonomy, no cache", lambda: taxonomy.classify(titles), n_titles)
+        timed("taxonomy, filling cache", lambda: taxonomy.classify(titles, cache_dir), n_titles)
+        warm = timed("taxonomy, warm cache", lambda: taxonomy.classify(titles, cache_dir), n_titles)
+        after_edit = timed("edited taxonomy, incremental", lambda: edited.classify(titles, cache_dir), n_titles)
+
+    assert (cold.astype(object) == legacy).all(), "taxonomy matcher disagrees with categorize_book"
+    assert (warm.astype(object) == legacy).all(), "cached subjects disagree with categorize_book"
+    assert (after_edit.astype(object) == edited.classify(titles).astype(object)).all(), \
+        "incremental reclassification disagrees with a full run"
+    print("\nAll results match.")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,206 @@
+"""
+Generate synthetic circulation reports for benchmarks.
+
+Reports have the schema of the bundled exports and distributions measured
+on them: the department and UG/PG/ST category mix, the transaction mix,
+hour-of-day and day-of-week peaks, and Zipf-like repetition of titles and
+patrons. Titles are drawn from the bundled reports (or the subject taxonomy
+keywords without them), with numbered volumes added as the row count grows,
+so subject classification sees realistic titles. Rows are independent draws:
+check-ins are not paired with earlier checkouts.
+
+Run from the repository root:
+    python -m benchmarks.synthetic_data --rows 1000000 --output synthetic
+"""
+import os
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+from paths import DATA_DIR, REPORT_PATTERN
+from subject_taxonomy import SubjectTaxonomy
+
+# Header of the bundled exports; data_utils maps the aliases
+REPORT_HEADER = ['Date', 'card_number', 'full_name', 'Department', 'Category', 'Transaction', 'Amount',
+                 'Barcode', 'Title', 'Author', 'homebranch', 'holdingbranch']
+
+# Shares measured on the bundled 2023-2024 reports
+TRANSACTION_MIX = {'Check in': 0.373, 'Check out': 0.354, 'Renew': 0.198, 'Other': 0.075}
+CATEGORY_MIX = {'UG': 0.445, 'ST': 0.388, 'PG': 0.112, 'TS': 0.045, 'NT': 0.005, 'PHD': 0.005}
+HOUR_MIX = {8: 0.005, 9: 0.046, 10: 0.113, 11: 0.143, 12: 0.204, 13: 0.123, 14: 0.109, 15: 0.128,
+            16: 0.093, 17: 0.022, 18: 0.007, 19: 0.003, 20: 0.003}
+WEEKDAY_MIX = [0.196, 0.172, 0.173, 0.164, 0.177, 0.116, 0.003]
+
+# Undergraduates borrow under one catch-all department; everyone else under their own
+UG_DEPARTMENT = 'UNDER GRADUATION(UG)'
+DEPARTMENT_MIX = {'CSE': 0.076, 'BT': 0.045, 'MCA': 0.044, 'ME': 0.035, 'CV': 0.032, 'ECE': 0.032,
+                  'CHEM': 0.030, 'CSE_AIML': 0.029, 'CSE_CY': 0.025, 'MBA': 0.024, 'ISE': 0.023,
+                  'EEE': 0.015, 'AE': 0.015, 'IEM': 0.015, 'MATHS': 0.012, 'PHY': 0.012, 'AIDS': 0.012,
+                  'EIE': 0.010, 'TCE': 0.010, 'AI': 0.008}
+
+# Distinct titles grow with the row count about as in the bundled data (4k titles in 105k rows)
+TITLE_EXPONENT = 0.72
+
+# Popularity of the k-th title and the k-th patron falls as 1 / k**exponent
+TITLE_ZIPF = 0.75
+PATRON_ZIPF = 0.5
+
+# Transactions per patron, and item copies per title
+ROWS_PER_PATRON = 8
+COPIES_PER_TITLE = 4
+
+# Rows generated and written at a time
+CHUNK_ROWS = 500_000
+
+def _shares(mix):
+    weights = np.asarray(list(mix.values()), dtype=float)
+    return list(mix), weights / weights.sum()
+
+def _zipf_weights(n, exponent, rng):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+def _random_codes(rng, n, length=6, alphabet='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'):
+    letters = np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)
+    codes = letters[rng.integers(0, len(letters), size=(n, length))]
+    return codes.view(f'S{length}').ravel().astype(str)
+
+def base_titles(data_dir=DATA_DIR):
+    """Distinct titles of the bundled reports, or the taxonomy keywords if there are none."""
+    paths = sorted(glob.glob(os.path.join(data_dir, REPORT_PATTERN)))
+    if paths:
+        titles = pd.concat([pd.read_csv(path, usecols=['Title'])['Title'] for path in paths])
+        return sorted(titles.dropna().str.upper().unique())
+    taxonomy = SubjectTaxonomy.load()
+    return [f"{keyword.upper()} FUNDAMENTALS" for _, keywords in taxonomy.subjects for keyword in keywords]
+
+class SyntheticReport:
+    """
+    Catalogue, patrons and calendar of one synthetic report.
+
+    Titles and patrons are drawn once for the whole report, so chunks
+    generated from it share them as the rows of a real export would.
+    """
+
+    def __init__(self, n_rows, start='2024-01-01', end='2024-07-01', seed=0, titles=None):
+        """
+        Args:
+            n_rows: Number of transactions
+            start, end: [start, end) period of the report
+            seed: Seed of the random generator
+            titles: Base titles, by default base_titles()
+        """
+        self.n_rows = n_rows
+        self.start, self.end = pd.Timestamp(start), pd.Timestamp(end)
+        self.rng = np.random.default_rng(seed)
+        rng = self.rng
+
+        # Catalogue: base titles, then numbered volumes of them
+        base = np.asarray(titles if titles is not None else base_titles(), dtype=object)
+        n_titles = max(len(base), int(n_rows ** TITLE_EXPONENT))
+        volumes = np.arange(n_titles) // len(base)
+        self.titles = np.where(volumes == 0, base[np.arange(n_titles) % len(base)],
+                               base[np.arange(n_titles) % len(base)] + ' VOL ' + (volumes + 1).astype(str))
+        self.title_weights = _zipf_weights(n_titles, TITLE_ZIPF, rng)
+        self.authors = np.where(rng.random(n_titles) < 0.3, None, _random_codes(rng, n_titles, 8, 'ABCDEFGHIJKLMNOPRSTUVY'))
+
+        # Patrons: card, name, category and department
+        n_patrons = max(50, n_rows // ROWS_PER_PATRON)
+        self.cards = _random_codes(rng, n_patrons)
+        self.names = _random_codes(rng, n_patrons, 6, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+        categories, category_shares = _shares(CATEGORY_MIX)
+        self.categories = np.asarray(categories)[rng.choice(len(categories), n_patrons, p=category_shares)]
+        departments, department_shares = _shares(DEPARTMENT_MIX)
+        self.departments = np.where(self.categories == 'UG', UG_DEPARTMENT,
+                                    np.asarray(departments)[rng.choice(len(departments), n_patrons, p=department_shares)])
+        self.patron_weights = _zipf_weights(n_patrons, PATRON_ZIPF, rng)
+
+        # Calendar: rows per day, weighted by day of week
+        self.days = pd.date_range(self.start, self.end, freq='D', inclusive='left')
+        day_weights = np.asarray(WEEKDAY_MIX)[self.days.dayofweek]
+        self.rows_per_day = rng.multinomial(n_rows, day_weights / day_weights.sum())
+
+    def chunks(self, chunk_rows=CHUNK_ROWS):
+        """Yield the report as date-sorted frames of about chunk_rows rows, whole days each."""
+        ends = np.cumsum(self.rows_per_day)
+        first_day = 0
+        while first_day < len(self.days):
+            rows_before = ends[first_day] - self.rows_per_day[first_day]
+            last_day = min(int(np.searchsorted(ends, rows_before + chunk_rows)) + 1, len(self.days))
+            yield self._rows(first_day, last_day)
+            first_day = last_day
+
+    def _rows(self, first_day, last_day):
+        rng = self.rng
+        counts = self.rows_per_day[first_day:last_day]
+        n = int(counts.sum())
+
+        # Timestamps: the day, then an hour from the opening-hours profile and a random minute and second
+        hours, hour_shares = _shares(HOUR_MIX)
+        day_start = self.days[first_day:last_day].to_numpy().astype('datetime64[s]').astype(np.int64)
+        seconds = (np.repeat(day_start, counts)
+                   + np.asarray(hours)[rng.choice(len(hours), n, p=hour_shares)] * 3600
+                   + rng.integers(0, 3600, n))
+        seconds.sort()
+
+        transactions, transaction_shares = _shares(TRANSACTION_MIX)
+        transaction = np.asarray(transactions)[rng.choice(len(transactions), n, p=transaction_shares)]
+        loan = transaction != 'Other'
+
+        patron = rng.choice(len(self.cards), n, p=self.patron_weights)
+        title = rng.choice(len(self.titles), n, p=self.title_weights)
+        barcode = 100000 + title * COPIES_PER_TITLE + rng.integers(0, COPIES_PER_TITLE, n)
+
+        # Fines and payments carry an amount and no item
+        amount = np.where(rng.random(n) < 0.5, 25, -rng.integers(1, 60, n)).astype(float)
+
+        return pd.DataFrame({
+            'Date': pd.to_datetime(seconds, unit='s'),
+            'card_number': self.cards[patron],
+            'full_name': self.names[patron],
+            'Department': self.departments[patron],
+            'Category': self.categories[patron],
+            'Transaction': transaction,
+            'Amount': np.where(loan, np.nan, amount),
+            'Barcode': pd.Series(barcode, dtype='Int64').where(loan),
+            'Title': np.where(loan, self.titles[title], None),
+            'Author': np.where(loan, self.authors[title], None),
+            'homebranch': 'RIT',
+            'holdingbranch': 'RIT',
+        }, columns=REPORT_HEADER)
+
+def report_file_name(n_rows, start, end, seed=0):
+    """File name matching REPORT_PATTERN with the period data_utils.report_period reads."""
+    last_month = pd.Timestamp(end) - pd.Timedelta(days=1)
+    return (f"Daily Circulation Report-synthetic_{n_rows}_seed{seed}"
+            f"_{pd.Timestamp(start):%b %Y}_{last_month:%b %Y}.csv")
+
+def write_report(directory, n_rows, start='2024-01-01', end='2024-07-01', seed=0, titles=None):
+    """
+    Write a synthetic report as CSV, unless it already exists.
+
+    Returns:
+        path: The report file
+    """
+    path = os.path.join(directory, report_file_name(n_rows, start, end, seed))
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    report = SyntheticReport(n_rows, start, end, seed, titles)
+    for position, chunk in enumerate(report.chunks()):
+        chunk.to_csv(tmp_path, mode='w' if position == 0 else 'a', header=position == 0,
+                     index=False, date_format='%Y-%m-%d %H:%M:%S')
+    os.replace(tmp_path, path)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic circulation report")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--end', default='2024-07-01', help="First day after the report")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='synthetic', help="Directory to write the report to")
+    args = parser.parse_args()
+    print(write_report(args.output, args.rows, args.start, args.end, args.seed))
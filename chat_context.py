@@ -0,0 +1,131 @@
+import os
+import json
+import store
+from paths import CACHE_DIR
+
+# Last data summary, kept on disk so a fresh worker doesn't rebuild it
+CONTEXT_CACHE_FILE = os.path.join(CACHE_DIR, 'chat_context.json')
+
+# Rough size of a token for budgeting, in characters
+CHARS_PER_TOKEN = 4
+
+# Token budgets of what is sent with each chat request
+HISTORY_TOKEN_BUDGET = 1500
+SUMMARY_TOKEN_BUDGET = 200
+
+# How many entries each section of the data summary lists
+TOP_N = 5
+
+def estimate_tokens(content):
+    """Estimate the tokens of a message content, text or a list of parts."""
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return len(content) // CHARS_PER_TOKEN + 1
+
+def build_data_context(db, csv_columns, csv_rows):
+    """
+    Summarize the loaded data for the model's system message.
+
+    The summary holds the columns and size of every CSV and, from the
+    circulation store, the top subjects, busiest hours and the subject each
+    of the busiest departments borrows most.
+
+    Args:
+        db: Circulation store connection, or None if it isn't loaded
+        csv_columns: Dict of CSV file name to its column names
+        csv_rows: Dict of CSV file name to its number of records
+
+    Returns:
+        context: Plain text summary
+    """
+    lines = ["Loaded data files:"]
+    for filename in sorted(csv_columns):
+        lines.append(f"- {filename}: {csv_rows.get(filename, 0)} records, columns: {', '.join(map(str, csv_columns[filename]))}")
+
+    if db is None:
+        return '\n'.join(lines)
+
+    transactions = store.group_counts(db, 'Transaction')
+    if transactions.empty:
+        return '\n'.join(lines)
+
+    lines.append(f"\nCirculation records: {int(transactions['count'].sum())} "
+                 f"({', '.join(f'{t}: {c}' for t, c in zip(transactions['Transaction'], transactions['count']))})")
+
+    span = db.execute("SELECT MIN(date), MAX(date) FROM circulation").fetchone()
+    lines.append(f"Period: {span[0]} to {span[1]}")
+
+    subjects = store.group_counts(db, 'Subject', transaction='Check out', limit=TOP_N)
+    lines.append("\nMost borrowed subjects (checkouts):")
+    lines.extend(f"- {subject}: {count}" for subject, count in zip(subjects['Subject'], subjects['count']))
+
+    hours = store.group_counts(db, 'Hour', transaction='Check out', limit=TOP_N)
+    lines.append("\nBusiest checkout hours:")
+    lines.extend(f"- {hour}:00: {count}" for hour, count in zip(hours['Hour'], hours['count']))
+
+    # Rows come largest first, so the first row of a department is its favourite subject
+    dept_subjects = store.group_counts(db, ['Department', 'Subject'], transaction='Check out')
+    dept_totals = dept_subjects.groupby('Department', sort=False)['count'].sum().nlargest(TOP_N)
+    leaders = dept_subjects.drop_duplicates('Department').set_index('Department')
+    lines.append("\nMost active departments and their top subject:")
+    for dept, total in dept_totals.items():
+        lines.append(f"- {dept}: {total} checkouts, mostly {leaders.loc[dept, 'Subject']}")
+
+    return '\n'.join(lines)
+
+def read_cached_context(signature, path=CONTEXT_CACHE_FILE):
+    """Return the summary saved for this signature of the data files, or None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            doc = json.load(f)
+    except ValueError:
+        return None
+    if doc.get('signature') != json.loads(json.dumps(signature)):
+        return None
+    return doc['context']
+
+def write_cached_context(signature, context, path=CONTEXT_CACHE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'context': context}, f)
+    os.replace(tmp_path, path)
+
+def window_messages(messages, budget=HISTORY_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+    """
+    Keep the latest messages that fit in a token budget.
+
+    Older messages are replaced by one short note listing what the user
+    asked, so the model keeps the thread of the conversation without the
+    full turns. The latest message is always kept.
+
+    Returns:
+        windowed: Messages to send, oldest first
+    """
+    kept, used = [], 0
+    for message in reversed(messages):
+        tokens = estimate_tokens(message['content'])
+        if kept and used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+
+    dropped = messages[:len(messages) - len(kept)]
+    if not dropped:
+        return kept
+
+    questions = [message['content'] for message in dropped
+                 if message['role'] == 'user' and isinstance(message['content'], str)]
+    summary = f"Summary of {len(dropped)} earlier messages. The user asked about: "
+    # The most recent questions are the most relevant ones to keep
+    recent, used = [], estimate_tokens(summary)
+    for question in reversed(questions):
+        question = ' '.join(question.split())[:120]
+        used += estimate_tokens(question)
+        if used > summary_budget:
+            break
+        recent.insert(0, question)
+    return [{"role": "system", "content": summary + '; '.join(recent)}] + kept
@@ -1,69 +1,143 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-from collections import Counter, defaultdict
-from sklearn.cluster import KMeans
-from data_utils import load_and_prepare_data
+from collections import namedtuple
+from itertools import combinations
+from scipy import sparse
+from data_utils import AnalysisContext
+from plotting import plot_spec, render_all
 
-# Create directories for plots
-os.makedirs('plots/community_engagement', exist_ok=True)
+PatronSubjectMatrix = namedtuple('PatronSubjectMatrix', ['counts', 'first_seen', 'patron_ids', 'subject_names'])
 
-# Load data
-df, checkouts = load_and_prepare_data()
+def patron_subject_matrix(checkouts):
+    """
+    Build sparse patron x subject matrices from the checkouts.
+
+    Patrons and subjects are numbered in order of first appearance in
+    checkouts; checkouts without a card number are ignored.
+
+    Args:
+        checkouts: Checkout transactions with a Subject column
+
+    Returns:
+        PatronSubjectMatrix: CSR matrix of checkout counts, CSR matrix of the
+        1-based row position of each patron's first checkout of each subject,
+        and the labels of the rows and columns
+    """
+    # Patron ID is in 2nd column
+    patrons, patron_ids = pd.factorize(checkouts.iloc[:, 1])
+    subjects, subject_names = pd.factorize(checkouts['Subject'])
+    shape = (len(patron_ids), len(subject_names))
+
+    known = patrons >= 0
+    positions = np.flatnonzero(known)
+    patrons, subjects = patrons[known], subjects[known]
+    counts = sparse.csr_matrix((np.ones(len(patrons), dtype=np.int64), (patrons, subjects)), shape=shape)
+
+    # Keep only the first checkout of each (patron, subject)
+    first = pd.DataFrame({'patron': patrons, 'subject': subjects}).drop_duplicates()
+    first_seen = sparse.csr_matrix((positions[first.index] + 1, (first['patron'], first['subject'])), shape=shape)
+
+    return PatronSubjectMatrix(counts, first_seen, list(patron_ids), list(subject_names))
+
+def subject_cooccurrence(matrix):
+    """
+    Count the patrons who borrowed each pair of subjects with one X^T X product.
+
+    Returns:
+        C: Dense subjects x subjects array; C[a, b] is the number of patrons
+        who borrowed both a and b and C[a, a] the number who borrowed a
+    """
+    X = (matrix.counts > 0).astype(np.int64)
+    return (X.T @ X).toarray()
+
+def subject_associations(matrix):
+    """
+    Score every subject pair by co-occurrence, support, lift, Jaccard and PMI.
+
+    Probabilities are over patrons with at least one checkout.
+
+    Returns:
+        scores: DataFrame with one row per pair of subjects
+    """
+    C = subject_cooccurrence(matrix)
+    n_patrons = (matrix.counts.getnnz(axis=1) > 0).sum()
+    a, b = np.triu_indices(len(matrix.subject_names), k=1)
+
+    together = C[a, b]
+    count_a, count_b = C[a, a], C[b, b]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lift = together * n_patrons / (count_a * count_b)
+        jaccard = together / (count_a + count_b - together)
+        pmi = np.log2(lift)
+
+    return pd.DataFrame({
+        'subject_a': [matrix.subject_names[i] for i in a],
+        'subject_b': [matrix.subject_names[i] for i in b],
+        'patrons': together,
+        'support': together / n_patrons,
+        'lift': lift,
+        'jaccard': jaccard,
+        'pmi': pmi,
+    })
+
+def top_subject_combinations(matrix, k=2, top_n=10):
+    """
+    Find the subject combinations borrowed by the most patrons.
+
+    Pairs come from subject_cooccurrence. Larger combinations count the
+    patrons whose row covers every subject in the combination. Ties are
+    ordered as if patrons, and each patron's subjects, were visited in order
+    of first appearance, as the old per-patron loop did.
+
+    Args:
+        matrix: PatronSubjectMatrix from patron_subject_matrix
+        k: Number of subjects in a combination
+        top_n: Number of combinations to return
+
+    Returns:
+        combinations: List of (sorted subject name tuple, patron count)
+    """
+    X = (matrix.counts > 0).astype(np.int64).tocsc()
+    first_seen = matrix.first_seen.tocsr()
+    n_subjects = len(matrix.subject_names)
+
+    if k == 2:
+        C = subject_cooccurrence(matrix)
+        a, b = np.triu_indices(n_subjects, k=1)
+        candidates = [((i, j), int(C[i, j])) for i, j in zip(a.tolist(), b.tolist()) if C[i, j] > 0]
+    else:
+        candidates = []
+        for combo in combinations(range(n_subjects), k):
+            count = int((X[:, list(combo)].sum(axis=1) == k).sum())
+            if count > 0:
+                candidates.append((combo, count))
+
+    def first_occurrence(combo):
+        # First patron who borrowed every subject, then the order that patron first borrowed them in
+        patrons = X[:, combo[0]].indices
+        for subject in combo[1:]:
+            patrons = np.intersect1d(patrons, X[:, subject].indices, assume_unique=True)
+        first_patron = patrons.min()
+        return (first_patron, *sorted(first_seen[first_patron, subject] for subject in combo))
+
+    ranked = sorted(candidates, key=lambda candidate: (-candidate[1], first_occurrence(candidate[0])))[:top_n]
+    return [(tuple(sorted(matrix.subject_names[i] for i in combo)), count) for combo, count in ranked]
+
+def analyze_community_engagement(ctx):
+    df, checkouts = ctx.df, ctx.checkouts
 
-def analyze_community_engagement():
     # Identify optimal event times
-    df['Hour'] = df['Date'].dt.hour
-    df['Day'] = df['Date'].dt.day_name()
-    
     # Peak activity times
-    activity_by_hour_day = df.groupby(['Day', 'Hour']).size().unstack().fillna(0)
+    activity_by_hour_day = df.groupby(['Day', 'Hour'], observed=True).size().unstack().fillna(0)
     day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     activity_by_hour_day = activity_by_hour_day.reindex(day_order)
     
-    plt.figure(figsize=(14, 8))
-    sns.heatmap(activity_by_hour_day, cmap='viridis', annot=True, fmt='g')
-    plt.title('Best Times for Community Events (Based on Library Activity)')
-    plt.tight_layout()
-    plt.savefig('plots/community_engagement/optimal_event_times.png', dpi=300)
-    plt.close()
-    
     # Identify potential book club topics based on popular subject combinations
-    # Create a patron-subject matrix
-    patron_subjects = defaultdict(Counter)
-    
-    for _, row in checkouts.iterrows():
-        patron_id = row.iloc[1]  # Patron ID is in 2nd column
-        subject = row['Subject']
-        patron_subjects[patron_id][subject] += 1
+    # Create a sparse patron-subject matrix
+    matrix = patron_subject_matrix(checkouts)
     
     # Find subjects that are frequently borrowed together
-    subject_combinations = Counter()
-    
-    for patron, subjects in patron_subjects.items():
-        subject_list = list(subjects.keys())
-        if len(subject_list) >= 2:
-            for i in range(len(subject_list)):
-                for j in range(i+1, len(subject_list)):
-                    # Sort to ensure consistent ordering
-                    combination = tuple(sorted([subject_list[i], subject_list[j]]))
-                    subject_combinations[combination] += 1
-    
-    # Plot top subject combinations
-    top_combinations = subject_combinations.most_common(10)
-    combination_labels = [' & '.join(combo) for combo, _ in top_combinations]
-    combination_counts = [count for _, count in top_combinations]
-    
-    plt.figure(figsize=(14, 8))
-    plt.barh(combination_labels, combination_counts, color='orange')
-    plt.xlabel('Frequency')
-    plt.ylabel('Subject Combination')
-    plt.title('Potential Book Club Topics (Popular Subject Combinations)')
-    plt.tight_layout()
-    plt.savefig('plots/community_engagement/book_club_topics.png', dpi=300)
-    plt.close()
+    top_combinations = top_subject_combinations(matrix, k=2, top_n=10)
     
     # Identify underserved subjects (low activity relative to collection size)
     # This would need collection size data, but we can approximate with a random distribution
@@ -80,19 +154,25 @@ def analyze_community_engagement():
     # Calculate ratio of actual to expected
     utilization_ratio = subject_checkouts / expected_checkouts
     
-    plt.figure(figsize=(14, 8))
-    utilization_ratio.sort_values().plot(kind='bar', color='lightblue')
-    plt.axhline(y=1, color='red', linestyle='--')
-    plt.title('Subject Utilization Ratio (Actual vs. Expected Checkouts)')
-    plt.xlabel('Subject')
-    plt.ylabel('Utilization Ratio')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.savefig('plots/community_engagement/subject_utilization.png', dpi=300)
-    plt.close()
-    
     return activity_by_hour_day, top_combinations, utilization_ratio
 
+def community_engagement_plots(activity_by_hour_day, top_combinations, utilization_ratio):
+    """Plot specs for the results of analyze_community_engagement"""
+    combination_counts = pd.Series([count for _, count in top_combinations],
+                                   index=[' & '.join(combo) for combo, _ in top_combinations])
+    
+    return [
+        plot_spec('plots/community_engagement/optimal_event_times.png', 'heatmap', activity_by_hour_day,
+                  'Best Times for Community Events (Based on Library Activity)', cmap='viridis', fmt='g'),
+        plot_spec('plots/community_engagement/book_club_topics.png', 'barh', combination_counts,
+                  'Potential Book Club Topics (Popular Subject Combinations)', 'Frequency', 'Subject Combination',
+                  color='orange'),
+        plot_spec('plots/community_engagement/subject_utilization.png', 'bar', utilization_ratio.sort_values(),
+                  'Subject Utilization Ratio (Actual vs. Expected Checkouts)', 'Subject', 'Utilization Ratio',
+                  color='lightblue', axhline=1, rotation=45, ha='right'),
+    ]
+
 if __name__ == "__main__":
-    activity_by_hour_day, top_combinations, utilization_ratio = analyze_community_engagement()
+    activity_by_hour_day, top_combinations, utilization_ratio = analyze_community_engagement(AnalysisContext.load())
+    render_all(community_engagement_plots(activity_by_hour_day, top_combinations, utilization_ratio))
     print("Community engagement analysis complete. Plots saved to plots/community_engagement/")
\ No newline at end of file
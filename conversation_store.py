@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Sessions kept at once; the least recently used are dropped beyond this
+MAX_SESSIONS = 1000
+
+# Seconds of inactivity after which a session is dropped
+SESSION_TTL = 24 * 3600
+
+# Seconds between evictions of idle sessions from the SQLite store
+EVICT_INTERVAL = 60
+
+# Latest messages kept per session; older ones are dropped
+MAX_MESSAGES = 40
+
+# Longest message content kept, in characters
+MAX_MESSAGE_CHARS = 8000
+
+def _cap_message(message):
+    """Truncate long text content; image parts are replaced by a note once stored."""
+    content = message['content']
+    if isinstance(content, str):
+        if len(content) > MAX_MESSAGE_CHARS:
+            content = content[:MAX_MESSAGE_CHARS] + ' [truncated]'
+    elif isinstance(content, list):
+        content = [part if part.get('type') == 'text' else {'type': 'text', 'text': f"[{part.get('type')} omitted]"}
+                   for part in content]
+    return {**message, 'content': content}
+
+class MemoryConversationStore:
+    """
+    Conversations by session id, kept in this process.
+
+    Bounded by MAX_SESSIONS sessions of at most MAX_MESSAGES messages;
+    sessions idle for longer than the TTL are dropped. Safe to share between
+    threads, but each worker process has its own.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, max_messages=MAX_MESSAGES):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.lock = threading.Lock()
+        # Session id -> (last used, messages), least recently used first
+        self.sessions = OrderedDict()
+
+    def _evict(self, now):
+        while self.sessions:
+            session_id, (last_used, _) = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and now - last_used <= self.ttl:
+                break
+            del self.sessions[session_id]
+
+    def get(self, session_id):
+        """Return a copy of a session's messages, oldest first."""
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            if session_id not in self.sessions:
+                return []
+            _, messages = self.sessions.pop(session_id)
+            self.sessions[session_id] = (now, messages)
+            return list(messages)
+
+    def append(self, session_id, *messages):
+        now = time.time()
+        with self.lock:
+            # Evict first, so an expired session starts over instead of coming back
+            self._evict(now)
+            _, stored = self.sessions.pop(session_id, (now, []))
+            stored = (stored + [_cap_message(message) for message in messages])[-self.max_messages:]
+            self.sessions[session_id] = (now, stored)
+            self._evict(now)
+
+    def reset(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self.sessions)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+"""
+
+class SQLiteConversationStore:
+    """
+    Conversations by session id in a SQLite file, shared by worker processes.
+
+    Has the same bounds as MemoryConversationStore, enforced every
+    EVICT_INTERVAL seconds rather than on every write; expired sessions are
+    never returned in between. Each thread uses its own connection and the
+    database runs in WAL mode, so several workers can read and write it at
+    once.
+    """
+
+    def __init__(self, path, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, max_messages=MAX_MESSAGES):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.local = threading.local()
+        self.next_eviction = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self.local.conn = conn
+        return conn
+
+    def _evict(self, conn, now):
+        """Drop sessions idle past the TTL or beyond max_sessions, found through the last_used index."""
+        cutoff, operator = now - self.ttl, '<'
+        # Last used time of the newest session over the limit
+        row = conn.execute("SELECT last_used FROM sessions ORDER BY last_used DESC LIMIT 1 OFFSET ?",
+                           (self.max_sessions,)).fetchone()
+        if row is not None and row[0] >= cutoff:
+            cutoff, operator = row[0], '<='
+        conn.execute(f"""DELETE FROM messages WHERE session_id IN (
+                             SELECT session_id FROM sessions WHERE last_used {operator} ?)""", (cutoff,))
+        conn.execute(f"DELETE FROM sessions WHERE last_used {operator} ?", (cutoff,))
+
+    def get(self, session_id):
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute("UPDATE sessions SET last_used = ? WHERE session_id = ? AND last_used >= ?",
+                                   (now, session_id, now - self.ttl)).rowcount
+            if not updated:
+                return []
+            rows = conn.execute("SELECT message FROM messages WHERE session_id = ? ORDER BY id", (session_id,))
+            return [json.loads(message) for message, in rows]
+
+    def append(self, session_id, *messages):
+        now = time.time()
+        with self._connect() as conn:
+            # A session past its TTL starts over instead of coming back
+            conn.execute("DELETE FROM messages WHERE session_id IN ("
+                         "SELECT session_id FROM sessions WHERE session_id = ? AND last_used < ?)",
+                         (session_id, now - self.ttl))
+            conn.execute("INSERT INTO sessions (session_id, last_used) VALUES (?, ?) "
+                         "ON CONFLICT (session_id) DO UPDATE SET last_used = excluded.last_used", (session_id, now))
+            conn.executemany("INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                             [(session_id, json.dumps(_cap_message(message))) for message in messages])
+            conn.execute("""DELETE FROM messages WHERE session_id = ? AND id NOT IN (
+                                SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)""",
+                         (session_id, session_id, self.max_messages))
+            if now >= self.next_eviction:
+                self.next_eviction = now + EVICT_INTERVAL
+                self._evict(conn, now)
+
+    def reset(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+def open_store(spec):
+    """
+    Open a conversation store from a spec string.
+
+    Args:
+        spec: 'memory' or 'sqlite:<path>'
+    """
+    if spec == 'memory':
+        return MemoryConversationStore()
+    if spec.startswith('sqlite:'):
+        return SQLiteConversationStore(spec[len('sqlite:'):])
+    raise ValueError(f"Unknown conversation store '{spec}', expected 'memory' or 'sqlite:<path>'")
@@ -48,4 +48,164 @@ document.addEventListener('DOMContentLoaded', () => {
     exportButton.addEventListener('click', () => {
         window.print();
     });
-});
\ No newline at end of file
+
+    loadChartData();
+});
+
+// Series colours of the line chart
+const PALETTE = ['#1a5276', '#e67e22', '#27ae60', '#8e44ad', '#e74c3c', '#16a085',
+                 '#f39c12', '#2c3e50', '#d35400', '#7f8c8d', '#2980b9', '#c0392b'];
+
+const SVG_NS = 'http://www.w3.org/2000/svg';
+
+// Draw charts from the data files written by dashboard_data.py. The
+// pre-rendered figures of these containers are only named in data-src, so
+// they are downloaded only when the data can't be loaded, e.g. when the
+// page is opened from disk.
+async function loadChartData() {
+    const containers = document.querySelectorAll('.chart-container[data-dataset]');
+    if (!containers.length) return;
+
+    let index;
+    try {
+        // The index is small and revalidated; the files it names never change
+        const response = await fetch('data/index.json', { cache: 'no-cache' });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        index = await response.json();
+    } catch (error) {
+        containers.forEach(showFigure);
+        return;
+    }
+
+    containers.forEach(async container => {
+        const entry = index.datasets[container.dataset.dataset];
+        const draw = CHARTS[container.dataset.chart];
+        try {
+            if (!entry || !draw) throw new Error('no data file or chart type');
+            const response = await fetch(`data/${entry.file}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const chart = draw(await response.json(), container.dataset);
+            container.replaceChildren(chart);
+            container.classList.add('client-chart');
+        } catch (error) {
+            console.warn(`Showing the figure for ${container.dataset.dataset}:`, error);
+            showFigure(container);
+        }
+    });
+}
+
+function showFigure(container) {
+    container.querySelectorAll('img[data-src]').forEach(img => {
+        img.src = img.dataset.src;
+    });
+}
+
+function element(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+}
+
+function svgElement(tag, attributes) {
+    const node = document.createElementNS(SVG_NS, tag);
+    Object.entries(attributes).forEach(([name, value]) => node.setAttribute(name, value));
+    return node;
+}
+
+function formatCount(value) {
+    return Number.isInteger(value) ? value.toLocaleString() : value.toFixed(1);
+}
+
+// Table of cells shaded by value; with data-rows only the busiest rows are shown
+function drawHeatmap(data, options) {
+    let rows = data.index.map((label, i) => ({ label, values: data.data[i].map(v => v || 0) }));
+    if (options.rows) {
+        const total = row => row.values.reduce((a, b) => a + b, 0);
+        rows = rows.sort((a, b) => total(b) - total(a)).slice(0, Number(options.rows));
+    }
+    const max = Math.max(1, ...rows.flatMap(row => row.values));
+
+    const table = element('table', 'heatmap');
+    const header = table.createTHead().insertRow();
+    header.appendChild(element('th'));
+    data.columns.forEach(column => header.appendChild(element('th', '', column)));
+
+    const body = table.createTBody();
+    rows.forEach(row => {
+        const tr = body.insertRow();
+        tr.appendChild(element('th', '', row.label));
+        row.values.forEach((value, i) => {
+            const cell = element('td', '', value ? formatCount(value) : '');
+            const share = value / max;
+            cell.style.backgroundColor = `rgba(26, 82, 118, ${share.toFixed(3)})`;
+            cell.style.color = share > 0.5 ? 'white' : 'inherit';
+            cell.title = `${row.label} / ${data.columns[i]}: ${formatCount(value)}`;
+            tr.appendChild(cell);
+        });
+    });
+
+    const wrapper = element('div', 'heatmap-wrapper');
+    wrapper.appendChild(table);
+    return wrapper;
+}
+
+// One line per column over the index, with a legend
+function drawLine(data) {
+    const width = 640, height = 300, left = 50, right = 10, top = 10, bottom = 30;
+    const max = Math.max(1, ...data.data.flat().map(v => v || 0));
+    const x = i => left + (data.index.length > 1 ? i * (width - left - right) / (data.index.length - 1) : 0);
+    const y = v => top + (1 - v / max) * (height - top - bottom);
+
+    const svg = svgElement('svg', { viewBox: `0 0 ${width} ${height}`, class: 'line-chart' });
+    [0, 0.5, 1].forEach(share => {
+        const value = Math.round(max * share);
+        svg.appendChild(svgElement('line', { x1: left, x2: width - right, y1: y(value), y2: y(value), class: 'grid' }));
+        const label = svgElement('text', { x: left - 6, y: y(value) + 4, 'text-anchor': 'end' });
+        label.textContent = value.toLocaleString();
+        svg.appendChild(label);
+    });
+    data.index.forEach((period, i) => {
+        const label = svgElement('text', { x: x(i), y: height - 8, 'text-anchor': 'middle' });
+        label.textContent = period;
+        svg.appendChild(label);
+    });
+
+    const legend = element('ul', 'chart-legend');
+    data.columns.forEach((column, c) => {
+        const colour = PALETTE[c % PALETTE.length];
+        const points = data.index.map((_, i) => `${x(i)},${y(data.data[i][c] || 0)}`).join(' ');
+        const line = svgElement('polyline', { points, fill: 'none', stroke: colour, 'stroke-width': 2 });
+        const title = svgElement('title', {});
+        title.textContent = column;
+        line.appendChild(title);
+        svg.appendChild(line);
+
+        const item = element('li', '', column);
+        item.style.setProperty('--swatch', colour);
+        legend.appendChild(item);
+    });
+
+    const wrapper = element('div', 'line-wrapper');
+    wrapper.append(svg, legend);
+    return wrapper;
+}
+
+// Horizontal bars of subject pairs by the number of patrons who borrowed both
+function drawBars(data) {
+    const max = Math.max(1, ...data.pairs.map(pair => pair.patrons));
+    const list = element('div', 'bar-list');
+    data.pairs.forEach(pair => {
+        const row = element('div', 'bar-row');
+        row.appendChild(element('span', 'bar-label', pair.subjects.join(' & ')));
+        const bar = element('span', 'bar');
+        bar.style.width = `${(100 * pair.patrons / max).toFixed(1)}%`;
+        const track = element('span', 'bar-track');
+        track.appendChild(bar);
+        row.append(track, element('span', 'bar-value', pair.patrons.toLocaleString()));
+        list.appendChild(row);
+    });
+    return list;
+}
+
+const CHARTS = { heatmap: drawHeatmap, line: drawLine, bars: drawBars };
\ No newline at end of file
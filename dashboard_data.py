@@ -0,0 +1,95 @@
+import os
+import glob
+import gzip
+import json
+import pandas as pd
+from result_cache import AGGREGATES_DIR, aggregate_keys, load_aggregates, content_hash
+
+# Data files the dashboard draws its charts from
+DASHBOARD_DATA_DIR = os.path.join('dashboard', 'data')
+INDEX_FILE = 'index.json'
+
+# Bumped when the JSON layout of a dataset changes, so file names change with it
+DATA_FORMAT_VERSION = 1
+
+# Dashboard dataset name -> stored aggregate it is built from
+DATASETS = {
+    'subjects_by_month': 'subjects_by_month',
+    'day_hour': 'day_hour_checkouts',
+    'transitions': 'transition_matrix',
+    'department_interests': 'dept_interests',
+    'subject_pairs': 'top_combinations',
+}
+
+def dataset_json(name, value):
+    """
+    Convert an aggregate to the JSON document the dashboard reads.
+
+    Frames become {'index', 'columns', 'data'} with one list of values per
+    row; month-end dates are shortened to YYYY-MM. Subject pairs become a
+    list of {'subjects', 'patrons'}.
+    """
+    if name == 'subject_pairs':
+        return {'name': name, 'pairs': [{'subjects': list(pair), 'patrons': int(count)} for pair, count in value]}
+
+    frame = value.copy()
+    if isinstance(frame.index, pd.DatetimeIndex):
+        frame.index = frame.index.strftime('%Y-%m')
+    doc = json.loads(frame.to_json(orient='split', default_handler=str))
+    return {'name': name, 'index': doc['index'], 'columns': doc['columns'], 'data': doc['data']}
+
+def build_dashboard_data(aggregates_dir=AGGREGATES_DIR, out_dir=DASHBOARD_DATA_DIR):
+    """
+    Write the dashboard datasets as versioned JSON files, with gzipped copies.
+
+    Each file is named after the content key of its aggregate, so a file
+    never changes once written and can be cached for good; only the small
+    index of current file names has to be revalidated. Datasets whose file
+    already exists are not rebuilt, and files of older versions are removed.
+
+    Args:
+        aggregates_dir: Where main.py saved the aggregates
+        out_dir: Directory the dashboard loads data/ from
+
+    Returns:
+        built: Names of the datasets that were written
+    """
+    keys = aggregate_keys(aggregates_dir)
+    available = {name: aggregate for name, aggregate in DATASETS.items() if aggregate in keys}
+    os.makedirs(out_dir, exist_ok=True)
+
+    index, built = {}, []
+    for name, aggregate in available.items():
+        version = content_hash(keys[aggregate], DATA_FORMAT_VERSION)
+        filename = f"{name}.{version}.json"
+        index[name] = {'file': filename, 'version': version}
+        path = os.path.join(out_dir, filename)
+        if os.path.exists(path) and os.path.exists(path + '.gz'):
+            continue
+
+        value = load_aggregates(aggregates_dir, [aggregate])[aggregate]
+        body = json.dumps(dataset_json(name, value), separators=(',', ':')).encode('utf-8')
+        _write_file(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+        _write_file(path, body)
+        built.append(name)
+
+    _write_file(os.path.join(out_dir, INDEX_FILE),
+                json.dumps({'format': DATA_FORMAT_VERSION, 'datasets': index}, indent=2).encode('utf-8'))
+
+    # Drop files of versions the index no longer points to, only once the new
+    # index is in place so a page never gets an index naming a removed file
+    current = {entry['file'] for entry in index.values()}
+    for path in glob.glob(os.path.join(out_dir, '*.*.json')) + glob.glob(os.path.join(out_dir, '*.*.json.gz')):
+        if os.path.basename(path).removesuffix('.gz') not in current:
+            os.remove(path)
+    return built
+
+def _write_file(path, content):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    built = build_dashboard_data()
+    print(f"{len(built)} of {len(DATASETS)} dashboard datasets rebuilt in {DASHBOARD_DATA_DIR}")
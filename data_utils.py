@@ -1,32 +1,450 @@
+import os
+import re
+import glob
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+from subject_taxonomy import SubjectTaxonomy
+from paths import DATA_DIR, REPORT_PATTERN, CACHE_DIR
+from profiling import stage
 
-def load_and_prepare_data():
+# Default report used by the analysis scripts
+DATA_FILE = 'data/Daily Circulation Report-reportresults_Jan 2024_June 2024.xls - Sheet1.csv'
+
+# Parsed reports are cached as Parquet in CACHE_DIR so warm runs skip CSV parsing;
+# bump the version when parse_report changes so old cache entries are not reused
+CACHE_VERSION = 2
+
+# Column order shared by every report; the modules index some columns by position
+COLUMNS = ['Date', 'Card Number', 'Name', 'Department', 'Category', 'Transaction', 'Amount',
+           'Barcode', 'Title', 'Author', 'homebranch', 'holdingbranch']
+
+# Header spellings used by the different exports
+COLUMN_ALIASES = {
+    'card_number': 'Card Number',
+    'Card_number': 'Card Number',
+    'full_name': 'Name',
+}
+
+# Columns a CSV needs, after the aliases, to be read as a circulation report
+REQUIRED_COLUMNS = ['Date', 'Card Number', 'Department', 'Category', 'Transaction', 'Title']
+
+# Low-cardinality string columns stored as categoricals
+CATEGORICAL_COLUMNS = ['Department', 'Category', 'Transaction']
+
+# Title-to-subject maps are cached here per taxonomy digest
+SUBJECT_CACHE_DIR = os.path.join(CACHE_DIR, 'subjects')
+
+# Subject keywords, compiled once at import
+TAXONOMY = SubjectTaxonomy.load()
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+MONTHS = [month[:3].lower() for month in MONTH_NAMES]
+
+class AnalysisContext:
+    """
+    Circulation data shared by all analyses.
+
+    main.run_all_analyses loads it once and passes it to every analyze_*
+    function. The derived columns are computed when the data is loaded and the
+    frames are shared between modules, so analyses must treat them as read-only.
+    """
+
+    def __init__(self, df, checkouts):
+        self.df = df
+        self.checkouts = checkouts
+
+    @classmethod
+    def load(cls, file_path=DATA_FILE, all_reports=False, start=None, end=None, use_cache=True, compact=False):
+        """
+        Load the circulation data into a new context.
+
+        Args:
+            file_path: Report to load when all_reports is False
+            all_reports: Combine every report in DATA_DIR with load_all_reports
+            start, end: Optional [start, end) date range for all_reports
+            use_cache: Read/write the columnar cache in CACHE_DIR
+            compact: Store the frames in the compact representation of compact_frame
+        """
+        if all_reports:
+            df, checkouts = load_all_reports(start=start, end=end, use_cache=use_cache, compact=compact)
+        else:
+            df, checkouts = load_and_prepare_data(file_path, use_cache, compact)
+        return cls(df, checkouts)
+
+def load_and_prepare_data(file_path=DATA_FILE, use_cache=True, compact=False):
     """
     Load the library circulation data and prepare it for analysis.
+
+    Args:
+        file_path: Path to a circulation report CSV
+        use_cache: Read/write the columnar cache in CACHE_DIR
+        compact: Store the frame in the compact representation of compact_frame
+
+    Returns:
+        df, checkouts: All transactions and the checkout-only subset
     """
-    # Update file path to match your actual data file
-    file_path = 'data/Daily Circulation Report-reportresults_Jan 2024_June 2024.xls - Sheet1.csv'
-    df = pd.read_csv(file_path)
-    
-    # Convert date to datetime
-# Convert date to datetime - ADD THIS LINE FIRST
-    df['Date'] = pd.to_datetime(df['Date'])
+    df = load_report(file_path, use_cache)
+    if compact:
+        df = compact_frame(df)
+    return df, split_checkouts(df, use_cache)
+
+def load_all_reports(data_dir=DATA_DIR, start=None, end=None, max_workers=None, use_cache=True, compact=False):
+    """
+    Load every semiannual circulation report in data_dir as one frame.
+
+    Reports are read in parallel, each file exactly once. When a date range is
+    given, files whose period (taken from the file name) lies outside it are
+    skipped before they are parsed.
+
+    Args:
+        data_dir: Directory holding the 'Daily Circulation Report-*.csv' files
+        start: Keep transactions on or after this date (inclusive)
+        end: Keep transactions before this date (exclusive)
+        max_workers: Size of the process pool, defaults to one per file
+        use_cache: Read/write the columnar cache in CACHE_DIR
+        compact: Store the frame in the compact representation of compact_frame
+
+    Returns:
+        df, checkouts: All transactions sorted by date and the checkout-only subset
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    file_paths = []
+    for file_path in sorted(glob.glob(os.path.join(data_dir, REPORT_PATTERN))):
+        period = report_period(file_path)
+        if period is not None:
+            period_start, period_end = period
+            if start is not None and period_end <= start:
+                continue
+            if end is not None and period_start >= end:
+                continue
+        file_paths.append(file_path)
+
+    if not file_paths:
+        raise FileNotFoundError(f"No circulation reports in {data_dir} for the requested period")
+
+    if len(file_paths) == 1:
+        frames = [load_report(file_paths[0], use_cache)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or len(file_paths)) as executor:
+            frames = list(executor.map(load_report, file_paths, [use_cache] * len(file_paths)))
+
+    df = combine_reports(frames)
+
+    if start is not None:
+        df = df[df['Date'] >= start]
+    if end is not None:
+        df = df[df['Date'] < end]
+    df = df.reset_index(drop=True)
+    if compact:
+        df = compact_frame(df)
+
+    return df, split_checkouts(df, use_cache)
+
+def combine_reports(frames):
+    """
+    Union parsed reports into one date-sorted frame.
+
+    Rows that appear in more than one report (overlapping periods) are kept
+    once. Repeated rows inside a single report are genuine and are kept.
+    """
+    tagged = []
+    for source, frame in enumerate(frames):
+        frame = frame.copy()
+        frame['_source'] = source
+        # Number repeats of the same row within one report so only cross-report copies collide
+        frame['_occurrence'] = frame.groupby(COLUMNS, dropna=False, observed=True).cumcount()
+        tagged.append(frame)
+
+    df = pd.concat(tagged, ignore_index=True)
+    df = df.drop_duplicates(subset=COLUMNS + ['_occurrence'], keep='first')
+    df = df.sort_values('Date', kind='mergesort').drop(columns=['_source', '_occurrence'])
+
+    # Categories differ between reports, so concat falls back to strings
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+
+    return df.reset_index(drop=True)
+
+def report_period(file_path):
+    """
+    Return the [start, end) period covered by a report, parsed from its file name.
+
+    'Daily Circulation Report-reportresults_Jan 2024_June 2024...' covers
+    2024-01-01 up to 2024-07-01. Returns None if the name has no period.
+    """
+    match = re.search(r'_([A-Za-z]+)\s*(\d{4})\s*_([A-Za-z]+)\s*(\d{4})', os.path.basename(file_path))
+    if not match:
+        return None
+
+    first_month, first_year, last_month, last_year = match.groups()
+    try:
+        first_month = MONTHS.index(first_month[:3].lower()) + 1
+        last_month = MONTHS.index(last_month[:3].lower()) + 1
+    except ValueError:
+        return None
+
+    period_start = pd.Timestamp(year=int(first_year), month=first_month, day=1)
+    period_end = pd.Timestamp(year=int(last_year), month=last_month, day=1) + pd.DateOffset(months=1)
+    return period_start, period_end
+
+def load_report(file_path, use_cache=True):
+    """
+    Load one parsed report, from the columnar cache when possible.
+
+    Args:
+        file_path: Path to a circulation report CSV
+        use_cache: Read/write the columnar cache in CACHE_DIR
+
+    Returns:
+        df: Parsed report with normalised columns
+    """
+    df = None
+    if use_cache:
+        with stage('read_cached_report', path=os.path.basename(file_path)) as s:
+            df = read_cached_report(file_path)
+            s.rows = len(df) if df is not None else None
+
+    if df is None:
+        with stage('parse_report', path=os.path.basename(file_path)) as s:
+            df = parse_report(file_path)
+            s.rows = len(df)
+        if use_cache:
+            with stage('write_cached_report', path=os.path.basename(file_path)):
+                write_cached_report(file_path, df)
+
+    return df
+
+def compact_frame(df, report=True):
+    """
+    Convert a parsed report to a compact representation.
+
+    Repeated strings become categoricals, Amount a nullable float, Date
+    int64 seconds since the epoch (see as_datetime) and the derived calendar
+    fields int8 or int8-coded ordered categoricals.
+
+    Args:
+        df: Frame from the loaders
+        report: Print the memory used before and after
+
+    Returns:
+        df: Compact copy of the frame
+    """
+    before = df.memory_usage(deep=True).sum()
+    compact = pd.DataFrame(index=df.index)
+
+    for column in df.columns:
+        values = df[column]
+        if column == 'Date':
+            values = values.to_numpy().astype('datetime64[s]').astype(np.int64)
+        elif column == 'Amount':
+            values = pd.to_numeric(values, errors='coerce').astype('Float32')
+        elif column in ('Hour', 'Week'):
+            values = values.astype('int8')
+        elif column == 'Day':
+            values = pd.Categorical(values, categories=DAY_NAMES, ordered=True)
+        elif column == 'Month':
+            values = pd.Categorical(values, categories=MONTH_NAMES, ordered=True)
+        elif not isinstance(values.dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(values):
+            values = values.astype('category')
+        compact[column] = values
+
+    if report:
+        after = compact.memory_usage(deep=True).sum()
+        print(f"Compact frame: {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB ({after / before:.0%})")
+
+    return compact
+
+def as_datetime(dates):
+    """Return a Date column as datetimes, converting from the epoch seconds of compact frames."""
+    if pd.api.types.is_integer_dtype(dates):
+        return pd.to_datetime(dates, unit='s')
+    return dates
+
+def split_checkouts(df, use_cache=True, subjects=None):
+    """
+    Return the checkout transactions of df with their Subject column.
+
+    subjects, the classify_titles result for every row of df, is used
+    instead of classifying the checkouts again when given.
+    """
+    is_checkout = df['Transaction'].str.contains('Check out', case=False, na=False)
+    checkouts = df[is_checkout].copy()
+    if subjects is not None:
+        checkouts['Subject'] = subjects[is_checkout]
+        return checkouts
+    with stage('classify_titles') as s:
+        checkouts['Subject'] = classify_titles(checkouts['Title'], use_cache)
+        s.rows = len(checkouts)
+    return checkouts
+
+def parse_report(file_path):
+    """
+    Parse a circulation report CSV and add the derived calendar columns.
+
+    Args:
+        file_path: Path to a circulation report CSV
 
-    # Then extract datetime components
+    Returns:
+        df: Parsed report with normalised columns and Hour/Day/Month/Week columns
+    """
+    return prepare_report(pd.read_csv(file_path, dtype={'Barcode': str}))
+
+def missing_report_columns(columns):
+    """Return the required columns a CSV header lacks, empty for a circulation report."""
+    present = {COLUMN_ALIASES.get(column, column) for column in columns}
+    return [column for column in REQUIRED_COLUMNS if column not in present]
+
+def prepare_report(df):
+    """Normalise the columns of raw report rows and add the derived calendar columns."""
+    # Normalise the header spellings and column order of the different exports
+    df = df.rename(columns=COLUMN_ALIASES)
+    df = df.reindex(columns=COLUMNS)
+
+    # '-' and blank both mean no amount
+    df['Amount'] = df['Amount'].replace('-', np.nan)
+
+    # Convert date to datetime before extracting its components
+    df['Date'] = pd.to_datetime(df['Date'])
     df['Hour'] = df['Date'].dt.hour
     df['Day'] = df['Date'].dt.day_name()
     df['Month'] = df['Date'].dt.month_name()
     df['Week'] = df['Date'].dt.isocalendar().week
-    
-    # Filter for checkout transactions
-# Filter for checkout transactions
-    checkouts = df[df['Transaction'].str.contains('Check out', case=False, na=False)]
 
-# Add this line
-    checkouts['Subject'] = checkouts['Title'].apply(categorize_book)
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
 
-    return df, checkouts
+    return df
+
+def iter_report_chunks(file_path, chunksize=50000):
+    """
+    Parse a circulation report in chunks of rows, for files too large to hold at once.
+
+    Every column other than Date is read as text, so all chunks share one
+    schema. Categorical columns are left as strings, since each chunk would
+    otherwise get its own categories.
+
+    Raises:
+        ValueError: The CSV lacks columns of a circulation report
+
+    Yields:
+        chunk: Parsed rows like parse_report returns, without categoricals
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    missing = missing_report_columns(header)
+    if missing:
+        raise ValueError(f"Not a circulation report, missing columns: {', '.join(missing)}")
+
+    text_columns = {column: str for column in header if COLUMN_ALIASES.get(column, column) != 'Date'}
+    for chunk in pd.read_csv(file_path, dtype=text_columns, chunksize=chunksize):
+        chunk = prepare_report(chunk)
+        for column in CATEGORICAL_COLUMNS:
+            chunk[column] = chunk[column].astype('str')
+        yield chunk
+
+class CachedReportWriter:
+    """
+    Write a parsed report to the columnar cache one chunk at a time.
+
+    The entry only replaces older versions of the report once close is
+    called, so an interrupted write never leaves a partial cache entry.
+    """
+
+    def __init__(self, file_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.cache_file, self.pattern = _cache_paths(file_path)
+        self.tmp_file = self.cache_file + '.tmp'
+        self.writer = None
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+    def write(self, chunk):
+        if self.writer is None:
+            table = self.pa.Table.from_pandas(chunk, preserve_index=False)
+            self.writer = self.pq.ParquetWriter(self.tmp_file, table.schema)
+        else:
+            table = self.pa.Table.from_pandas(chunk, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        writer, self.writer = self.writer, None
+        if writer is None:
+            return
+        writer.close()
+        os.replace(self.tmp_file, self.cache_file)
+        for stale_file in glob.glob(self.pattern):
+            if stale_file != self.cache_file:
+                os.remove(stale_file)
+
+    def abort(self):
+        """Drop the unfinished entry; safe to call after close, or after close failed."""
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+        if os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+
+def _cache_paths(file_path):
+    """Return the cache file for the current version of file_path and a glob for all its versions."""
+    abs_path = os.path.abspath(file_path)
+    stat = os.stat(abs_path)
+    source_key = hashlib.sha1(abs_path.encode('utf-8')).hexdigest()[:16]
+    version_key = hashlib.sha1(f"{CACHE_VERSION}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:16]
+    cache_file = os.path.join(CACHE_DIR, f"{source_key}_{version_key}.parquet")
+    return cache_file, os.path.join(CACHE_DIR, f"{source_key}_*.parquet")
+
+def read_cached_report(file_path):
+    """
+    Read a parsed report from the columnar cache.
+
+    The cache is keyed by the source path, size and mtime, so an edited or
+    replaced CSV is never served from a stale entry.
+
+    Returns:
+        df: Cached frame, or None on a cache miss
+    """
+    cache_file, _ = _cache_paths(file_path)
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        df = pd.read_parquet(cache_file)
+    except ImportError:
+        # No Parquet engine installed, always parse the CSV
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable cache {cache_file}: {e}")
+        return None
+
+    # Reports cached chunk by chunk store these as strings
+    for column in CATEGORICAL_COLUMNS:
+        if not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+def write_cached_report(file_path, df):
+    """Write a parsed report to the columnar cache, replacing older versions of it."""
+    cache_file, pattern = _cache_paths(file_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write to a temporary file first so a crash never leaves a partial cache entry
+    tmp_file = cache_file + '.tmp'
+    try:
+        df.to_parquet(tmp_file, index=False)
+    except ImportError:
+        return
+    os.replace(tmp_file, cache_file)
+
+    for stale_file in glob.glob(pattern):
+        if stale_file != cache_file:
+            os.remove(stale_file)
 
 def categorize_book(title):
     """
@@ -38,32 +456,20 @@ def categorize_book(title):
     Returns:
         category: Subject category string
     """
-    if pd.isna(title):
-        return "Unknown"
-    
-    title = str(title).lower()
-    
-    # Define categories based on keywords
-    categories = {
-        "Computer Science & Programming": ['programming', 'python', 'c++', 'java', 'computer', 'data structure', 
-                                          'algorithm', 'database', 'software', 'network', 'digital', 'operating system',
-                                          'ai', 'machine learning', 'artificial intelligence'],
-        "Mathematics": ['mathematics', 'calculus', 'algebra', 'linear', 'statistic', 'discrete', 'engineering mathematics',
-                       'laplace', 'differential'],
-        "Engineering": ['engineering', 'mechanical', 'electrical', 'civil', 'electronic', 'circuit', 'machine element', 
-                       'manufacturing', 'fluid', 'thermodynamics', 'cad', 'cam', 'control system', 'hydraulic', 'drawing'],
-        "Physics": ['physics', 'optics', 'semiconductor', 'mechanics'],
-        "Chemistry": ['chemistry', 'organic', 'engineering chemistry'],
-        "Biology & Biotechnology": ['biology', 'biotechnology', 'microbiology', 'biochemistry', 'immunology'],
-        "Management & Business": ['management', 'business', 'analytics', 'entrepreneurship', 'economics', 'project management',
-                                 'marketing', 'sales'],
-        "Constitution & Ethics": ['constitution', 'ethics', 'human rights', 'professional ethics'],
-        "Design & Architecture": ['design', 'architecture', 'drawing', 'planning', 'town planning', 'urban', 'buildings'],
-        "Communication Skills": ['communication', 'language', 'english', 'kannada', 'kali']
-    }
-    
-    for category, keywords in categories.items():
-        if any(keyword in title for keyword in keywords):
-            return category
-    
-    return "Other"
\ No newline at end of file
+    return TAXONOMY.categorize(title)
+
+def classify_titles(titles, use_cache=True):
+    """
+    Categorize a whole column of titles at once with the subject taxonomy.
+
+    Gives the same result as titles.apply(categorize_book), classifying each
+    distinct title only once.
+
+    Args:
+        titles: Series of book titles
+        use_cache: Reuse and update the title cache in SUBJECT_CACHE_DIR
+
+    Returns:
+        subjects: Categorical Series of subjects aligned with titles
+    """
+    return TAXONOMY.classify(titles, SUBJECT_CACHE_DIR if use_cache else None)
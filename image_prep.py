@@ -0,0 +1,83 @@
+import io
+import os
+import json
+import hashlib
+from collections import namedtuple
+from paths import CACHE_DIR
+
+# Longest edge, in pixels, of an image sent to the model
+MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1024))
+
+# JPEG quality of the re-encoded image
+JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 80))
+
+# Image analyses by image key, shared between workers and runs
+ANALYSIS_CACHE_DIR = os.path.join(CACHE_DIR, 'image_analysis')
+
+PreparedImage = namedtuple('PreparedImage', ['data', 'mime', 'width', 'height'])
+
+def image_key(data, max_edge=MAX_EDGE, quality=JPEG_QUALITY, model=''):
+    """Content hash of an uploaded image and everything that shapes its analysis."""
+    h = hashlib.sha256(data)
+    h.update(f"|{max_edge}|{quality}|{model}".encode('utf-8'))
+    return h.hexdigest()[:32]
+
+def prepare_image(data, max_edge=MAX_EDGE, quality=JPEG_QUALITY):
+    """
+    Decode an uploaded image and re-encode it small enough to send to the model.
+
+    The image is turned upright from its EXIF orientation, shrunk so its
+    longest edge is at most max_edge, and saved without EXIF, ICC or other
+    metadata. Images with transparency become PNG, all others JPEG.
+
+    Args:
+        data: Bytes of the uploaded file
+        max_edge: Longest edge in pixels
+        quality: JPEG quality, 1-95
+
+    Raises:
+        ValueError: The data isn't an image PIL can read
+
+    Returns:
+        image: PreparedImage with the encoded bytes and their MIME type
+    """
+    # Imported here so the web app starts without PIL
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError("The file is not a readable image") from e
+
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    output = io.BytesIO()
+    if has_alpha:
+        image.convert('RGBA').save(output, format='PNG', optimize=True)
+        mime = 'image/png'
+    else:
+        image.convert('RGB').save(output, format='JPEG', quality=quality, optimize=True, progressive=True)
+        mime = 'image/jpeg'
+
+    return PreparedImage(output.getvalue(), mime, image.width, image.height)
+
+def read_cached_analysis(key, cache_dir=ANALYSIS_CACHE_DIR):
+    """Return the saved analysis of an image, or None."""
+    path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['analysis']
+    except (ValueError, KeyError):
+        return None
+
+def write_cached_analysis(key, analysis, cache_dir=ANALYSIS_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'analysis': analysis}, f)
+    os.replace(tmp_path, path)
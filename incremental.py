@@ -0,0 +1,253 @@
+import os
+import sys
+import pickle
+import argparse
+from collections import Counter
+import pandas as pd
+import store
+from data_utils import CACHE_DIR, COLUMNS, load_all_reports, load_report, combine_reports, split_checkouts, as_datetime
+from reading_journey import patron_checkout_sequences, mine_reading_paths
+from community_engagement import patron_subject_matrix, subject_cooccurrence
+
+# Aggregates are kept here between runs
+STATE_FILE = os.path.join(CACHE_DIR, 'aggregates.pkl')
+
+# Counters folded from each batch of new rows
+AGGREGATES = [
+    'subject_month',        # (YYYY-MM, subject) checkouts
+    'checkout_day_hour',    # (day, hour) checkouts
+    'activity_day_hour',    # (day, hour) transactions of any kind
+    'dept_subject',         # (department, subject) checkouts
+    'category_subject',     # (user category, subject) checkouts
+    'transitions',          # (from subject, to subject) consecutive checkouts by one patron
+    'paths',                # (subject, subject, subject) consecutive checkouts by one patron
+    'pairs',                # (subject, subject) sorted pairs borrowed by the same patron
+]
+
+def empty_state():
+    """Return aggregates for no rows."""
+    state = {name: Counter() for name in AGGREGATES}
+    state['high_water'] = None
+    # Fingerprints of the rows folded at the high-water timestamp, with their multiplicity
+    state['high_water_rows'] = Counter()
+    state['rows'] = 0
+    # Last two subjects and every subject borrowed, per patron
+    state['patron_recent'] = {}
+    state['patron_subjects'] = {}
+    return state
+
+def fold_new_rows(state, df, checkouts):
+    """
+    Fold the rows of df not yet in the state into it.
+
+    Rows before the high-water mark are assumed to be folded already, so a
+    new report may overlap the previous one. Rows at the mark itself are
+    matched against the fingerprints of the rows folded there, so rows
+    sharing the last timestamp of the previous batch are still folded once;
+    as in combine_reports, a row identical to one folded there is taken to
+    be the same row. Rows must arrive in date order across calls; a late row with a date
+    before the mark is ignored, so the caller rebuilds the state (see
+    rebuild_from_store) when fewer rows were folded than it passed in.
+
+    Args:
+        state: Aggregates from empty_state or load_state, updated in place
+        df, checkouts: Transactions and checkouts as returned by the loaders
+
+    Returns:
+        rows: Number of transactions folded in
+    """
+    # Compact frames store Date as epoch seconds
+    df = df.assign(Date=as_datetime(df['Date']))
+    checkouts = checkouts.assign(Date=as_datetime(checkouts['Date']))
+
+    high_water = state['high_water']
+    folded_at_mark = state.setdefault('high_water_rows', Counter())
+    if high_water is not None:
+        new = (df['Date'] > high_water).to_numpy().copy()
+        at_mark = (df['Date'] == high_water).to_numpy()
+        if at_mark.any():
+            # The k-th copy of a row at the mark is new once k copies were folded before
+            hashes = _row_hashes(df[at_mark])
+            occurrence = hashes.groupby(hashes).cumcount()
+            seen = hashes.map(lambda value: folded_at_mark.get(value, 0))
+            new[at_mark] = (occurrence >= seen).to_numpy()
+        df = df[new]
+        checkouts = checkouts[checkouts.index.isin(df.index)]
+    if df.empty:
+        return 0
+
+    _add_counts(state['activity_day_hour'], df.groupby(['Day', 'Hour'], observed=True).size())
+    _add_counts(state['checkout_day_hour'], checkouts.groupby(['Day', 'Hour'], observed=True).size())
+    _add_counts(state['subject_month'],
+                checkouts.groupby([checkouts['Date'].dt.strftime('%Y-%m'), 'Subject'], observed=True).size())
+    # Department is in 4th column and user category in 5th
+    _add_counts(state['dept_subject'], checkouts.groupby([checkouts.iloc[:, 3], 'Subject'], observed=True).size())
+    _add_counts(state['category_subject'], checkouts.groupby([checkouts.iloc[:, 4], 'Subject'], observed=True).size())
+
+    # A stable sort by date visits each patron's checkouts in the same order as the full analyses
+    ordered = checkouts.sort_values('Date', kind='mergesort')
+    transitions, paths, pairs = state['transitions'], state['paths'], state['pairs']
+    patron_recent, patron_subjects = state['patron_recent'], state['patron_subjects']
+
+    # Patron ID is in 2nd column
+    for patron, subject in zip(ordered.iloc[:, 1], ordered['Subject'].astype(str)):
+        if pd.isna(patron):
+            continue
+
+        recent = patron_recent.get(patron, ())
+        if len(recent) >= 1:
+            transitions[(recent[-1], subject)] += 1
+        if len(recent) >= 2:
+            paths[(recent[-2], recent[-1], subject)] += 1
+        patron_recent[patron] = recent[-1:] + (subject,)
+
+        subjects = patron_subjects.setdefault(patron, set())
+        if subject not in subjects:
+            for other in subjects:
+                pairs[tuple(sorted((subject, other)))] += 1
+            subjects.add(subject)
+
+    latest = df['Date'].max()
+    if latest != high_water:
+        folded_at_mark.clear()
+    folded_at_mark.update(_row_hashes(df[df['Date'] == latest]).tolist())
+    state['high_water'] = latest
+    state['rows'] += len(df)
+    return len(df)
+
+def rebuild_from_store(conn, chunk_rows=50000):
+    """
+    Fold every row of the circulation store into new aggregates.
+
+    Used when rows arrive out of date order or a source is replaced. Copies
+    of a row from different sources are folded once, as combine_reports
+    keeps them once; repeats within one source are kept.
+
+    Args:
+        conn: Store connection; rows it has inserted but not committed are included
+
+    Returns:
+        state: Aggregates of the stored rows
+    """
+    state = empty_state()
+    held = None
+    for chunk in store.iter_report_frames(conn, chunk_rows):
+        # Rows of the chunk's last second wait for the next chunk, so all copies of a row are compared
+        if held is not None:
+            chunk = pd.concat([held, chunk], ignore_index=True)
+        last = (chunk['Date'] == chunk['Date'].max()).to_numpy()
+        _fold_sources(state, chunk[~last])
+        held = chunk[last]
+    if held is not None:
+        _fold_sources(state, held)
+    return state
+
+def _fold_sources(state, rows):
+    occurrence = rows.groupby(COLUMNS + ['Source'], dropna=False, sort=False).cumcount()
+    rows = rows[~rows[COLUMNS].assign(_occurrence=occurrence).duplicated()]
+    if len(rows):
+        fold_new_rows(state, rows, split_checkouts(rows, subjects=rows['Subject']))
+
+def _row_hashes(df):
+    """Fingerprint rows by the values of their report columns."""
+    return pd.util.hash_pandas_object(df[COLUMNS].astype(str), index=False)
+
+def _add_counts(counter, counts):
+    for key, count in counts.items():
+        if count:
+            counter[key] += int(count)
+
+def aggregate_frame(state, name):
+    """Return an aggregate as a frame, e.g. subject_month as months x subjects."""
+    counts = pd.Series(state[name], dtype='int64')
+    if counts.empty:
+        return pd.DataFrame()
+    return counts.sort_index().unstack(fill_value=0)
+
+def load_state(path=STATE_FILE):
+    """Load saved aggregates, or empty ones if there are none."""
+    if not os.path.exists(path):
+        return empty_state()
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def verify_state(state, df, checkouts):
+    """
+    Compare incremental aggregates with a full rebuild over the same rows.
+
+    The rebuild folds every row up to the high-water mark in one batch. The
+    transition, path and pair counts are also checked against the reading
+    journey and co-occurrence engines the analyses use.
+
+    Returns:
+        mismatches: Names of the aggregates that differ, empty if all match
+    """
+    df = df.assign(Date=as_datetime(df['Date']))
+    checkouts = checkouts.assign(Date=as_datetime(checkouts['Date']))
+    if state['high_water'] is not None:
+        df = df[df['Date'] <= state['high_water']]
+        checkouts = checkouts[checkouts['Date'] <= state['high_water']]
+
+    rebuilt = empty_state()
+    fold_new_rows(rebuilt, df, checkouts)
+    mismatches = [name for name in AGGREGATES + ['rows'] if state[name] != rebuilt[name]]
+
+    sequences = patron_checkout_sequences(df, checkouts)
+    if Counter(dict(mine_reading_paths(sequences, n=2, top_k=None))) != state['transitions']:
+        mismatches.append('transitions (reading journeys)')
+    if Counter(dict(mine_reading_paths(sequences, n=3, top_k=None))) != state['paths']:
+        mismatches.append('paths (reading journeys)')
+
+    matrix = patron_subject_matrix(checkouts)
+    C = subject_cooccurrence(matrix)
+    pairs = Counter()
+    for i, a in enumerate(matrix.subject_names):
+        for j, b in enumerate(matrix.subject_names):
+            if i < j and C[i, j]:
+                pairs[tuple(sorted((str(a), str(b))))] = int(C[i, j])
+    if pairs != state['pairs']:
+        mismatches.append('pairs (co-occurrence)')
+
+    return mismatches
+
+def load_new_reports(file_paths):
+    """Load specific report files, e.g. the latest daily export, as df and checkouts."""
+    df = combine_reports([load_report(file_path) for file_path in file_paths])
+    return df, split_checkouts(df)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally maintained circulation aggregates")
+    parser.add_argument('command', choices=['update', 'rebuild', 'verify'])
+    parser.add_argument('files', nargs='*', help="Reports to fold in (default: every report in data/)")
+    parser.add_argument('--state', default=STATE_FILE, help="Aggregate state file")
+    args = parser.parse_args(argv)
+
+    if args.files:
+        df, checkouts = load_new_reports(args.files)
+    else:
+        df, checkouts = load_all_reports()
+
+    if args.command == 'verify':
+        state = load_state(args.state)
+        mismatches = verify_state(state, df, checkouts)
+        if mismatches:
+            print(f"Aggregates differ from a full rebuild: {', '.join(mismatches)}")
+            return 1
+        print(f"Aggregates match a full rebuild ({state['rows']} rows up to {state['high_water']})")
+        return 0
+
+    state = empty_state() if args.command == 'rebuild' else load_state(args.state)
+    folded = fold_new_rows(state, df, checkouts)
+    save_state(state, args.state)
+    print(f"Folded {folded} new rows, high-water mark {state['high_water']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds; the read timeout applies between streamed chunks too
+TIMEOUT = (5, 60)
+
+# Requests in flight at once, and idle keep-alive connections kept per host
+MAX_CONCURRENT = 8
+
+# Retries of failed connections and of 429/5xx responses, with exponential backoff. A read
+# error may come after the server took the request, so it is never retried: resending the
+# POST could run and bill the completion twice
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class LLMClient:
+    """
+    Chat completions client sharing one keep-alive session between requests.
+
+    At most max_concurrent requests run at once; further callers wait for a
+    slot. Connection errors and retryable statuses are retried with backoff,
+    honouring Retry-After; read errors and timeouts are not.
+    """
+
+    def __init__(self, url, api_key='', timeout=TIMEOUT, max_concurrent=MAX_CONCURRENT, retries=RETRIES,
+                 backoff=BACKOFF):
+        self.url = url
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+
+        retry = Retry(total=retries, read=False, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def complete(self, payload):
+        """Send a chat completion request and return the parsed response."""
+        with self.slots:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+    def stream(self, payload):
+        """
+        Send a streaming chat completion request.
+
+        Yields:
+            chunk: Each parsed server-sent event until the stream ends
+        """
+        with self.slots:
+            with self.session.post(self.url, json={**payload, "stream": True},
+                                   timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                yield from parse_event_stream(response.iter_lines(decode_unicode=True))
+
+    def close(self):
+        self.session.close()
+
+def parse_event_stream(lines):
+    """
+    Parse a server-sent event stream up to its [DONE] marker.
+
+    The data lines of one event are joined with newlines, as the SSE format
+    specifies, and the event is parsed as JSON when a blank line ends it.
+    Comments and other fields are skipped.
+    """
+    data = []
+    for line in lines:
+        if line:
+            if line.startswith('data:'):
+                value = line[len('data:'):]
+                data.append(value[1:] if value.startswith(' ') else value)
+            continue
+        if data:
+            event, data = '\n'.join(data), []
+            if event.strip() == '[DONE]':
+                return
+            yield json.loads(event)
+    # A stream may end without the blank line after its last event
+    if data and '\n'.join(data).strip() != '[DONE]':
+        yield json.loads('\n'.join(data))
+
+def stream_message(chunks):
+    """
+    Assemble the message of a streamed completion, passing its text through.
+
+    Yields:
+        text: Each piece of content as it arrives
+
+    Returns:
+        message: Assistant message with its content and any tool calls
+    """
+    content, tool_calls = [], {}
+    for chunk in chunks:
+        if not chunk.get('choices'):
+            continue
+        delta = chunk['choices'][0].get('delta', {})
+        if delta.get('content'):
+            content.append(delta['content'])
+            yield delta['content']
+        # Tool calls arrive in pieces keyed by their index
+        for part in delta.get('tool_calls') or []:
+            call = tool_calls.setdefault(part.get('index', 0),
+                                         {'id': None, 'type': 'function', 'function': {'name': '', 'arguments': ''}})
+            if part.get('id'):
+                call['id'] = part['id']
+            function = part.get('function') or {}
+            call['function']['name'] += function.get('name') or ''
+            call['function']['arguments'] += function.get('arguments') or ''
+
+    message = {'role': 'assistant', 'content': ''.join(content) or None}
+    if tool_calls:
+        message['tool_calls'] = [tool_calls[index] for index in sorted(tool_calls)]
+    return message
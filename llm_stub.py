@@ -0,0 +1,175 @@
+import json
+
+# Keywords that make the stub call a tool, tried in order
+TOOL_KEYWORDS = [
+    ('busiest_hours', ('hour', 'time', 'when', 'busy', 'busiest')),
+    ('top_titles', ('title', 'book')),
+    ('department_preferences', ('department', 'dept', 'faculty')),
+    ('checkouts_by_subject', ('subject', 'month', 'trend', 'popular', 'checkout')),
+]
+
+def _response(message):
+    return {'choices': [{'index': 0, 'message': message, 'finish_reason':
+                         'tool_calls' if message.get('tool_calls') else 'stop'}]}
+
+def pick_tool(text):
+    """Return the tool a question is about, or None."""
+    text = text.lower()
+    for name, keywords in TOOL_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return name
+    return None
+
+def complete(payload):
+    """
+    Answer a chat completion request offline, in the format of the remote API.
+
+    A question mentioning hours, titles, departments or subjects gets one
+    tool call; once the tool results are in, they are listed as the answer.
+    This lets the chat and tool-calling loop run without network access.
+
+    Args:
+        payload: Request body as sent to the chat completions endpoint
+
+    Returns:
+        response: Parsed response body with one choice
+    """
+    messages = payload['messages']
+    last = messages[-1]
+
+    if last['role'] == 'tool':
+        lines = ["Here is what the circulation data shows:"]
+        for message in reversed(messages):
+            if message['role'] != 'tool':
+                break
+            result = json.loads(message['content'])
+            if 'error' in result:
+                lines.append(f"- The query failed: {result['error']}")
+                continue
+            for row in result['result'][:10]:
+                lines.append("- " + ", ".join(f"**{key}**: {value}" for key, value in row.items()))
+        return _response({'role': 'assistant', 'content': '\n'.join(lines)})
+
+    text = last['content'] if isinstance(last['content'], str) else json.dumps(last['content'])
+    tool = pick_tool(text) if payload.get('tools') else None
+    if tool is None:
+        return _response({'role': 'assistant', 'content': "I can only answer questions about subjects, "
+                          "titles, departments and busy hours while working offline."})
+
+    arguments = {}
+    if tool == 'checkouts_by_subject':
+        arguments['period'] = 'year' if 'year' in text.lower() else 'month'
+    return _response({'role': 'assistant', 'content': None, 'tool_calls': [{
+        'id': 'call_0',
+        'type': 'function',
+        'function': {'name': tool, 'arguments': json.dumps(arguments)},
+    }]})
+
+def stream(payload):
+    """
+    Answer like complete, as the chunks of a streamed response.
+
+    Content is sent a word at a time and tool calls in one chunk each.
+    """
+    message = complete(payload)['choices'][0]['message']
+    for index, call in enumerate(message.get('tool_calls') or []):
+        yield {'choices': [{'index': 0, 'delta': {'tool_calls': [{**call, 'index': index}]}}]}
+
+    words = (message.get('content') or '').split(' ')
+    for position, word in enumerate(words):
+        piece = word if position == len(words) - 1 else word + ' '
+        yield {'choices': [{'index': 0, 'delta': {'content': piece}}]}
+
+def make_server(port=8001, delay=0.0, fail_status=None, failures=0):
+    """
+    Create the stub's chat completions HTTP server without starting it.
+
+    Args:
+        port: Port on 127.0.0.1, 0 for any free one (see server.server_port)
+        delay: Seconds slept before every response and streamed chunk, to imitate a remote model
+        fail_status: HTTP status the first failures requests are answered with, e.g. 503
+        failures: Number of requests to fail; -1 fails all of them
+
+    Returns:
+        server: ThreadingHTTPServer; its requests attribute counts the requests received
+    """
+    import time
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle(self):
+            # A client that timed out has gone away by the time the answer is written
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            with self.server.lock:
+                self.server.requests += 1
+                failing = fail_status is not None and (failures < 0 or self.server.requests <= failures)
+            time.sleep(delay)
+            if failing:
+                self._send_json(fail_status, {'error': {'message': f"Stub failure {fail_status}"}},
+                                {'Retry-After': '0'})
+                return
+            if not payload.get('stream'):
+                self._send_json(200, complete(payload))
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in stream(payload):
+                time.sleep(delay)
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _send_json(self, status, doc, headers=None):
+            body = json.dumps(doc).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    return server
+
+def serve(port=8001, delay=0.0):
+    """
+    Serve the stub as a local chat completions endpoint.
+
+    Point the app at it with GROQ_API_URL=http://127.0.0.1:<port>/v1/chat/completions.
+    A delay in seconds is slept before every response and streamed chunk, to
+    imitate a remote model.
+    """
+    server = make_server(port, delay)
+    print(f"Stub chat completions endpoint on http://127.0.0.1:{port}/v1/chat/completions")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Offline stand-in for the chat completions API")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds to wait before each response and chunk")
+    args = parser.parse_args()
+    serve(args.port, args.delay)
@@ -0,0 +1,146 @@
+import pandas as pd
+import numpy as np
+from data_utils import AnalysisContext, as_datetime
+from plotting import plot_spec, render_all
+
+# Sort rank of the loan transactions; at the same second on one item a
+# return comes before a renewal and both before the next checkout
+CHECK_IN, RENEW, CHECK_OUT = 0, 1, 2
+TRANSACTION_RANKS = {'Check in': CHECK_IN, 'Renew': RENEW, 'Check out': CHECK_OUT}
+
+# Longest loan, in weeks, given its own bar in the duration histogram
+MAX_DURATION_WEEKS = 12
+
+def build_loans(df):
+    """
+    Reconstruct loans by pairing each checkout with its renewals and check-in.
+
+    Transactions are sorted by (Barcode, Date) and cut into loans: a loan
+    starts at a checkout, or at any transaction following a check-in of the
+    same item, and ends at its check-in. Pass the combined reports so loans
+    that cross file boundaries are joined.
+
+    A loan checked out before the data starts has no start. A loan that is
+    checked out again without a check-in is 'superseded' and ends at the next
+    checkout; one never returned is 'outstanding' and has no end.
+
+    Args:
+        df: All transactions, as loaded by data_utils
+
+    Returns:
+        loans: One row per loan with Barcode, Card Number, Title, start, end,
+            renewals, duration and status, item by item in time order
+    """
+    ranks = df['Transaction'].map(TRANSACTION_RANKS).astype('float64').to_numpy()
+    keep = ~np.isnan(ranks) & df['Barcode'].notna().to_numpy()
+    rows = df.loc[keep, ['Date', 'Barcode', 'Card Number', 'Title']]
+
+    rank = ranks[keep].astype(np.int8)
+    item = pd.factorize(rows['Barcode'])[0]
+    date = as_datetime(rows['Date']).to_numpy()
+    order = np.lexsort((rank, date, item))
+    item, date, rank = item[order], date[order], rank[order]
+
+    # Cut the sorted transactions into loans
+    n = len(order)
+    new_item = np.ones(n, dtype=bool)
+    new_item[1:] = item[1:] != item[:-1]
+    after_check_in = np.zeros(n, dtype=bool)
+    after_check_in[1:] = rank[:-1] == CHECK_IN
+    first = np.flatnonzero((rank == CHECK_OUT) | new_item | after_check_in)
+    last = np.empty_like(first)
+    last[:-1] = first[1:] - 1
+    last[-1:] = n - 1
+
+    not_a_time = np.datetime64('NaT', 'ns').astype(date.dtype)
+    start = np.where(rank[first] == CHECK_OUT, date[first], not_a_time)
+    end = np.where(rank[last] == CHECK_IN, date[last], not_a_time)
+    renewals = np.add.reduceat((rank == RENEW).astype(np.int32), first) if n else np.zeros(0, dtype=np.int32)
+
+    # An unreturned loan followed by another loan of the same item ends where that one starts
+    superseded = np.zeros(len(first), dtype=bool)
+    superseded[:-1] = (rank[last[:-1]] != CHECK_IN) & (item[first[1:]] == item[first[:-1]])
+    end[:-1] = np.where(superseded[:-1], date[first[1:]], end[:-1])
+    status = np.where(rank[last] == CHECK_IN, 'returned', np.where(superseded, 'superseded', 'outstanding'))
+
+    source = rows.iloc[order[first]]
+    loans = pd.DataFrame({
+        'Barcode': source['Barcode'].to_numpy(),
+        'Card Number': source['Card Number'].to_numpy(),
+        'Title': source['Title'].to_numpy(),
+        'start': start,
+        'end': end,
+        'renewals': renewals,
+        'status': status,
+    })
+    loans['duration'] = loans['end'] - loans['start']
+    return loans
+
+def outstanding_loans(loans):
+    """
+    Number of loans outstanding after every start and end, by sweep line.
+
+    Each loan adds one at its start and removes one at its end. Loans
+    without a start are out from the beginning and loans without an end
+    stay out. At equal times, ends are applied before starts.
+
+    Returns:
+        outstanding: Series of counts indexed by the time of each change
+    """
+    starts = loans['start'].dropna().to_numpy()
+    ends = loans['end'].dropna().to_numpy()
+    times = np.concatenate([ends, starts])
+    steps = np.concatenate([np.full(len(ends), -1), np.full(len(starts), 1)])
+
+    # Stable sort keeps the ends, listed first, ahead of starts at the same time
+    order = np.argsort(times, kind='stable')
+    counts = loans['start'].isna().sum() + np.cumsum(steps[order])
+    outstanding = pd.Series(counts, index=pd.DatetimeIndex(times[order], name='Date'), name='Outstanding')
+    return outstanding[~outstanding.index.duplicated(keep='last')]
+
+def outstanding_at(loans, times):
+    """Number of loans outstanding at each of the given times."""
+    starts = np.sort(loans['start'].dropna().to_numpy())
+    ends = np.sort(loans['end'].dropna().to_numpy())
+    times = pd.DatetimeIndex(times).to_numpy().astype(starts.dtype)
+    started = np.searchsorted(starts, times, side='right')
+    ended = np.searchsorted(ends, times, side='right')
+    return loans['start'].isna().sum() + started - ended
+
+def analyze_loans(ctx):
+    loans = build_loans(ctx.df)
+
+    # Loans outstanding at the end of each day
+    outstanding = outstanding_loans(loans)
+    daily_outstanding = outstanding.resample('D').last().ffill()
+
+    # Weeks between checkout and check-in of returned loans
+    returned = loans[(loans['status'] == 'returned') & loans['start'].notna()]
+    weeks = (returned['duration'].dt.days // 7).clip(upper=MAX_DURATION_WEEKS)
+    duration_weeks = weeks.value_counts().reindex(range(MAX_DURATION_WEEKS + 1), fill_value=0)
+    duration_weeks.index = [f"{week}+" if week == MAX_DURATION_WEEKS else str(week) for week in duration_weeks.index]
+
+    return loans, daily_outstanding, duration_weeks
+
+def loan_plots(daily_outstanding, duration_weeks):
+    """Plot specs for the results of analyze_loans"""
+    return [
+        plot_spec('plots/loans/outstanding_loans.png', 'line', daily_outstanding,
+                  'Loans Outstanding at the End of Each Day', 'Date', 'Loans Outstanding', figsize=(14, 6),
+                  marker='', grid=True),
+        plot_spec('plots/loans/loan_durations.png', 'bar', duration_weeks,
+                  'Loan Duration of Returned Items', 'Weeks on Loan', 'Number of Loans', color='teal'),
+    ]
+
+if __name__ == "__main__":
+    import time
+    ctx = AnalysisContext.load(all_reports=True)
+    started = time.perf_counter()
+    loans, daily_outstanding, duration_weeks = analyze_loans(ctx)
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(loans)} loans from {len(ctx.df)} transactions in {elapsed * 1000:.0f} ms")
+    print(loans['status'].value_counts().to_string())
+    print(f"Median loan: {loans['duration'].median()}, peak outstanding: {int(daily_outstanding.max())}")
+    render_all(loan_plots(daily_outstanding, duration_weeks))
+    print("Loan analysis complete. Plots saved to plots/loans/")
@@ -1,46 +1,128 @@
-import os
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter, defaultdict
+import sys
+import argparse
 
-# Create all plot directories
-for directory in ['plots', 'plots/subject_popularity', 'plots/reading_journeys', 
-                 'plots/patron_analysis', 'plots/temporal_patterns', 
-                 'plots/community_engagement']:
-    os.makedirs(directory, exist_ok=True)
+from subject_analysis import analyze_subject_popularity, subject_popularity_plots
+from reading_journey import analyze_reading_journeys, reading_journey_plots
+from patron_analysis import analyze_patron_patterns, patron_pattern_plots
+from temporal_analysis import analyze_temporal_patterns, temporal_pattern_plots
+from community_engagement import analyze_community_engagement, community_engagement_plots
+from loans import analyze_loans, loan_plots
+from data_utils import AnalysisContext
+from plotting import DPI, FORMAT, FORMATS, render_all
+from result_cache import AGGREGATES_DIR, save_aggregates, load_aggregates
+from dashboard_data import DASHBOARD_DATA_DIR, build_dashboard_data
+import profiling
+from profiling import stage, TRACE_FILE
 
-# Import and run all analyses
-from subject_analysis import analyze_subject_popularity
-from reading_journey import analyze_reading_journeys
-from patron_analysis import analyze_patron_patterns
-from temporal_analysis import analyze_temporal_patterns
-from community_engagement import analyze_community_engagement
-
-def run_all_analyses():
-    print("Starting comprehensive library circulation analysis...")
+def aggregate_all(ctx=None):
+    """Run every analysis and return their results by name."""
+    # Load the data once and share it between all analyses
+    if ctx is None:
+        with stage('load') as s:
+            ctx = AnalysisContext.load()
+            s.rows = len(ctx.df)
     
+    # Rows of each analysis stage are the checkouts, or all transactions for loans
     print("\n1. Analyzing subject popularity...")
-    subjects_by_month, top_subjects, daily_checkouts = analyze_subject_popularity()
+    with stage('analyze_subject_popularity') as s:
+        s.rows = len(ctx.checkouts)
+        subjects_by_month, top_subjects, daily_checkouts = analyze_subject_popularity(ctx)
     
     print("\n2. Analyzing reading journeys...")
-    transitions, transition_matrix, common_paths = analyze_reading_journeys()
+    with stage('analyze_reading_journeys') as s:
+        s.rows = len(ctx.checkouts)
+        transitions, transition_matrix, common_paths = analyze_reading_journeys(ctx)
     
     print("\n3. Analyzing patron patterns...")
-    dept_interests, user_interests, dept_diversity = analyze_patron_patterns()
+    with stage('analyze_patron_patterns') as s:
+        s.rows = len(ctx.checkouts)
+        dept_interests, user_interests, dept_diversity = analyze_patron_patterns(ctx)
     
     print("\n4. Analyzing temporal patterns...")
-    hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts = analyze_temporal_patterns()
+    with stage('analyze_temporal_patterns') as s:
+        s.rows = len(ctx.checkouts)
+        hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts = analyze_temporal_patterns(ctx)
     
     print("\n5. Analyzing community engagement opportunities...")
-    activity_by_hour_day, top_combinations, utilization_ratio = analyze_community_engagement()
+    with stage('analyze_community_engagement') as s:
+        s.rows = len(ctx.checkouts)
+        activity_by_hour_day, top_combinations, utilization_ratio = analyze_community_engagement(ctx)
+    
+    print("\n6. Reconstructing loans...")
+    with stage('analyze_loans') as s:
+        s.rows = len(ctx.df)
+        _, daily_outstanding, loan_durations = analyze_loans(ctx)
+    
+    return {
+        'subjects_by_month': subjects_by_month,
+        'top_subjects': top_subjects,
+        'daily_checkouts': daily_checkouts,
+        'transitions': transitions,
+        'transition_matrix': transition_matrix,
+        'common_paths': common_paths,
+        'dept_interests': dept_interests,
+        'user_interests': user_interests,
+        'dept_diversity': dept_diversity,
+        'hourly_checkouts': hourly_checkouts,
+        'monthly_checkouts': monthly_checkouts,
+        'weekly_checkouts': weekly_checkouts,
+        'day_hour_checkouts': day_hour_checkouts,
+        'activity_by_hour_day': activity_by_hour_day,
+        'top_combinations': top_combinations,
+        'utilization_ratio': utilization_ratio,
+        'daily_outstanding': daily_outstanding,
+        'loan_durations': loan_durations,
+    }
+
+def all_plot_specs(results):
+    """Plot specs for every figure, from the results of aggregate_all."""
+    r = results
+    return (subject_popularity_plots(r['subjects_by_month'], r['top_subjects'], r['daily_checkouts'])
+            + reading_journey_plots(r['transitions'], r['transition_matrix'], r['common_paths'])
+            + patron_pattern_plots(r['dept_interests'], r['user_interests'], r['dept_diversity'])
+            + temporal_pattern_plots(r['hourly_checkouts'], r['monthly_checkouts'],
+                                     r['weekly_checkouts'], r['day_hour_checkouts'])
+            + community_engagement_plots(r['activity_by_hour_day'], r['top_combinations'], r['utilization_ratio'])
+            + loan_plots(r['daily_outstanding'], r['loan_durations']))
+
+def save_results(results, directory=AGGREGATES_DIR):
+    with stage('save_aggregates') as s:
+        changed = save_aggregates(results, directory)
+        s.rows = len(changed)
+    print(f"\n{len(changed)} of {len(results)} aggregates changed, saved to {directory}")
+    with stage('build_dashboard_data') as s:
+        built = build_dashboard_data(directory)
+        s.rows = len(built)
+    print(f"{len(built)} dashboard datasets rebuilt in {DASHBOARD_DATA_DIR}")
+
+def render_results(results, dpi=DPI, fmt=FORMAT, workers=None, force=False):
+    specs = all_plot_specs(results)
+    print(f"\nRendering figures ({fmt}, {dpi} dpi)...")
+    with stage('render') as s:
+        s.rows = len(specs)
+        render_all(specs, dpi=dpi, fmt=fmt, workers=workers, force=force)
+
+@profiling.profiled('insights')
+def insights_from_results(results):
+    generate_insights_summary(results['top_subjects'], results['transition_matrix'], results['common_paths'],
+                             results['dept_interests'], results['top_combinations'], results['activity_by_hour_day'])
+
+def run_all_analyses(ctx=None, plots=True, dpi=DPI, fmt=FORMAT, workers=None, force=False,
+                     aggregates_dir=AGGREGATES_DIR):
+    print("Starting comprehensive library circulation analysis...")
+
+    results = aggregate_all(ctx)
+    save_results(results, aggregates_dir)
     
-    print("\nAll analyses complete! Results saved to 'plots' directory.")
+    if plots:
+        render_results(results, dpi, fmt, workers, force)
+        print("\nAll analyses complete! Results saved to 'plots' directory.")
+    else:
+        print("\nAll analyses complete! Plots skipped.")
     
     # Generate final report with key insights
-    generate_insights_summary(top_subjects, transition_matrix, common_paths, 
-                             dept_interests, top_combinations, activity_by_hour_day)
+    insights_from_results(results)
+    return results
 
 def generate_insights_summary(top_subjects, transition_matrix, common_paths, 
                              dept_interests, top_combinations, activity_by_hour_day):
@@ -106,5 +188,40 @@ def generate_insights_summary(top_subjects, transition_matrix, common_paths,
         f.write("\n\nAnalysis completed on March 29, 2025\n")
     
     print(f"Key insights saved to 'reading_journeys_insights.txt'")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library circulation analysis")
+    parser.add_argument('--stage', choices=['all', 'aggregate', 'render', 'insights'], default='all',
+                        help="Run only the aggregation, or only render figures or write the insights from saved aggregates")
+    parser.add_argument('--no-plots', action='store_true', help="Skip rendering the figures")
+    parser.add_argument('--dpi', type=int, default=DPI, help="Resolution of PNG figures")
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT, help="Figure file format")
+    parser.add_argument('--workers', type=int, default=None, help="Renderer processes (default: one per CPU)")
+    parser.add_argument('--force', action='store_true', help="Render every figure even if it is up to date")
+    parser.add_argument('--aggregates', default=AGGREGATES_DIR, help="Directory of the saved aggregates")
+    parser.add_argument('--profile', nargs='?', const=TRACE_FILE, default=None, metavar='TRACE',
+                        help=f"Time every stage, print a summary and write a Chrome trace (default: {TRACE_FILE})")
+    args = parser.parse_args(argv)
+
+    profiler = profiling.enable() if args.profile else None
+
+    try:
+        if args.stage == 'aggregate':
+            save_results(aggregate_all(), args.aggregates)
+        elif args.stage == 'render':
+            render_results(load_aggregates(args.aggregates), args.dpi, args.format, args.workers, args.force)
+        elif args.stage == 'insights':
+            insights_from_results(load_aggregates(args.aggregates))
+        else:
+            run_all_analyses(plots=not args.no_plots, dpi=args.dpi, fmt=args.format, workers=args.workers,
+                             force=args.force, aggregates_dir=args.aggregates)
+    finally:
+        # A failing run still reports the stages it got through
+        if profiler is not None:
+            profiling.disable()
+            profiler.print_summary()
+            profiler.write_trace(args.profile)
+            print(f"\nTrace written to {args.profile}, open it in chrome://tracing or https://ui.perfetto.dev")
+    return 0
+
 if __name__ == "__main__":
-    run_all_analyses()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
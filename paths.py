@@ -0,0 +1,9 @@
+# Locations shared by the analysis scripts and the web app. Kept free of
+# heavy imports so the app can use them without loading pandas.
+
+# All semiannual reports in DATA_DIR matching REPORT_PATTERN are combined by load_all_reports
+DATA_DIR = 'data'
+REPORT_PATTERN = 'Daily Circulation Report-*.csv'
+
+# Parsed reports, the circulation store and other derived data are cached here
+CACHE_DIR = 'cache'
@@ -0,0 +1,127 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from result_cache import content_hash, read_sidecar_key, write_sidecar
+from profiling import stage
+
+# Defaults for rendered figures
+DPI = 300
+FORMAT = 'png'
+FORMATS = ('png', 'svg')
+
+def plot_spec(path, kind, data, title, xlabel=None, ylabel=None, figsize=(14, 8), **options):
+    """
+    Describe a figure without drawing it.
+
+    Args:
+        path: Output file, its extension is replaced by the render format
+        kind: 'line', 'bar', 'stacked_bar', 'barh' or 'heatmap'
+        data: DataFrame or Series to draw; for 'barh' a Series of bar lengths indexed by label
+        title, xlabel, ylabel: Figure labels
+        figsize: Figure size in inches
+        options: Styling, any of color, marker, grid, legend_title, rotation,
+            ha, cmap, annot, fmt and axhline
+
+    Returns:
+        spec: Plain dict that can be pickled to a renderer process
+    """
+    return {
+        'path': path,
+        'kind': kind,
+        'data': data,
+        'title': title,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+        'figsize': figsize,
+        'options': options,
+    }
+
+def output_path(spec, fmt=FORMAT):
+    return os.path.splitext(spec['path'])[0] + '.' + fmt
+
+def spec_key(spec, dpi=DPI, fmt=FORMAT):
+    """Cache key of a figure: its data, labels, styling and output settings."""
+    return content_hash(spec['data'], spec['kind'], spec['title'], spec['xlabel'], spec['ylabel'],
+                        spec['figsize'], spec['options'], dpi, fmt)
+
+def render_spec(spec, dpi=DPI, fmt=FORMAT):
+    """Draw one plot spec with the Agg backend and save it; returns the written file."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    data, options = spec['data'], spec['options']
+    fig, ax = plt.subplots(figsize=spec['figsize'])
+
+    if spec['kind'] == 'line':
+        data.plot(kind='line', marker=options.get('marker', 'o'), ax=ax)
+    elif spec['kind'] == 'bar':
+        data.plot(kind='bar', color=options.get('color'), ax=ax)
+    elif spec['kind'] == 'stacked_bar':
+        data.plot(kind='bar', stacked=True, ax=ax)
+    elif spec['kind'] == 'barh':
+        ax.barh([str(label) for label in data.index], data.values, color=options.get('color'))
+    elif spec['kind'] == 'heatmap':
+        sns.heatmap(data, annot=options.get('annot', True), cmap=options.get('cmap'), fmt=options.get('fmt', 'g'), ax=ax)
+    else:
+        raise ValueError(f"Unknown plot kind '{spec['kind']}'")
+
+    ax.set_title(spec['title'])
+    if spec['xlabel'] is not None:
+        ax.set_xlabel(spec['xlabel'])
+    if spec['ylabel'] is not None:
+        ax.set_ylabel(spec['ylabel'])
+    if 'rotation' in options:
+        plt.setp(ax.get_xticklabels(), rotation=options['rotation'], ha=options.get('ha', 'center'))
+    if 'axhline' in options:
+        ax.axhline(y=options['axhline'], color='red', linestyle='--')
+    if options.get('grid'):
+        ax.grid(True, linestyle='--', alpha=0.7)
+    if 'legend_title' in options:
+        ax.legend(title=options['legend_title'], bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    path = output_path(spec, fmt)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi, format=fmt)
+    plt.close(fig)
+    return path
+
+def render_all(specs, dpi=DPI, fmt=FORMAT, workers=None, force=False):
+    """
+    Render plot specs, in parallel processes unless workers is 1.
+
+    A figure is skipped when the file exists and was rendered from a spec
+    with the same key. The key and the plotted data are kept in a JSON file
+    next to each figure.
+
+    Args:
+        specs: List of plot specs from plot_spec
+        dpi: Resolution of raster formats
+        fmt: 'png' or 'svg'
+        workers: Number of renderer processes, defaults to one per CPU
+        force: Render every figure even if it is up to date
+
+    Returns:
+        paths: Files of all figures in the order of specs
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown plot format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+    keys = [spec_key(spec, dpi, fmt) for spec in specs]
+    stale = [i for i, spec in enumerate(specs) if force or read_sidecar_key(output_path(spec, fmt)) != keys[i]]
+    print(f"{len(stale)} of {len(specs)} figures need rendering")
+
+    stale_specs = [specs[i] for i in stale]
+    with stage('render_figures', dpi=dpi, format=fmt) as s:
+        # Rows are the figures drawn
+        s.rows = len(stale_specs)
+        if workers == 1 or len(stale_specs) <= 1:
+            written = [render_spec(spec, dpi, fmt) for spec in stale_specs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                written = list(executor.map(render_spec, stale_specs, [dpi] * len(stale_specs), [fmt] * len(stale_specs)))
+
+    for i, path in zip(stale, written):
+        write_sidecar(path, keys[i], specs[i])
+    return [output_path(spec, fmt) for spec in specs]
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+
+# Trace file written by main.py --profile when no path is given
+TRACE_FILE = 'profile_trace.json'
+
+# Active profiler, None while profiling is off
+_profiler = None
+
+def _peak_rss_mb(children=False):
+    """Peak resident set size so far, in MB; None where the resource module is missing."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def _rss_mb():
+    """Current resident set size in MB; None where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _change(start, end):
+    return end - start if start is not None and end is not None else None
+
+class Stage:
+    """
+    One timed stage; set rows inside the with block to record how much data it handled.
+    """
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.rows = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.rss_start_mb = _rss_mb()
+        self.peak_start_mb = _peak_rss_mb()
+        self.children_peak_start_mb = _peak_rss_mb(children=True)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self.cpu_start
+        # The peaks only ever grow, so a stage is charged with how far it raised them
+        self.rss_end_mb = _rss_mb()
+        self.peak_growth_mb = _change(self.peak_start_mb, _peak_rss_mb())
+        children_peak = _peak_rss_mb(children=True)
+        self.children_peak_rss_mb = children_peak if children_peak != self.children_peak_start_mb else None
+        self.profiler.record(self)
+        return False
+
+class _NullStage:
+    """Stands in for Stage while profiling is off, so instrumented code pays almost nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class Profiler:
+    """Collects the stages run while it is enabled."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = []
+
+    def record(self, stage):
+        with self.lock:
+            self.stages.append({
+                'name': stage.name,
+                'start': stage.start - self.origin,
+                'wall': stage.wall,
+                'cpu': stage.cpu,
+                'rows': stage.rows,
+                'rss_start_mb': stage.rss_start_mb,
+                'rss_end_mb': stage.rss_end_mb,
+                'peak_growth_mb': stage.peak_growth_mb,
+                'children_peak_rss_mb': stage.children_peak_rss_mb,
+                'thread': threading.get_ident(),
+                'args': stage.args,
+            })
+
+    def summary(self):
+        """Totals per stage name, in the order the stages first finished."""
+        totals = {}
+        for stage in self.stages:
+            total = totals.setdefault(stage['name'], {'name': stage['name'], 'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                      'rows': None, 'rss_change_mb': None, 'peak_growth_mb': None,
+                                                      'children_peak_rss_mb': None})
+            total['calls'] += 1
+            total['wall'] += stage['wall']
+            total['cpu'] += stage['cpu']
+            if stage['rows'] is not None:
+                total['rows'] = (total['rows'] or 0) + stage['rows']
+            change = _change(stage['rss_start_mb'], stage['rss_end_mb'])
+            if change is not None:
+                total['rss_change_mb'] = (total['rss_change_mb'] or 0) + change
+            for key in ('peak_growth_mb', 'children_peak_rss_mb'):
+                total[key] = max((value for value in (total[key], stage[key]) if value is not None), default=None)
+        return list(totals.values())
+
+    def print_summary(self):
+        # CPU time and memory are this process's; worker processes only show in the last column,
+        # as the peak of a worker that set a new high during the stage
+        print(f"\n{'stage':<32} {'calls':>5} {'wall ms':>10} {'cpu ms':>10} {'rows':>10} "
+              f"{'RSS +MB':>9} {'peak +MB':>9} {'workers MB':>11}")
+        for total in self.summary():
+            rows = f"{total['rows']:>10,}" if total['rows'] is not None else f"{'-':>10}"
+            change = f"{total['rss_change_mb']:>+9.0f}" if total['rss_change_mb'] is not None else f"{'-':>9}"
+            growth = f"{total['peak_growth_mb']:>9.0f}" if total['peak_growth_mb'] is not None else f"{'-':>9}"
+            children = (f"{total['children_peak_rss_mb']:>11.0f}" if total['children_peak_rss_mb'] is not None
+                        else f"{'-':>11}")
+            print(f"{total['name']:<32} {total['calls']:>5} {total['wall'] * 1000:>10.1f} "
+                  f"{total['cpu'] * 1000:>10.1f} {rows} {change} {growth} {children}")
+
+    def write_trace(self, path=TRACE_FILE):
+        """
+        Write the stages in the Chrome trace event format.
+
+        The file opens in chrome://tracing or Perfetto; nested stages show as
+        nested slices. The per-stage measurements are also kept under "stages".
+        """
+        threads = {}
+        events = []
+        for stage in self.stages:
+            tid = threads.setdefault(stage['thread'], len(threads))
+            events.append({
+                'name': stage['name'],
+                'ph': 'X',
+                'ts': stage['start'] * 1e6,
+                'dur': stage['wall'] * 1e6,
+                'pid': os.getpid(),
+                'tid': tid,
+                'args': {'cpu_ms': stage['cpu'] * 1000, 'rows': stage['rows'],
+                         'rss_start_mb': stage['rss_start_mb'], 'rss_end_mb': stage['rss_end_mb'],
+                         'peak_growth_mb': stage['peak_growth_mb'],
+                         'children_peak_rss_mb': stage['children_peak_rss_mb'], **stage['args']},
+            })
+        doc = {'traceEvents': events, 'displayTimeUnit': 'ms', 'stages': self.stages, 'summary': self.summary()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, indent=1, default=str)
+
+def enable():
+    """Start recording stages; returns the profiler."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def disable():
+    global _profiler
+    _profiler = None
+
+def stage(name, **args):
+    """
+    Context manager timing one stage: wall time, CPU time, RSS and rows.
+
+        with stage('parse_report', path=file_path) as s:
+            df = ...
+            s.rows = len(df)
+
+    RSS is recorded at the start and end of the stage, along with how much
+    the stage raised the process's peak. CPU time and RSS are those of this
+    process; a worker process that set a new peak during the stage is
+    recorded separately. While profiling is off a shared no-op object is
+    returned.
+    """
+    if _profiler is None:
+        return _NULL_STAGE
+    return Stage(_profiler, name, args)
+
+def profiled(name=None):
+    """Decorator running a function as a stage named after it."""
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with Stage(_profiler, stage_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,156 @@
+import json
+import sqlite3
+
+# Length of the period prefix of a YYYY-MM-DD day
+PERIODS = {'day': 10, 'month': 7, 'year': 4}
+
+# Most rows a tool returns to the model
+MAX_ROWS = 50
+
+def _filters(subject=None, department=None, start=None, end=None):
+    """WHERE clause over the daily summary tables; start is inclusive and end exclusive."""
+    conditions, params = [], []
+    if subject:
+        conditions.append("subject = ?")
+        params.append(subject)
+    if department:
+        conditions.append("department = ?")
+        params.append(department)
+    if start or end:
+        # Only needed to parse dates, so pandas isn't loaded for other queries
+        import pandas as pd
+    if start:
+        conditions.append("day >= ?")
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end:
+        conditions.append("day < ?")
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+    return (f" WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+def _limit(top_n, default):
+    return max(1, min(int(top_n or default), MAX_ROWS))
+
+def checkouts_by_subject(db, subject=None, period='month', start=None, end=None):
+    """Checkouts per period and subject, optionally for one subject and a date range."""
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+    where, params = _filters(subject=subject, start=start, end=end)
+    sql = (f"SELECT substr(day, 1, {PERIODS[period]}) AS period, subject, SUM(checkouts) AS checkouts "
+           f"FROM checkout_summary{where} GROUP BY period, subject ORDER BY period, checkouts DESC")
+    rows = db.execute(sql, params).fetchall()
+    if not subject and len(rows) > MAX_ROWS:
+        # Across all subjects, only the largest ones of each period fit
+        rows = sorted(rows, key=lambda row: -row[2])[:MAX_ROWS]
+        rows.sort(key=lambda row: (row[0], -row[2]))
+    return [{'period': p, 'subject': s, 'checkouts': c} for p, s, c in rows]
+
+def busiest_hours(db, subject=None, department=None, start=None, end=None, top_n=5):
+    """Hours of the day with the most checkouts."""
+    where, params = _filters(subject=subject, department=department, start=start, end=end)
+    sql = (f"SELECT hour, SUM(checkouts) AS checkouts FROM checkout_summary{where} "
+           f"GROUP BY hour ORDER BY checkouts DESC LIMIT ?")
+    rows = db.execute(sql, params + [_limit(top_n, 5)]).fetchall()
+    return [{'hour': f"{hour}:00", 'checkouts': checkouts} for hour, checkouts in rows]
+
+def top_titles(db, subject=None, start=None, end=None, top_n=10):
+    """Most borrowed titles, optionally within a subject and a date range."""
+    where, params = _filters(subject=subject, start=start, end=end)
+    sql = (f"SELECT title, subject, SUM(checkouts) AS checkouts FROM title_summary{where} "
+           f"GROUP BY title, subject ORDER BY checkouts DESC LIMIT ?")
+    rows = db.execute(sql, params + [_limit(top_n, 10)]).fetchall()
+    return [{'title': title, 'subject': s, 'checkouts': c} for title, s, c in rows]
+
+def department_preferences(db, department=None, start=None, end=None, top_n=5):
+    """Most borrowed subjects of each department, or of one department."""
+    where, params = _filters(department=department, start=start, end=end)
+    sql = (f"SELECT department, subject, SUM(checkouts) AS checkouts FROM checkout_summary{where} "
+           f"GROUP BY department, subject ORDER BY department, checkouts DESC")
+    top_n = _limit(top_n, 5)
+    preferences = {}
+    for dept, subject, checkouts in db.execute(sql, params):
+        subjects = preferences.setdefault(dept, [])
+        if len(subjects) < top_n:
+            subjects.append({'subject': subject, 'checkouts': checkouts})
+
+    # Busiest departments first
+    ranked = sorted(preferences.items(), key=lambda item: -sum(s['checkouts'] for s in item[1]))
+    return [{'department': dept, 'subjects': subjects} for dept, subjects in ranked[:MAX_ROWS]]
+
+def list_values(db, column):
+    """Distinct subjects or departments, to match names the user gives."""
+    if column not in ('subject', 'department'):
+        raise ValueError("column must be 'subject' or 'department'")
+    rows = db.execute(f"SELECT DISTINCT {column} FROM checkout_summary WHERE {column} IS NOT NULL ORDER BY {column}")
+    return [value for value, in rows]
+
+FUNCTIONS = {
+    'checkouts_by_subject': checkouts_by_subject,
+    'busiest_hours': busiest_hours,
+    'top_titles': top_titles,
+    'department_preferences': department_preferences,
+    'list_values': list_values,
+}
+
+_DATE_RANGE = {
+    'start': {'type': 'string', 'description': "First day included, YYYY-MM-DD"},
+    'end': {'type': 'string', 'description': "First day excluded, YYYY-MM-DD"},
+}
+
+# Function schemas in the OpenAI tools format
+TOOLS = [
+    {'type': 'function', 'function': {
+        'name': 'checkouts_by_subject',
+        'description': "Number of checkouts per period (day, month or year) and subject.",
+        'parameters': {'type': 'object', 'properties': {
+            'subject': {'type': 'string', 'description': "Only this subject"},
+            'period': {'type': 'string', 'enum': list(PERIODS)},
+            **_DATE_RANGE}}}},
+    {'type': 'function', 'function': {
+        'name': 'busiest_hours',
+        'description': "Hours of the day with the most checkouts.",
+        'parameters': {'type': 'object', 'properties': {
+            'subject': {'type': 'string'},
+            'department': {'type': 'string'},
+            'top_n': {'type': 'integer'},
+            **_DATE_RANGE}}}},
+    {'type': 'function', 'function': {
+        'name': 'top_titles',
+        'description': "Most borrowed book titles.",
+        'parameters': {'type': 'object', 'properties': {
+            'subject': {'type': 'string'},
+            'top_n': {'type': 'integer'},
+            **_DATE_RANGE}}}},
+    {'type': 'function', 'function': {
+        'name': 'department_preferences',
+        'description': "Subjects each department borrows most.",
+        'parameters': {'type': 'object', 'properties': {
+            'department': {'type': 'string'},
+            'top_n': {'type': 'integer'},
+            **_DATE_RANGE}}}},
+    {'type': 'function', 'function': {
+        'name': 'list_values',
+        'description': "Exact names of the subjects or departments in the data.",
+        'parameters': {'type': 'object', 'properties': {
+            'column': {'type': 'string', 'enum': ['subject', 'department']}},
+            'required': ['column']}}},
+]
+
+def run_tool(db, name, arguments):
+    """
+    Run a tool call from the model.
+
+    Args:
+        db: Circulation store connection
+        name: Function name from TOOLS
+        arguments: JSON object string of its arguments
+
+    Returns:
+        result: JSON string, with an "error" key if the call failed
+    """
+    if name not in FUNCTIONS:
+        return json.dumps({'error': f"Unknown tool '{name}'"})
+    try:
+        kwargs = json.loads(arguments or '{}')
+        return json.dumps({'result': FUNCTIONS[name](db, **kwargs)})
+    except (TypeError, ValueError, sqlite3.Error) as e:
+        return json.dumps({'error': str(e)})
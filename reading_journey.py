@@ -1,42 +1,181 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-from collections import Counter, defaultdict
-from data_utils import load_and_prepare_data
+import heapq
+from collections import Counter, defaultdict, namedtuple
+from data_utils import AnalysisContext, as_datetime
+from plotting import plot_spec, render_all
 
-# Create directories for plots
-os.makedirs('plots/reading_journeys', exist_ok=True)
+# Paths are counted in a dense array indexed by path code while it has at most this many slots
+DENSE_PATH_LIMIT = 1 << 20
 
-# Load data
-df, checkouts = load_and_prepare_data()
+# Paths with more possible codes than this are keyed by subject-code tuples instead of one int64
+MAX_PATH_CODE = np.iinfo(np.int64).max
 
-def analyze_reading_journeys():
-    # Track patron reading sequences
-    patron_sequences = defaultdict(list)
-    
-    # Group by patron ID (2nd column in data) and sort by date
-    for patron_id in df.iloc[:, 1].unique():
-        patron_df = df[df.iloc[:, 1] == patron_id].sort_values('Date')
-        # Only include checkout transactions
-        checkout_df = patron_df[patron_df['Transaction'] == 'Check out']
-        
-        if len(checkout_df) > 1:  # Only consider patrons with multiple checkouts
-            subjects = checkout_df['Subject'].tolist()
-            patron_sequences[patron_id] = subjects
+# Sorted checkouts are mined in chunks of about this many rows, split between sequences
+CHUNK_SIZE = 100000
+
+PatronSequences = namedtuple('PatronSequences', ['patrons', 'subjects', 'dates', 'subject_names'])
+
+def patron_checkout_sequences(df, checkouts):
+    """
+    Order checkouts by patron, then date, in one stable sort.
+
+    Patrons are numbered in order of their first transaction in df, so
+    sequences come out in the same order as looping over df's card numbers.
+
+    Args:
+        df: All transactions
+        checkouts: Checkout transactions with a Subject column
+
+    Returns:
+        PatronSequences: Patron codes, subject codes and dates of the sorted
+        checkouts, and the subject name of each subject code
+    """
+    # Patron ID is in the 2nd column; checkouts without a card number are ignored
+    patron_ids = pd.Index(pd.unique(df.iloc[:, 1].dropna()))
+    patrons = patron_ids.get_indexer(checkouts.iloc[:, 1])
+    subjects, subject_names = pd.factorize(checkouts['Subject'])
+    dates = as_datetime(checkouts['Date']).to_numpy()
+
+    known = patrons >= 0
+    patrons, subjects, dates = patrons[known], subjects[known], dates[known]
+
+    # lexsort is stable, so checkouts with equal dates keep their file order
+    order = np.lexsort((dates, patrons))
+    return PatronSequences(patrons[order], subjects[order], dates[order], list(subject_names))
+
+def mine_reading_paths(sequences, n=3, min_support=1, top_k=10, collapse_repeats=False,
+                       session_gap=None, chunk_size=CHUNK_SIZE):
+    """
+    Find the most common paths of n consecutive subjects in patron sequences.
+
+    Sequences are streamed in chunks and each path is encoded as one integer,
+    counted in a dense array when the number of possible paths is small and
+    in a dict of the distinct paths otherwise; long paths whose codes would
+    overflow int64 are keyed by tuples of subject codes. The top paths come
+    from a bounded heap, so memory depends on the number of distinct paths,
+    not on the number of patrons.
+
+    Args:
+        sequences: PatronSequences from patron_checkout_sequences
+        n: Number of subjects in a path
+        min_support: Drop paths seen fewer times than this
+        top_k: Number of paths to return, or None for all of them
+        collapse_repeats: Treat consecutive checkouts of the same subject as one
+        session_gap: Start a new sequence when a patron's consecutive checkouts
+            are further apart than this (a pd.Timedelta or string like '30D')
+        chunk_size: Approximate number of checkouts mined at a time
+
+    Returns:
+        paths: List of (subject name tuple, count), most common first with
+        ties in order of first occurrence
+    """
+    patrons, subjects, dates = sequences.patrons, sequences.subjects, sequences.dates
+    n_subjects = max(len(sequences.subject_names), 1)
+
+    # Number the sequences: a new one starts at every patron change or session gap
+    starts = np.ones(len(patrons), dtype=bool)
+    starts[1:] = patrons[1:] != patrons[:-1]
+    if session_gap is not None:
+        starts[1:] |= (dates[1:] - dates[:-1]) > pd.Timedelta(session_gap).to_timedelta64()
+    sequence_ids = np.cumsum(starts)
+
+    if collapse_repeats:
+        keep = starts.copy()
+        keep[1:] |= subjects[1:] != subjects[:-1]
+        sequence_ids, subjects = sequence_ids[keep], subjects[keep]
+        starts = starts[keep]
+
+    dense = n_subjects ** n <= DENSE_PATH_LIMIT
+    if dense:
+        counts = np.zeros(n_subjects ** n, dtype=np.int64)
+        first_seen = np.full(n_subjects ** n, np.iinfo(np.int64).max, dtype=np.int64)
+    else:
+        counts, first_seen = {}, {}
+
+    # Chunk boundaries fall on sequence starts so no path is split
+    sequence_starts = np.flatnonzero(starts)
+    chunk_start = 0
+    while chunk_start < len(subjects):
+        next_start = np.searchsorted(sequence_starts, chunk_start + chunk_size)
+        chunk_end = sequence_starts[next_start] if next_start < len(sequence_starts) else len(subjects)
+
+        keys, first_index, key_counts = _chunk_path_counts(sequence_ids[chunk_start:chunk_end],
+                                                           subjects[chunk_start:chunk_end], n, n_subjects)
+        first_index += chunk_start
+        if dense:
+            counts[keys] += key_counts
+            first_seen[keys] = np.minimum(first_seen[keys], first_index)
+        else:
+            keys = keys.tolist() if keys.ndim == 1 else [tuple(key) for key in keys.tolist()]
+            for key, first, count in zip(keys, first_index.tolist(), key_counts.tolist()):
+                counts[key] = counts.get(key, 0) + count
+                first_seen.setdefault(key, first)
+        chunk_start = chunk_end
+
+    if dense:
+        candidates = np.flatnonzero(counts >= max(min_support, 1))
+        candidates = zip(candidates.tolist(), counts[candidates].tolist(), first_seen[candidates].tolist())
+    else:
+        candidates = ((key, count, first_seen[key]) for key, count in counts.items() if count >= min_support)
+
+    rank = lambda candidate: (candidate[1], -candidate[2])
+    if top_k is None:
+        top = sorted(candidates, key=rank, reverse=True)
+    else:
+        top = heapq.nlargest(top_k, candidates, key=rank)
+
+    return [(_decode_path(key, n, n_subjects, sequences.subject_names), count) for key, count, _ in top]
+
+def _chunk_path_counts(sequence_ids, subjects, n, n_subjects):
+    """
+    Return the distinct path codes in a chunk with their first index and count.
+
+    Codes are int64 while n_subjects ** n fits in one; beyond that each path
+    is a row of n subject codes.
+    """
+    windows = len(subjects) - n + 1
+    if windows <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # A window is a path when all n checkouts belong to the same sequence
+    valid = sequence_ids[n - 1:] == sequence_ids[:windows]
+    window_starts = np.flatnonzero(valid)
+    if n_subjects ** n > MAX_PATH_CODE:
+        paths = np.stack([subjects[window_starts + offset] for offset in range(n)], axis=1)
+        keys, first_index, counts = np.unique(paths, axis=0, return_index=True, return_counts=True)
+        return keys, window_starts[first_index].astype(np.int64), counts
+
+    keys = np.zeros(len(window_starts), dtype=np.int64)
+    for offset in range(n):
+        keys = keys * n_subjects + subjects[window_starts + offset]
+
+    keys, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+    return keys, window_starts[first_index].astype(np.int64), counts
+
+def _decode_path(key, n, n_subjects, subject_names):
+    if isinstance(key, tuple):
+        return tuple(subject_names[code] for code in key)
+    path = []
+    for _ in range(n):
+        key, code = divmod(key, n_subjects)
+        path.append(subject_names[code])
+    return tuple(reversed(path))
+
+def analyze_reading_journeys(ctx):
+    df, checkouts = ctx.df, ctx.checkouts
+
+    # Track patron reading sequences, sorted by patron and date in one pass
+    sequences = patron_checkout_sequences(df, checkouts)
     
     # Analyze transitions between subjects
     transitions = defaultdict(Counter)
-    for patron, sequence in patron_sequences.items():
-        for i in range(len(sequence)-1):
-            from_subject = sequence[i]
-            to_subject = sequence[i+1]
-            transitions[from_subject][to_subject] += 1
+    for (from_subject, to_subject), count in mine_reading_paths(sequences, n=2, top_k=None):
+        transitions[from_subject][to_subject] = count
     
     # Get top subjects for visualization
-    all_subjects = df['Subject'].unique()
-    subject_counts = df[df['Transaction'] == 'Check out']['Subject'].value_counts()
+    subject_counts = checkouts['Subject'].value_counts()
     top_subjects = subject_counts.nlargest(8).index.tolist()
     
     # Create transition matrix
@@ -46,55 +185,30 @@ def analyze_reading_journeys():
             if from_subj in transitions and to_subj in transitions[from_subj]:
                 transition_matrix.loc[from_subj, to_subj] = transitions[from_subj][to_subj]
     
-    # Plot transition heatmap
-    plt.figure(figsize=(12, 10))
-    sns.heatmap(transition_matrix, annot=True, cmap='YlGnBu', fmt='d')
-    plt.title('Reading Journey Transitions Between Subjects')
-    plt.tight_layout()
-    plt.savefig('plots/reading_journeys/transition_heatmap.png', dpi=300)
-    plt.close()
-    
-    # Calculate transition probabilities
-    prob_matrix = transition_matrix.copy()
-    for i, row in prob_matrix.iterrows():
-        row_sum = row.sum()
-        if row_sum > 0:
-            prob_matrix.loc[i] = row / row_sum
-    
-    # Plot probability heatmap
-    plt.figure(figsize=(12, 10))
-    sns.heatmap(prob_matrix, annot=True, cmap='YlGnBu', fmt='.2f')
-    plt.title('Reading Journey Transition Probabilities')
-    plt.tight_layout()
-    plt.savefig('plots/reading_journeys/transition_probabilities.png', dpi=300)
-    plt.close()
-    
     # Identify common reading paths (sequences of 3 or more subjects)
-    reading_paths = []
-    for patron, sequence in patron_sequences.items():
-        if len(sequence) >= 3:
-            for i in range(len(sequence)-2):
-                path = (sequence[i], sequence[i+1], sequence[i+2])
-                reading_paths.append(path)
+    common_paths = mine_reading_paths(sequences, n=3, top_k=10)
     
-    path_counter = Counter(reading_paths)
-    common_paths = path_counter.most_common(10)
-    
-    # Plot common reading paths
-    path_labels = [' → '.join(path) for path, count in common_paths]
-    path_counts = [count for path, count in common_paths]
+    return transitions, transition_matrix, common_paths
+
+def reading_journey_plots(transitions, transition_matrix, common_paths):
+    """Plot specs for the results of analyze_reading_journeys"""
+    # Calculate transition probabilities, rows without transitions stay at zero
+    row_sums = transition_matrix.sum(axis=1)
+    prob_matrix = transition_matrix.astype(float).div(row_sums.where(row_sums > 0, 1), axis=0)
     
-    plt.figure(figsize=(14, 8))
-    plt.barh(path_labels, path_counts, color='teal')
-    plt.xlabel('Frequency')
-    plt.ylabel('Reading Path')
-    plt.title('Most Common Reading Paths (3-Subject Sequences)')
-    plt.tight_layout()
-    plt.savefig('plots/reading_journeys/common_paths.png', dpi=300)
-    plt.close()
+    path_counts = pd.Series([count for path, count in common_paths],
+                            index=[' → '.join(path) for path, count in common_paths])
     
-    return transitions, transition_matrix, common_paths
+    return [
+        plot_spec('plots/reading_journeys/transition_heatmap.png', 'heatmap', transition_matrix,
+                  'Reading Journey Transitions Between Subjects', figsize=(12, 10), cmap='YlGnBu', fmt='d'),
+        plot_spec('plots/reading_journeys/transition_probabilities.png', 'heatmap', prob_matrix,
+                  'Reading Journey Transition Probabilities', figsize=(12, 10), cmap='YlGnBu', fmt='.2f'),
+        plot_spec('plots/reading_journeys/common_paths.png', 'barh', path_counts,
+                  'Most Common Reading Paths (3-Subject Sequences)', 'Frequency', 'Reading Path', color='teal'),
+    ]
 
 if __name__ == "__main__":
-    transitions, transition_matrix, common_paths = analyze_reading_journeys()
+    transitions, transition_matrix, common_paths = analyze_reading_journeys(AnalysisContext.load())
+    render_all(reading_journey_plots(transitions, transition_matrix, common_paths))
     print("Reading journey analysis complete. Plots saved to plots/reading_journeys/")
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+from paths import CACHE_DIR
+
+# Aggregates and the keys of rendered figures are cached outside the tracked,
+# publicly served plots/ directory
+AGGREGATES_DIR = os.path.join(CACHE_DIR, 'aggregates')
+FIGURE_KEYS_DIR = os.path.join(CACHE_DIR, 'figures')
+MANIFEST_FILE = 'manifest.json'
+
+def content_hash(*objects):
+    """
+    Hash aggregates and plot parameters by content.
+
+    Frames and Series are hashed by their labels, dtypes and values, so an
+    equal aggregate recomputed in another run gets the same key.
+
+    Returns:
+        key: Short hex digest
+    """
+    h = hashlib.sha256()
+    for obj in objects:
+        _update_hash(h, obj)
+    return h.hexdigest()[:16]
+
+def _update_hash(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'frame')
+        h.update(repr((list(obj.columns), list(obj.columns.names), list(obj.index.names),
+                       [str(dtype) for dtype in obj.dtypes])).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b'series')
+        h.update(repr((obj.name, list(obj.index.names), str(obj.dtype))).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for key in sorted(obj, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f'{type(obj).__name__}{len(obj)}'.encode('utf-8'))
+        for item in obj:
+            _update_hash(h, item)
+    else:
+        h.update(repr(obj).encode('utf-8'))
+
+def sidecar_path(image_path):
+    """JSON file in FIGURE_KEYS_DIR with a figure's cache key and the data it shows."""
+    return os.path.join(FIGURE_KEYS_DIR, os.path.relpath(image_path) + '.json')
+
+def read_sidecar_key(image_path):
+    """Return the cache key a figure was rendered with, or None if it has to be rendered."""
+    path = sidecar_path(image_path)
+    if not os.path.exists(image_path) or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['key']
+    except (ValueError, KeyError):
+        return None
+
+def write_sidecar(image_path, key, spec):
+    """Record the key and the plotted data of a rendered figure."""
+    data = spec['data']
+    doc = {
+        'key': key,
+        'kind': spec['kind'],
+        'title': spec['title'],
+        'xlabel': spec['xlabel'],
+        'ylabel': spec['ylabel'],
+        'data': json.loads(data.to_json(orient='split', date_format='iso', default_handler=str)),
+    }
+    _write_atomic(sidecar_path(image_path), json.dumps(doc).encode('utf-8'))
+
+def save_aggregates(results, directory=AGGREGATES_DIR):
+    """
+    Store analysis results by name, rewriting only the ones whose content changed.
+
+    Args:
+        results: Dict of aggregate name to frame, Series, list or dict
+        directory: Where the aggregates and their manifest of keys are kept
+
+    Returns:
+        changed: Names of the aggregates that were written
+    """
+    manifest = _read_manifest(directory)
+    changed = []
+    for name, value in results.items():
+        key = content_hash(value)
+        if manifest.get(name) == key and os.path.exists(os.path.join(directory, f'{name}.pkl')):
+            continue
+        _write_atomic(os.path.join(directory, f'{name}.pkl'), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        manifest[name] = key
+        changed.append(name)
+
+    if changed:
+        _write_atomic(os.path.join(directory, MANIFEST_FILE), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return changed
+
+def load_aggregates(directory=AGGREGATES_DIR, names=None):
+    """Load stored aggregates by name, all of those in the manifest unless names are given."""
+    manifest = _read_manifest(directory)
+    if not manifest:
+        raise FileNotFoundError(f"No cached aggregates in {directory}, run the aggregation first")
+
+    results = {}
+    for name in names or manifest:
+        with open(os.path.join(directory, f'{name}.pkl'), 'rb') as f:
+            results[name] = pickle.load(f)
+    return results
+
+def aggregate_keys(directory=AGGREGATES_DIR):
+    """Content keys of the stored aggregates by name."""
+    return _read_manifest(directory)
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError as e:
+        print(f"Ignoring unreadable aggregate manifest {path}: {e}")
+        return {}
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
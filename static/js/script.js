@@ -46,21 +46,17 @@ document.addEventListener("DOMContentLoaded", () => {
       // Show loading indicator
       const loadingMessage = addLoadingMessage()
   
-      // Send message to server
+      // Send message to server and show the answer as it streams in
       fetch("/chat", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ message: message }),
+        body: JSON.stringify({ message: message, stream: true }),
       })
-        .then((response) => response.json())
-        .then((data) => {
-          // Remove loading indicator
-          loadingMessage.remove()
-  
-          // Add assistant response
-          addMessage("assistant", data.response)
+        .then((response) => {
+          if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`)
+          return readEventStream(response.body, loadingMessage)
         })
         .catch((error) => {
           console.error("Error:", error)
@@ -69,6 +65,42 @@ document.addEventListener("DOMContentLoaded", () => {
         })
     }
   
+    async function readEventStream(body, loadingMessage) {
+      const reader = body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+      let assistantMessage = null
+  
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+  
+        // Events are separated by a blank line
+        const events = buffer.split("\n\n")
+        buffer = events.pop()
+        for (const event of events) {
+          const dataLine = event.split("\n").find((line) => line.startsWith("data: "))
+          if (!dataLine) continue
+          const data = dataLine.slice(6)
+          if (data === "[DONE]") return
+  
+          // Replace the loading indicator with the answer on its first piece
+          if (!assistantMessage) {
+            loadingMessage.remove()
+            assistantMessage = addMessage("assistant", "")
+          }
+          assistantMessage.querySelector(".message-content").textContent += JSON.parse(data).text
+          chatMessages.scrollTop = chatMessages.scrollHeight
+        }
+      }
+  
+      if (!assistantMessage) {
+        loadingMessage.remove()
+        addMessage("assistant", "Sorry, something went wrong. Please try again.")
+      }
+    }
+  
     function uploadImage() {
       const file = imageUpload.files[0]
       if (!file) return
@@ -139,16 +171,14 @@ document.addEventListener("DOMContentLoaded", () => {
       })
       .then(response => response.json())
       .then(data => {
-          // Remove loading indicator
-          loadingMessage.remove();
-          
           if (data.error) {
+              loadingMessage.remove();
               addMessage('assistant', `Error: ${data.error}`);
               return;
           }
           
-          // Add assistant response with confirmation
-          addMessage('assistant', data.response);
+          // The file is loaded in the background, poll until it is done
+          return pollUpload(data.status_url, loadingMessage);
       })
       .catch(error => {
           console.error('Error:', error);
@@ -160,6 +190,25 @@ document.addEventListener("DOMContentLoaded", () => {
       csvUpload.value = '';
   }
   
+    function pollUpload(statusUrl, loadingMessage) {
+      return fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+          if (job.error && !job.state) throw new Error(job.error);
+          
+          if (job.state === 'queued' || job.state === 'running') {
+            const content = loadingMessage.querySelector('.message-content');
+            content.firstChild.textContent = `Loading ${Math.round(job.progress * 100)}% `;
+            return new Promise(resolve => setTimeout(resolve, 1000))
+              .then(() => pollUpload(statusUrl, loadingMessage));
+          }
+          
+          // Add assistant response with confirmation
+          loadingMessage.remove();
+          addMessage('assistant', job.response);
+        });
+    }
+  
     function resetConversation() {
       // Clear chat messages except the first welcome message
       while (chatMessages.children.length > 1) {
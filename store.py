@@ -0,0 +1,293 @@
+import os
+import glob
+import sqlite3
+from paths import CACHE_DIR, DATA_DIR, REPORT_PATTERN
+
+# pandas and data_utils are imported where they are used, so the web app can
+# open the store and answer queries without loading them at startup
+
+# group_counts and query_rows serve the web app (/api/counts, the chat context
+# and query tools). The batch analyses in main.py still group the frames of
+# their AnalysisContext: those cover the one report or date range being
+# analysed, while the store always holds every report and upload.
+
+# Local database the circulation reports are ingested into
+DB_FILE = os.path.join(CACHE_DIR, 'circulation.db')
+
+# Rows inserted per transaction
+BATCH_SIZE = 5000
+
+# Columns that can be grouped or filtered on, and the SQL behind each
+QUERY_COLUMNS = {
+    'Date': 'date',
+    'Card Number': 'card_number',
+    'Department': 'department',
+    'Category': 'category',
+    'Transaction': 'txn',
+    'Barcode': 'barcode',
+    'Title': 'title',
+    'Subject': 'subject',
+    'Hour': 'hour',
+    'Day': 'day',
+    'Month': 'month',
+    'YearMonth': 'substr(date, 1, 7)',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS circulation (
+    date TEXT NOT NULL,
+    card_number TEXT,
+    name TEXT,
+    department TEXT,
+    category TEXT,
+    txn TEXT,
+    amount TEXT,
+    barcode TEXT,
+    title TEXT,
+    author TEXT,
+    homebranch TEXT,
+    holdingbranch TEXT,
+    subject TEXT,
+    hour INTEGER,
+    day TEXT,
+    month TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_circulation_date ON circulation (date);
+CREATE INDEX IF NOT EXISTS idx_circulation_card ON circulation (card_number, date);
+CREATE INDEX IF NOT EXISTS idx_circulation_barcode ON circulation (barcode, date);
+CREATE INDEX IF NOT EXISTS idx_circulation_subject ON circulation (subject, date);
+CREATE TABLE IF NOT EXISTS reports (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+"""
+
+# Checkout counts precomputed by refresh_summaries for the chat query tools;
+# bump the version when their layout changes so existing stores rebuild them.
+# They group by the date expression: a bare "day" would be circulation's weekday column
+SUMMARY_VERSION = 2
+SUMMARY_SCHEMA = """
+DROP TABLE IF EXISTS checkout_summary;
+CREATE TABLE checkout_summary AS
+    SELECT substr(date, 1, 10) AS day, hour, subject, department, COUNT(*) AS checkouts
+    FROM circulation WHERE txn = 'Check out'
+    GROUP BY substr(date, 1, 10), hour, subject, department;
+CREATE INDEX idx_checkout_summary_day ON checkout_summary (day);
+CREATE INDEX idx_checkout_summary_subject ON checkout_summary (subject, day);
+CREATE INDEX idx_checkout_summary_department ON checkout_summary (department, day);
+DROP TABLE IF EXISTS title_summary;
+CREATE TABLE title_summary AS
+    SELECT substr(date, 1, 10) AS day, title, subject, COUNT(*) AS checkouts
+    FROM circulation WHERE txn = 'Check out' AND title IS NOT NULL
+    GROUP BY substr(date, 1, 10), title, subject;
+CREATE INDEX idx_title_summary_day ON title_summary (day);
+CREATE INDEX idx_title_summary_subject ON title_summary (subject, day);
+"""
+
+# Frame columns of the circulation table's columns, in table order
+FRAME_COLUMNS = ['Date', 'Card Number', 'Name', 'Department', 'Category', 'Transaction', 'Amount', 'Barcode',
+                 'Title', 'Author', 'homebranch', 'holdingbranch', 'Subject', 'Hour', 'Day', 'Month', 'Source']
+
+INSERT = """
+INSERT INTO circulation (date, card_number, name, department, category, txn, amount, barcode,
+                         title, author, homebranch, holdingbranch, subject, hour, day, month, source)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def connect(db_path=DB_FILE):
+    """Open the circulation database, creating its tables and indexes if needed."""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # Readers are not blocked while an upload is being written
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _report_signatures(data_dir):
+    signatures = {}
+    for file_path in sorted(glob.glob(os.path.join(data_dir, REPORT_PATTERN))):
+        stat = os.stat(file_path)
+        signatures[os.path.abspath(file_path)] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+def ingest_reports(conn, data_dir=DATA_DIR, force=False):
+    """
+    Load the semiannual reports in data_dir into the database.
+
+    The reports are combined with load_all_reports, so rows repeated across
+    overlapping reports are stored once. Nothing is done when the reports
+    have not changed since the last ingest. The old rows are replaced and
+    the report signatures written in one transaction, so an ingest that
+    fails part way leaves the previous rows and is retried next time.
+
+    Returns:
+        rows: Number of rows written, 0 if the database was up to date
+    """
+    signatures = _report_signatures(data_dir)
+    stored = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute("SELECT path, size, mtime_ns FROM reports")}
+    if stored == signatures and not force:
+        return 0
+
+    from data_utils import load_all_reports
+    df, _ = load_all_reports(data_dir)
+    with conn:
+        conn.execute("DELETE FROM circulation WHERE source = 'reports'")
+        rows = insert_rows(conn, df, 'reports')
+        conn.execute("DELETE FROM reports")
+        conn.executemany("INSERT INTO reports (path, size, mtime_ns) VALUES (?, ?, ?)",
+                         [(path, size, mtime_ns) for path, (size, mtime_ns) in signatures.items()])
+    refresh_summaries(conn)
+    return rows
+
+def refresh_summaries(conn):
+    """Rebuild the precomputed checkout summaries after rows were added or removed."""
+    with conn:
+        conn.executescript(SUMMARY_SCHEMA)
+        conn.execute(f"PRAGMA user_version = {SUMMARY_VERSION}")
+
+def has_summaries(conn):
+    """True when the summaries exist in the layout of SUMMARY_VERSION."""
+    return conn.execute("PRAGMA user_version").fetchone()[0] == SUMMARY_VERSION
+
+def rows_version(conn):
+    """Highest rowid and row count of the store; both change whenever rows are ingested or removed."""
+    return list(conn.execute("SELECT MAX(rowid), COUNT(*) FROM circulation").fetchone())
+
+def append_frame(conn, df, source, refresh=True):
+    """
+    Insert a parsed report frame in batched transactions.
+
+    Args:
+        conn: Connection from connect
+        df: Frame from the data_utils loaders
+        source: Label stored with the rows, e.g. the uploaded file name
+        refresh: Rebuild the summaries afterwards; pass False for all but the last chunk of a file
+
+    Returns:
+        rows: Number of rows inserted
+    """
+    rows = 0
+    for start in range(0, len(df), BATCH_SIZE):
+        with conn:
+            rows += insert_rows(conn, df.iloc[start:start + BATCH_SIZE], source)
+    if refresh:
+        refresh_summaries(conn)
+    return rows
+
+def insert_rows(conn, df, source, subjects=None):
+    """
+    Insert the rows of df without committing, so the caller decides the transaction.
+
+    Args:
+        conn: Connection from connect
+        df: Frame from the data_utils loaders
+        source: Label stored with the rows
+        subjects: Subjects of the rows from classify_titles, if already classified
+
+    Returns:
+        rows: Number of rows inserted
+    """
+    from data_utils import classify_titles, as_datetime
+    df = df.copy()
+    df['Subject'] = classify_titles(df['Title']) if subjects is None else subjects
+    df['Date'] = as_datetime(df['Date']).dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['Source'] = source
+
+    values = df[FRAME_COLUMNS].astype(object).where(df[FRAME_COLUMNS].notna(), None)
+
+    for start in range(0, len(values), BATCH_SIZE):
+        conn.executemany(INSERT, values.iloc[start:start + BATCH_SIZE].itertuples(index=False, name=None))
+    return len(values)
+
+def iter_report_frames(conn, chunk_rows=50000):
+    """
+    Read every stored row back in date order, chunk_rows at a time.
+
+    Yields:
+        chunk: Frame with the columns of FRAME_COLUMNS, typed like the chunks
+            of data_utils.iter_report_chunks, so the report columns come
+            first in their usual order
+    """
+    import pandas as pd
+    cursor = conn.execute("SELECT date, card_number, name, department, category, txn, amount, barcode, title, "
+                          "author, homebranch, holdingbranch, subject, hour, day, month, source "
+                          "FROM circulation ORDER BY date")
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        chunk = pd.DataFrame(rows, columns=FRAME_COLUMNS)
+        for column in FRAME_COLUMNS:
+            if column not in ('Date', 'Hour'):
+                chunk[column] = chunk[column].astype('str')
+        chunk['Date'] = pd.to_datetime(chunk['Date'])
+        chunk['Hour'] = chunk['Hour'].astype('int64')
+        yield chunk
+
+def _where_clause(transaction=None, start=None, end=None, filters=None):
+    """Build a WHERE clause and its parameters; start is inclusive and end exclusive."""
+    import pandas as pd
+    conditions, params = [], []
+    if transaction is not None:
+        conditions.append("txn = ?")
+        params.append(transaction)
+    if start is not None:
+        conditions.append("date >= ?")
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+    if end is not None:
+        conditions.append("date < ?")
+        params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+    for column, value in (filters or {}).items():
+        conditions.append(f"{QUERY_COLUMNS[column]} = ?")
+        params.append(value)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+def group_counts(conn, by, transaction=None, start=None, end=None, filters=None, limit=None):
+    """
+    Count rows grouped by some columns, with the grouping done in the database.
+
+    Args:
+        conn: Connection from connect
+        by: Column name or list of names from QUERY_COLUMNS
+        transaction: Only count this transaction type, e.g. 'Check out'
+        start, end: Optional [start, end) date range
+        filters: Dict of column name to required value
+        limit: Keep only the largest groups
+
+    Returns:
+        counts: DataFrame with the group columns and a 'count' column, largest first
+    """
+    import pandas as pd
+    by = [by] if isinstance(by, str) else list(by)
+    for column in by + list(filters or {}):
+        if column not in QUERY_COLUMNS:
+            raise ValueError(f"Unknown column '{column}', expected one of {', '.join(QUERY_COLUMNS)}")
+
+    select = ', '.join(QUERY_COLUMNS[column] for column in by)
+    where, params = _where_clause(transaction, start, end, filters)
+    sql = f"SELECT {select}, COUNT(*) FROM circulation{where} GROUP BY {select} ORDER BY COUNT(*) DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    return pd.DataFrame(conn.execute(sql, params).fetchall(), columns=by + ['count'])
+
+def query_rows(conn, transaction=None, start=None, end=None, filters=None, limit=100):
+    """Return matching rows in date order, e.g. the history of one barcode or card number."""
+    import pandas as pd
+    for column in filters or {}:
+        if column not in QUERY_COLUMNS:
+            raise ValueError(f"Unknown column '{column}', expected one of {', '.join(QUERY_COLUMNS)}")
+
+    where, params = _where_clause(transaction, start, end, filters)
+    cursor = conn.execute(f"SELECT * FROM circulation{where} ORDER BY date LIMIT ?", params + [int(limit)])
+    return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+if __name__ == "__main__":
+    conn = connect()
+    rows = ingest_reports(conn, force=True)
+    print(f"Ingested {rows} rows into {DB_FILE}")
@@ -0,0 +1,486 @@
+import os
+import json
+import heapq
+import base64
+import numpy as np
+import pandas as pd
+
+# Count-Min table size: estimates exceed the true count by at most
+# e / WIDTH of the stream's total, with probability 1 - exp(-DEPTH)
+CMS_WIDTH = 4096
+CMS_DEPTH = 5
+
+# HyperLogLog registers are 2**HLL_PRECISION; standard error is 1.04 / sqrt(2**p), 1.6% at 12
+HLL_PRECISION = 12
+
+# Heavy hitters kept per sketch
+TOP_K = 50
+
+# Hours of counts kept by the sliding window
+WINDOW_HOURS = 24
+
+# Transactions added one at a time are buffered and folded in batches of this size
+FLUSH_ROWS = 1000
+
+def _key_string(value):
+    if isinstance(value, (float, np.floating)) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def key_strings(values):
+    """
+    Values as the strings the sketches count them under.
+
+    Integral floats become integer strings, so barcode 123 is the same key
+    whether its column was read as int, Int64 or, with missing values,
+    float ('123', not '123.0').
+    """
+    series = pd.Series(values)
+    if pd.api.types.is_float_dtype(series.dtype):
+        numbers = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        strings = numbers.astype(str).astype(object)
+        integral = np.isfinite(numbers) & (numbers == np.round(numbers)) & (np.abs(numbers) < 2**63)
+        strings[integral] = numbers[integral].astype(np.int64).astype(str)
+        return strings
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=False) != 'string':
+        # Mixed columns, e.g. numbers parsed one by one from JSON
+        return np.array([_key_string(value) for value in series.to_numpy()], dtype=object)
+    return series.astype(str).to_numpy(dtype=object)
+
+def hash_values(values):
+    """
+    Stable 64-bit hashes of values, compared as their key_strings.
+
+    The same in every process and run, unlike hash(), so sketches built on
+    different machines can be merged.
+    """
+    strings = key_strings(values)
+    return pd.util.hash_array(strings, categorize=len(strings) > 1000)
+
+def _encode(array):
+    return {'dtype': str(array.dtype), 'shape': list(array.shape),
+            'data': base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')}
+
+def _decode(doc):
+    return np.frombuffer(base64.b64decode(doc['data']), dtype=doc['dtype']).reshape(doc['shape']).copy()
+
+class CountMinSketch:
+    """
+    Approximate counts of keys in fixed memory.
+
+    Every key is counted in one cell of each row; its estimate is the smallest
+    of those cells, which never undercounts. Sketches of the same size merge
+    by adding their tables.
+    """
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _cells(self, hashes):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = (hashes & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        h2 = (hashes >> np.uint64(32)).astype(np.int64) | 1
+        return (h1[None, :] + np.arange(self.depth)[:, None] * h2[None, :]) % self.width
+
+    def add_hashes(self, hashes, counts=1):
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), hashes.shape)
+        cells = self._cells(hashes)
+        for row in range(self.depth):
+            np.add.at(self.table[row], cells[row], counts)
+        self.total += int(counts.sum())
+
+    def estimate_hashes(self, hashes):
+        cells = self._cells(hashes)
+        return self.table[np.arange(self.depth)[:, None], cells].min(axis=0)
+
+    def add(self, keys, counts=1):
+        self.add_hashes(hash_values(keys), counts)
+
+    def estimate(self, keys):
+        return self.estimate_hashes(hash_values(keys))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches of different sizes can't be merged")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {'width': self.width, 'depth': self.depth, 'total': self.total, 'table': _encode(self.table)}
+
+    @classmethod
+    def from_dict(cls, doc):
+        sketch = cls(doc['width'], doc['depth'])
+        sketch.table = _decode(doc['table'])
+        sketch.total = doc['total']
+        return sketch
+
+class HeavyHitters:
+    """
+    The k most frequent keys of a stream: a Count-Min sketch and a min-heap.
+
+    The heap holds the current top k keys by estimated count. A key enters
+    when its estimate beats the smallest one in the heap. A key's entry is
+    pushed again whenever its estimate grows, and outdated entries are
+    dropped when they reach the top of the heap.
+    """
+
+    def __init__(self, k=TOP_K, width=CMS_WIDTH, depth=CMS_DEPTH):
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        self.k = k
+        self.counts = CountMinSketch(width, depth)
+        # Key -> latest estimate, and (estimate, key) heap entries, some of them stale
+        self.top = {}
+        self.heap = []
+
+    def add(self, keys, counts=1):
+        """Count one key or a batch of keys, with optional counts per key."""
+        keys = pd.Series([keys] if isinstance(keys, str) else keys)
+        counts = pd.Series(np.broadcast_to(np.asarray(counts, dtype=np.int64), len(keys)), index=keys.index)
+        keep = keys.notna()
+        if not keep.any():
+            return
+        batch = counts[keep].groupby(key_strings(keys[keep]), sort=False).sum()
+
+        hashes = hash_values(batch.index)
+        self.counts.add_hashes(hashes, batch.to_numpy())
+        for key, estimate in zip(batch.index, self.counts.estimate_hashes(hashes)):
+            self._offer(key, int(estimate))
+
+    def _offer(self, key, estimate):
+        if key in self.top:
+            self.top[key] = estimate
+            heapq.heappush(self.heap, (estimate, key))
+            return
+        if len(self.top) < self.k:
+            self.top[key] = estimate
+            heapq.heappush(self.heap, (estimate, key))
+            return
+
+        # Drop outdated entries until the top is the true minimum
+        while self.top.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        smallest, smallest_key = self.heap[0]
+        if estimate > smallest:
+            heapq.heappop(self.heap)
+            del self.top[smallest_key]
+            self.top[key] = estimate
+            heapq.heappush(self.heap, (estimate, key))
+
+        # Keep stale entries from piling up
+        if len(self.heap) > 4 * self.k:
+            self.heap = [(estimate, key) for key, estimate in self.top.items()]
+            heapq.heapify(self.heap)
+
+    def most_common(self, n=None):
+        """The top keys as (key, estimated count) pairs, largest first."""
+        ranked = sorted(self.top.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:n] if n is not None else ranked
+
+    def merge(self, other):
+        """Add another sketch's counts; the top keys are re-estimated from the merged counts."""
+        if self.k != other.k:
+            raise ValueError("Heavy hitters of different k can't be merged")
+        self.counts.merge(other.counts)
+        candidates = sorted(set(self.top) | set(other.top))
+        self.top, self.heap = {}, []
+        if candidates:
+            for key, estimate in zip(candidates, self.counts.estimate(candidates)):
+                self._offer(key, int(estimate))
+        return self
+
+    def to_dict(self):
+        return {'k': self.k, 'counts': self.counts.to_dict(), 'top': self.top}
+
+    @classmethod
+    def from_dict(cls, doc):
+        sketch = cls(doc['k'])
+        sketch.counts = CountMinSketch.from_dict(doc['counts'])
+        sketch.top = dict(doc['top'])
+        sketch.heap = [(estimate, key) for key, estimate in sketch.top.items()]
+        heapq.heapify(sketch.heap)
+        return sketch
+
+class HyperLogLog:
+    """
+    Approximate number of distinct values in 2**precision bytes.
+
+    Each register keeps the longest run of leading zeros seen among the
+    hashes routed to it. Sketches of the same precision merge by taking the
+    larger register.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values):
+        values = pd.Series([values] if isinstance(values, str) else values).dropna()
+        if len(values):
+            self.add_hashes(hash_values(values))
+
+    def add_hashes(self, hashes):
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Rank of the first set bit in the low 32 bits; exact in float64
+        low = (hashes & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        rank = (33 - np.frexp(low)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLogs of different precision can't be merged")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def to_dict(self):
+        return {'precision': self.precision, 'registers': _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, doc):
+        sketch = cls(doc['precision'])
+        sketch.registers = _decode(doc['registers'])
+        return sketch
+
+class SlidingWindowCounter:
+    """
+    Exact counts per key over the latest window_hours hours.
+
+    Counts are kept in hourly buckets; buckets older than the window,
+    measured from the latest hour seen, are dropped as new data arrives.
+    """
+
+    def __init__(self, window_hours=WINDOW_HOURS):
+        self.window_hours = window_hours
+        # Hours since the epoch -> key -> count
+        self.buckets = {}
+
+    def add(self, timestamps, keys, counts=1):
+        hours = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(timestamps))).to_numpy().astype('datetime64[h]')
+        frame = pd.DataFrame({'hour': hours.astype(np.int64),
+                              'key': key_strings(np.atleast_1d(np.asarray(keys, dtype=object))),
+                              'count': np.broadcast_to(np.asarray(counts, dtype=np.int64), len(hours))})
+        for (hour, key), count in frame.groupby(['hour', 'key'], sort=False)['count'].sum().items():
+            bucket = self.buckets.setdefault(int(hour), {})
+            bucket[key] = bucket.get(key, 0) + int(count)
+        self._expire()
+
+    def _expire(self):
+        if self.buckets:
+            latest = max(self.buckets)
+            for hour in [hour for hour in self.buckets if hour <= latest - self.window_hours]:
+                del self.buckets[hour]
+
+    def counts(self, hours=None):
+        """Counts per key over the latest hours of the window, all of it by default."""
+        if not self.buckets:
+            return {}
+        latest = max(self.buckets)
+        since = latest - min(hours or self.window_hours, self.window_hours)
+        totals = {}
+        for hour, bucket in self.buckets.items():
+            if hour > since:
+                for key, count in bucket.items():
+                    totals[key] = totals.get(key, 0) + count
+        return totals
+
+    def hourly(self):
+        """Counts as a frame of hours by keys."""
+        frame = pd.DataFrame.from_dict(self.buckets, orient='index').fillna(0).astype(np.int64).sort_index()
+        frame.index = pd.to_datetime(frame.index.to_numpy().astype('datetime64[h]'))
+        return frame
+
+    def merge(self, other):
+        for hour, bucket in other.buckets.items():
+            ours = self.buckets.setdefault(hour, {})
+            for key, count in bucket.items():
+                ours[key] = ours.get(key, 0) + count
+        self._expire()
+        return self
+
+    def to_dict(self):
+        return {'window_hours': self.window_hours, 'buckets': {str(hour): bucket for hour, bucket in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, doc):
+        counter = cls(doc['window_hours'])
+        counter.buckets = {int(hour): dict(bucket) for hour, bucket in doc['buckets'].items()}
+        return counter
+
+class CirculationSketch:
+    """
+    Live summary of a circulation feed in bounded memory.
+
+    Keeps the most borrowed titles and barcodes, the number of distinct
+    patrons overall and per department and subject, and hourly counts of
+    each transaction type over a sliding window. Keep one sketch per day or
+    branch and merge them for longer periods or the whole library.
+
+    Single transactions from add are buffered and folded in with the next
+    batch, at FLUSH_ROWS, or when the sketch is read, merged or saved.
+    """
+
+    def __init__(self, k=TOP_K, precision=HLL_PRECISION, window_hours=WINDOW_HOURS):
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        self.k = k
+        self.precision = precision
+        self.titles = HeavyHitters(k)
+        self.barcodes = HeavyHitters(k)
+        self.patrons = HyperLogLog(precision)
+        self.patrons_by_department = {}
+        self.patrons_by_subject = {}
+        self.transactions = SlidingWindowCounter(window_hours)
+        self.rows = 0
+        self.pending = []
+
+    def update(self, transactions):
+        """
+        Add a batch of transactions.
+
+        Args:
+            transactions: Frame with the report columns of data_utils; checkouts
+                without a Subject column are classified here
+        """
+        # Imported here so the sketches can be loaded and merged without the taxonomy
+        from data_utils import classify_titles
+
+        df = transactions
+        if not len(df):
+            return
+        checkouts = df[df['Transaction'].astype(str).str.contains('Check out', case=False, na=False)]
+        subjects = checkouts['Subject'] if 'Subject' in checkouts else classify_titles(checkouts['Title'])
+
+        self.titles.add(checkouts['Title'])
+        self.barcodes.add(checkouts['Barcode'])
+        self.transactions.add(df['Date'], df['Transaction'])
+
+        cards = df['Card Number']
+        has_card = cards.notna()
+        hashes = hash_values(cards[has_card])
+        self.patrons.add_hashes(hashes)
+        self._add_grouped(self.patrons_by_department, hashes, df.loc[has_card, 'Department'])
+        on_checkout = has_card[checkouts.index].to_numpy()
+        if on_checkout.any():
+            self._add_grouped(self.patrons_by_subject, hash_values(checkouts['Card Number'][on_checkout]),
+                              subjects[on_checkout])
+        self.rows += len(df)
+
+    def add(self, transaction):
+        """Add one transaction, given as a dict of report columns."""
+        self.pending.append(transaction)
+        if len(self.pending) >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Fold buffered transactions into the sketches."""
+        if self.pending:
+            pending, self.pending = self.pending, []
+            self.update(pd.DataFrame(pending))
+
+    def _add_grouped(self, sketches, hashes, groups):
+        groups = pd.Series(groups).astype(object).fillna('Unknown').astype(str).to_numpy()
+        for group in pd.unique(groups):
+            sketch = sketches.setdefault(group, HyperLogLog(self.precision))
+            sketch.add_hashes(hashes[groups == group])
+
+    def distinct_patrons(self, department=None, subject=None):
+        """Estimated distinct card numbers, overall or for one department or subject."""
+        self.flush()
+        if department is not None:
+            sketch = self.patrons_by_department.get(department)
+        elif subject is not None:
+            sketch = self.patrons_by_subject.get(subject)
+        else:
+            sketch = self.patrons
+        return sketch.count() if sketch is not None else 0
+
+    def top_titles(self, n=10):
+        """Most borrowed titles as (title, estimated checkouts) pairs."""
+        self.flush()
+        return self.titles.most_common(n)
+
+    def top_barcodes(self, n=10):
+        """Most borrowed items as (barcode, estimated checkouts) pairs."""
+        self.flush()
+        return self.barcodes.most_common(n)
+
+    def recent_transactions(self, hours=None):
+        """Transactions per type over the latest hours of the window."""
+        self.flush()
+        return self.transactions.counts(hours)
+
+    def merge(self, other):
+        """Fold another sketch, e.g. of another day or branch, into this one."""
+        # Checked up front, so a mismatch leaves this sketch unchanged
+        if self._sizes() != other._sizes():
+            raise ValueError("Circulation sketches of different sizes can't be merged")
+        self.flush()
+        other.flush()
+        self.titles.merge(other.titles)
+        self.barcodes.merge(other.barcodes)
+        self.patrons.merge(other.patrons)
+        for ours, theirs in ((self.patrons_by_department, other.patrons_by_department),
+                             (self.patrons_by_subject, other.patrons_by_subject)):
+            for group, sketch in theirs.items():
+                ours.setdefault(group, HyperLogLog(self.precision)).merge(sketch)
+        self.transactions.merge(other.transactions)
+        self.rows += other.rows
+        return self
+
+    def _sizes(self):
+        counts = self.titles.counts
+        return self.k, counts.width, counts.depth, self.precision, self.transactions.window_hours
+
+    def to_dict(self):
+        self.flush()
+        return {
+            'k': self.k,
+            'precision': self.precision,
+            'rows': self.rows,
+            'titles': self.titles.to_dict(),
+            'barcodes': self.barcodes.to_dict(),
+            'patrons': self.patrons.to_dict(),
+            'patrons_by_department': {group: sketch.to_dict() for group, sketch in self.patrons_by_department.items()},
+            'patrons_by_subject': {group: sketch.to_dict() for group, sketch in self.patrons_by_subject.items()},
+            'transactions': self.transactions.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, doc):
+        sketch = cls(doc['k'], doc['precision'])
+        sketch.rows = doc['rows']
+        sketch.titles = HeavyHitters.from_dict(doc['titles'])
+        sketch.barcodes = HeavyHitters.from_dict(doc['barcodes'])
+        sketch.patrons = HyperLogLog.from_dict(doc['patrons'])
+        sketch.patrons_by_department = {group: HyperLogLog.from_dict(d) for group, d in doc['patrons_by_department'].items()}
+        sketch.patrons_by_subject = {group: HyperLogLog.from_dict(d) for group, d in doc['patrons_by_subject'].items()}
+        sketch.transactions = SlidingWindowCounter.from_dict(doc['transactions'])
+        return sketch
+
+    def save(self, path):
+        """Write the sketch as JSON, replacing the file atomically."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
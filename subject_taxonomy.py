@@ -0,0 +1,214 @@
+import os
+import re
+import glob
+import json
+import hashlib
+import pandas as pd
+import numpy as np
+
+# Keyword taxonomy shipped with the code
+TAXONOMY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subject_taxonomy.json')
+
+class SubjectTaxonomy:
+    """
+    Versioned keyword taxonomy that maps book titles to subjects.
+
+    Subjects are tried in file order and a title gets the first subject with
+    a keyword contained in its lowercased text, "Other" if none match and
+    "Unknown" if the title is missing. Each subject's keywords are compiled
+    once into a single regex alternation.
+    """
+
+    def __init__(self, subjects, version=None):
+        """
+        Args:
+            subjects: List of (name, keywords) pairs in priority order
+            version: Version number recorded in the taxonomy file
+        """
+        self.subjects = [(name, list(keywords)) for name, keywords in subjects]
+        self.version = version
+        self.names = [name for name, _ in self.subjects] + ["Other", "Unknown"]
+        self.patterns = [re.compile('|'.join(re.escape(keyword.lower()) for keyword in keywords))
+                         for _, keywords in self.subjects]
+
+        # The cache key only depends on what changes a classification
+        canonical = json.dumps(self.subjects, separators=(',', ':'))
+        self.digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, path=TAXONOMY_FILE):
+        """Load a taxonomy from a JSON file."""
+        with open(path, encoding='utf-8') as f:
+            doc = json.load(f)
+        subjects = [(entry['name'], entry['keywords']) for entry in doc['subjects']]
+        return cls(subjects, doc.get('version'))
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'subjects': [{'name': name, 'keywords': keywords} for name, keywords in self.subjects],
+        }
+
+    def first_change(self, other):
+        """
+        Return the position of the first subject that differs from other.
+
+        A title whose subject under other sits before this position keeps it
+        under this taxonomy, because every subject up to it is unchanged.
+        """
+        for position, (ours, theirs) in enumerate(zip(self.subjects, other.subjects)):
+            if ours != theirs:
+                return position
+        return min(len(self.subjects), len(other.subjects))
+
+    def categorize(self, title):
+        """Categorize a single title."""
+        if pd.isna(title):
+            return "Unknown"
+
+        title = str(title).lower()
+        for (name, _), pattern in zip(self.subjects, self.patterns):
+            if pattern.search(title):
+                return name
+        return "Other"
+
+    def match(self, lowered_titles, start=0):
+        """
+        Return the subject position of each lowercased title.
+
+        Only subjects from start onwards are tried, for titles already known
+        not to match the ones before it. Titles matching none get the
+        position of "Other".
+        """
+        lowered_titles = pd.Series(lowered_titles, dtype=object)
+        positions = np.full(len(lowered_titles), len(self.subjects), dtype=np.int16)
+        remaining = np.arange(len(lowered_titles))
+
+        for position in range(start, len(self.subjects)):
+            if len(remaining) == 0:
+                break
+            # Earlier subjects take priority, so only test titles nothing has matched yet
+            matched = lowered_titles.iloc[remaining].str.contains(self.patterns[position]).to_numpy(dtype=bool)
+            positions[remaining[matched]] = position
+            remaining = remaining[~matched]
+
+        return positions
+
+    def classify(self, titles, cache_dir=None):
+        """
+        Categorize a whole column of titles at once.
+
+        Each distinct title is classified only once. With a cache_dir, the
+        title-to-subject map is kept on disk under the taxonomy digest. After
+        a taxonomy edit, only titles whose subject could have changed are
+        classified again; the rest are carried over from the previous map.
+
+        Args:
+            titles: Series of book titles
+            cache_dir: Directory for the on-disk title cache, or None
+
+        Returns:
+            subjects: Categorical Series of subjects aligned with titles
+        """
+        codes, unique_titles = pd.factorize(titles)
+        unique_titles = [str(title) for title in unique_titles]
+
+        known = _read_title_cache(self, cache_dir) if cache_dir else {}
+        positions = np.empty(len(unique_titles), dtype=np.int16)
+        missing = []
+        for index, title in enumerate(unique_titles):
+            name = known.get(title)
+            if name is None:
+                missing.append(index)
+            else:
+                positions[index] = self.names.index(name)
+
+        if missing:
+            missing = np.array(missing)
+            positions[missing] = self._classify_missing([unique_titles[i] for i in missing], cache_dir)
+            if cache_dir:
+                known.update((unique_titles[i], self.names[positions[i]]) for i in missing)
+                _write_title_cache(self, cache_dir, known)
+
+        # Missing titles are factorized to -1
+        row_codes = np.where(codes >= 0, positions[codes], self.names.index("Unknown"))
+        subjects = pd.Categorical.from_codes(row_codes, categories=self.names)
+        subjects = pd.Series(subjects, index=titles.index, name='Subject').cat.remove_unused_categories()
+
+        # Keep the alphabetical order group-bys on the old string column produced
+        return subjects.cat.reorder_categories(sorted(subjects.cat.categories))
+
+    def _classify_missing(self, titles, cache_dir):
+        """Classify titles absent from this taxonomy's cache, reusing the previous taxonomy's map if there is one."""
+        lowered = [title.lower() for title in titles]
+        previous = _read_previous_title_cache(self, cache_dir) if cache_dir else None
+        if previous is None:
+            return self.match(lowered)
+
+        previous_taxonomy, previous_titles = previous
+        unchanged_until = self.first_change(previous_taxonomy)
+
+        positions = np.empty(len(titles), dtype=np.int16)
+        to_match = []
+        for index, title in enumerate(titles):
+            name = previous_titles.get(title)
+            old_position = previous_taxonomy.names.index(name) if name is not None else None
+            if old_position is not None and old_position < unchanged_until:
+                positions[index] = old_position
+            else:
+                to_match.append(index)
+
+        # Titles the previous taxonomy placed at or after the first change can't match an earlier subject
+        reclassified = [i for i in to_match if titles[i] in previous_titles]
+        fresh = [i for i in to_match if titles[i] not in previous_titles]
+        if reclassified:
+            positions[reclassified] = self.match([lowered[i] for i in reclassified], start=unchanged_until)
+        if fresh:
+            positions[fresh] = self.match([lowered[i] for i in fresh])
+        return positions
+
+def _title_cache_file(taxonomy, cache_dir):
+    return os.path.join(cache_dir, f"{taxonomy.digest}.json")
+
+def _read_title_cache(taxonomy, cache_dir):
+    cache_file = _title_cache_file(taxonomy, cache_dir)
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            return json.load(f)['titles']
+    except (ValueError, KeyError) as e:
+        print(f"Ignoring unreadable subject cache {cache_file}: {e}")
+        return {}
+
+def _read_previous_title_cache(taxonomy, cache_dir):
+    """Return (taxonomy, title map) of the most recently written cache for another taxonomy, or None."""
+    current = _title_cache_file(taxonomy, cache_dir)
+    candidates = [path for path in glob.glob(os.path.join(cache_dir, '*.json')) if path != current]
+    for path in sorted(candidates, key=os.path.getmtime, reverse=True):
+        try:
+            with open(path, encoding='utf-8') as f:
+                doc = json.load(f)
+            previous = SubjectTaxonomy([(entry['name'], entry['keywords']) for entry in doc['taxonomy']['subjects']],
+                                       doc['taxonomy'].get('version'))
+            return previous, doc['titles']
+        except (ValueError, KeyError):
+            continue
+    return None
+
+def _write_title_cache(taxonomy, cache_dir, titles):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = _title_cache_file(taxonomy, cache_dir)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'taxonomy': taxonomy.to_dict(), 'titles': titles}, f)
+    os.replace(tmp_file, cache_file)
+
+    # Only the most recent other map is reused after an edit (see _read_previous_title_cache)
+    others = [path for path in glob.glob(os.path.join(cache_dir, '*.json')) if path != cache_file]
+    for path in sorted(others, key=os.path.getmtime, reverse=True)[1:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another process pruned it first
+            pass
@@ -1,84 +1,47 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-from data_utils import load_and_prepare_data
+from data_utils import AnalysisContext, MONTH_NAMES
+from plotting import plot_spec, render_all
 
-# Create directories for plots
-os.makedirs('plots/temporal_patterns', exist_ok=True)
+def analyze_temporal_patterns(ctx):
+    # Hour/Day/Month/Week are derived once when the data is loaded
+    checkouts = ctx.checkouts
 
-# Load data
-df, checkouts = load_and_prepare_data()
-
-def analyze_temporal_patterns():
-    # Extract time components
-    df['Hour'] = df['Date'].dt.hour
-    df['Day'] = df['Date'].dt.day_name()
-    df['Month'] = df['Date'].dt.month_name()
-    df['Week'] = df['Date'].dt.isocalendar().week
-    
     # Time of day patterns
-    checkouts['Hour'] = checkouts['Date'].dt.hour
-    checkouts['Day'] = checkouts['Date'].dt.day_name()
-    checkouts['Month'] = checkouts['Date'].dt.month_name()
-    checkouts['Week'] = checkouts['Date'].dt.isocalendar().week
-    
-    plt.figure(figsize=(14, 8))
-    hourly_checkouts.plot(kind='line', marker='o')
-    plt.title('Subject Popularity by Hour of Day')
-    plt.xlabel('Hour (24-hour format)')
-    plt.ylabel('Number of Checkouts')
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.legend(title='Subject', bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.tight_layout()
-    plt.savefig('plots/temporal_patterns/hourly_trends.png', dpi=300)
-    plt.close()
+    hourly_checkouts = checkouts.groupby(['Hour', 'Subject'], observed=True).size().unstack().fillna(0)
     
     # Monthly patterns
-    monthly_checkouts = checkouts.groupby(['Month', 'Subject']).size().unstack().fillna(0)
-    month_order = ['January', 'February', 'March', 'April', 'May', 'June']
+    monthly_checkouts = checkouts.groupby(['Month', 'Subject'], observed=True).size().unstack().fillna(0)
+    month_order = [month for month in MONTH_NAMES if month in monthly_checkouts.index]
     monthly_checkouts = monthly_checkouts.reindex(month_order)
     
-    plt.figure(figsize=(14, 8))
-    monthly_checkouts.plot(kind='line', marker='o')
-    plt.title('Subject Popularity by Month')
-    plt.xlabel('Month')
-    plt.ylabel('Number of Checkouts')
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.legend(title='Subject', bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.tight_layout()
-    plt.savefig('plots/temporal_patterns/monthly_trends.png', dpi=300)
-    plt.close()
-    
     # Weekly patterns
-    weekly_checkouts = checkouts.groupby(['Week', 'Subject']).size().unstack().fillna(0)
-    
-    plt.figure(figsize=(16, 8))
-    weekly_checkouts.plot(kind='line', marker='o')
-    plt.title('Subject Popularity by Week')
-    plt.xlabel('Week of Year')
-    plt.ylabel('Number of Checkouts')
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.legend(title='Subject', bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.tight_layout()
-    plt.savefig('plots/temporal_patterns/weekly_trends.png', dpi=300)
-    plt.close()
+    weekly_checkouts = checkouts.groupby(['Week', 'Subject'], observed=True).size().unstack().fillna(0)
     
     # Heat map of day and hour
-    day_hour_checkouts = checkouts.groupby(['Day', 'Hour']).size().unstack().fillna(0)
+    day_hour_checkouts = checkouts.groupby(['Day', 'Hour'], observed=True).size().unstack().fillna(0)
     day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     day_hour_checkouts = day_hour_checkouts.reindex(day_order)
     
-    plt.figure(figsize=(14, 8))
-    sns.heatmap(day_hour_checkouts, cmap='YlGnBu', annot=True, fmt='g')
-    plt.title('Checkout Activity by Day and Hour')
-    plt.tight_layout()
-    plt.savefig('plots/temporal_patterns/day_hour_heatmap.png', dpi=300)
-    plt.close()
-    
     return hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts
 
+def temporal_pattern_plots(hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts):
+    """Plot specs for the results of analyze_temporal_patterns"""
+    return [
+        plot_spec('plots/temporal_patterns/hourly_trends.png', 'line', hourly_checkouts,
+                  'Subject Popularity by Hour of Day', 'Hour (24-hour format)', 'Number of Checkouts',
+                  grid=True, legend_title='Subject'),
+        plot_spec('plots/temporal_patterns/monthly_trends.png', 'line', monthly_checkouts,
+                  'Subject Popularity by Month', 'Month', 'Number of Checkouts',
+                  grid=True, legend_title='Subject'),
+        plot_spec('plots/temporal_patterns/weekly_trends.png', 'line', weekly_checkouts,
+                  'Subject Popularity by Week', 'Week of Year', 'Number of Checkouts', figsize=(16, 8),
+                  grid=True, legend_title='Subject'),
+        plot_spec('plots/temporal_patterns/day_hour_heatmap.png', 'heatmap', day_hour_checkouts,
+                  'Checkout Activity by Day and Hour', cmap='YlGnBu', fmt='g'),
+    ]
+
 if __name__ == "__main__":
-    hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts = analyze_temporal_patterns()
+    hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts = analyze_temporal_patterns(AnalysisContext.load())
+    render_all(temporal_pattern_plots(hourly_checkouts, monthly_checkouts, weekly_checkouts, day_hour_checkouts))
     print("Temporal pattern analysis complete. Plots saved to plots/temporal_patterns/")
\ No newline at end of file
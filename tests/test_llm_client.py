@@ -0,0 +1,106 @@
+import threading
+import pytest
+import requests
+import llm_stub
+from llm_client import LLMClient, parse_event_stream, stream_message
+
+QUESTION = {'messages': [{'role': 'user', 'content': 'Hello there'}]}
+
+@pytest.fixture
+def stub():
+    """Start a stub server on a free port; call it with make_server's failure options."""
+    servers, clients = [], []
+
+    def start(timeout=(2, 5), **options):
+        server = llm_stub.make_server(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+        clients.append(LLMClient(url, 'test-key', timeout=timeout, retries=2, backoff=0))
+        return server, clients[-1]
+
+    yield start
+    for client in clients:
+        client.close()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_complete(stub):
+    server, client = stub()
+    response = client.complete(QUESTION)
+    assert response == llm_stub.complete(QUESTION)
+    assert server.requests == 1
+
+def test_retries_retryable_statuses(stub):
+    server, client = stub(fail_status=503, failures=2)
+    assert client.complete(QUESTION) == llm_stub.complete(QUESTION)
+    assert server.requests == 3
+
+def test_raises_when_retries_run_out(stub):
+    server, client = stub(fail_status=503, failures=-1)
+    with pytest.raises(requests.HTTPError) as error:
+        client.complete(QUESTION)
+    assert error.value.response.status_code == 503
+    assert server.requests == 3
+
+def test_client_errors_are_not_retried(stub):
+    server, client = stub(fail_status=400, failures=-1)
+    with pytest.raises(requests.HTTPError) as error:
+        client.complete(QUESTION)
+    assert error.value.response.status_code == 400
+    assert server.requests == 1
+
+def test_read_timeouts_are_not_retried(stub):
+    # The server has the request by then; sending it again could run the completion twice
+    server, client = stub(timeout=(2, 0.2), delay=0.5)
+    with pytest.raises(requests.ReadTimeout):
+        client.complete(QUESTION)
+    assert server.requests == 1
+
+def test_stream(stub):
+    server, client = stub()
+    pieces = []
+    chunks = stream_message(client.stream(QUESTION))
+    try:
+        while True:
+            pieces.append(next(chunks))
+    except StopIteration as done:
+        message = done.value
+    assert len(pieces) > 1
+    assert ''.join(pieces) == message['content'] == llm_stub.complete(QUESTION)['choices'][0]['message']['content']
+
+def test_stream_tool_calls(stub):
+    server, client = stub()
+    payload = {**QUESTION, 'tools': [{'type': 'function', 'function': {'name': 'busiest_hours'}}],
+               'messages': [{'role': 'user', 'content': 'When is the library busiest?'}]}
+    chunks = stream_message(client.stream(payload))
+    with pytest.raises(StopIteration) as done:
+        next(chunks)
+    assert done.value.value['tool_calls'][0]['function']['name'] == 'busiest_hours'
+
+def test_stream_raises_on_error_status(stub):
+    server, client = stub(fail_status=400, failures=-1)
+    with pytest.raises(requests.HTTPError):
+        list(client.stream(QUESTION))
+
+def test_parse_event_stream():
+    lines = [
+        ': keep-alive comment',
+        'data: {"a": 1}',
+        '',
+        'event: message',
+        'data: {"b":',
+        'data: 2}',
+        '',
+        'data:{"c": 3}',
+        '',
+        'data: [DONE]',
+        '',
+        'data: {"after": "done"}',
+        '',
+    ]
+    assert list(parse_event_stream(lines)) == [{'a': 1}, {'b': 2}, {'c': 3}]
+
+def test_parse_event_stream_without_final_blank_line():
+    assert list(parse_event_stream(['data: {"a": 1}', '', 'data: {"b": 2}'])) == [{'a': 1}, {'b': 2}]
@@ -0,0 +1,87 @@
+import json
+import pytest
+import store
+import llm_stub
+from query_tools import FUNCTIONS, run_tool
+
+# (date, card, department, transaction, title, subject)
+ROWS = [
+    ('2024-01-10 10:15:00', 'C1', 'CSE', 'Check out', 'LET US C', 'Computer Science & Programming'),
+    ('2024-01-10 10:40:00', 'C2', 'CSE', 'Check out', 'LET US C', 'Computer Science & Programming'),
+    ('2024-01-20 14:05:00', 'C3', 'ME', 'Check out', 'THEORY OF MACHINES', 'Engineering'),
+    ('2024-02-02 10:30:00', 'C1', 'CSE', 'Check out', 'THINK PYTHON', 'Computer Science & Programming'),
+    ('2024-02-15 11:00:00', 'C4', 'ME', 'Check out', 'THEORY OF MACHINES', 'Engineering'),
+    ('2024-02-15 11:20:00', 'C4', 'ME', 'Check in', 'THEORY OF MACHINES', 'Engineering'),
+    ('2024-02-28 16:45:00', 'C5', 'MBA', 'Check out', 'MARKETING MANAGEMENT', 'Management & Business'),
+]
+
+@pytest.fixture
+def db():
+    conn = store.connect(':memory:')
+    conn.executemany(store.INSERT, [
+        (date, card, None, department, 'UG', txn, None, None, title, None, 'RIT', 'RIT', subject,
+         int(date[11:13]), None, None, 'test')
+        for date, card, department, txn, title, subject in ROWS])
+    store.refresh_summaries(conn)
+    yield conn
+    conn.close()
+
+def call(db, name, **arguments):
+    return json.loads(run_tool(db, name, json.dumps(arguments)))
+
+def test_checkouts_by_subject(db):
+    result = call(db, 'checkouts_by_subject', period='month')['result']
+    assert sorted(result, key=lambda row: (row['period'], row['subject'])) == [
+        {'period': '2024-01', 'subject': 'Computer Science & Programming', 'checkouts': 2},
+        {'period': '2024-01', 'subject': 'Engineering', 'checkouts': 1},
+        {'period': '2024-02', 'subject': 'Computer Science & Programming', 'checkouts': 1},
+        {'period': '2024-02', 'subject': 'Engineering', 'checkouts': 1},
+        {'period': '2024-02', 'subject': 'Management & Business', 'checkouts': 1},
+    ]
+    result = call(db, 'checkouts_by_subject', subject='Engineering', period='year')['result']
+    assert result == [{'period': '2024', 'subject': 'Engineering', 'checkouts': 2}]
+
+def test_busiest_hours(db):
+    assert call(db, 'busiest_hours', top_n=1)['result'] == [{'hour': '10:00', 'checkouts': 3}]
+    assert len(call(db, 'busiest_hours', top_n=10)['result']) == 4
+    assert call(db, 'busiest_hours', department='ME')['result'][0]['checkouts'] == 1
+
+def test_top_titles(db):
+    result = call(db, 'top_titles', top_n=2)['result']
+    assert {row['title']: row['checkouts'] for row in result} == {'LET US C': 2, 'THEORY OF MACHINES': 2}
+
+def test_top_titles_filters_on_exact_days(db):
+    result = call(db, 'top_titles', start='2024-01-15', end='2024-02-15')['result']
+    assert {row['title']: row['checkouts'] for row in result} == {'THEORY OF MACHINES': 1, 'THINK PYTHON': 1}
+
+def test_department_preferences(db):
+    result = call(db, 'department_preferences')['result']
+    assert [row['department'] for row in result] == ['CSE', 'ME', 'MBA']
+    assert result[0]['subjects'] == [{'subject': 'Computer Science & Programming', 'checkouts': 3}]
+
+def test_list_values(db):
+    assert call(db, 'list_values', column='department')['result'] == ['CSE', 'MBA', 'ME']
+
+def test_errors_are_returned_to_the_model(db):
+    assert 'error' in call(db, 'no_such_tool')
+    assert 'error' in call(db, 'checkouts_by_subject', period='week')
+    assert 'error' in call(db, 'busiest_hours', unknown=1)
+    assert 'error' in json.loads(run_tool(db, 'top_titles', 'not json'))
+
+def test_database_errors_are_returned_to_the_model(db):
+    db.execute("DROP TABLE title_summary")
+    assert 'no such table' in call(db, 'top_titles')['error']
+
+def test_tool_loop_runs_offline_against_the_stub(db):
+    payload = {'messages': [{'role': 'user', 'content': 'Which books are borrowed most?'}],
+               'tools': [{'type': 'function', 'function': {'name': name}} for name in FUNCTIONS]}
+    message = llm_stub.complete(payload)['choices'][0]['message']
+    assert message['tool_calls'][0]['function']['name'] == 'top_titles'
+
+    payload['messages'].append(message)
+    for tool_call in message['tool_calls']:
+        payload['messages'].append({'role': 'tool', 'tool_call_id': tool_call['id'],
+                                    'content': run_tool(db, tool_call['function']['name'],
+                                                        tool_call['function']['arguments'])})
+    answer = llm_stub.complete(payload)['choices'][0]['message']['content']
+    assert 'LET US C' in answer
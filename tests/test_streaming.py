@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic_data import write_report
+from data_utils import load_report, combine_reports, split_checkouts
+from streaming import CirculationSketch, CountMinSketch, HeavyHitters, HyperLogLog, key_strings, CMS_WIDTH, HLL_PRECISION
+
+# Distinct counts may be off by this many standard errors of the HyperLogLog
+HLL_TOLERANCE = 3 * 1.04 / np.sqrt(2 ** HLL_PRECISION)
+
+# Groups with fewer patrons are left out of the per-group checks
+MIN_GROUP_PATRONS = 50
+
+# Three months of seeded synthetic transactions, one report each, as separate branches or days would be
+PERIODS = [('2024-01-01', '2024-02-01'), ('2024-02-01', '2024-03-01'), ('2024-03-01', '2024-04-01')]
+
+@pytest.fixture(scope='module')
+def reports(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('reports'))
+    return [load_report(write_report(directory, 4000, start, end, seed=seed), use_cache=False)
+            for seed, (start, end) in enumerate(PERIODS)]
+
+@pytest.fixture(scope='module')
+def exact(reports):
+    df = combine_reports(reports)
+    return df, split_checkouts(df)
+
+@pytest.fixture(scope='module')
+def merged(reports):
+    sketches = []
+    for report in reports:
+        sketch = CirculationSketch()
+        sketch.update(report)
+        sketches.append(sketch)
+    for sketch in sketches[1:]:
+        sketches[0].merge(sketch)
+    return sketches[0]
+
+def without_candidates(sketch):
+    """The sketch's dict without the heavy-hitter candidate keys, which depend on how rows were batched."""
+    doc = sketch.to_dict()
+    for name in ('titles', 'barcodes'):
+        doc[name].pop('top')
+    return doc
+
+def test_numbers_are_one_key_however_typed():
+    typed = [[123], [123.0], pd.array([123], dtype='Int64'), pd.Series([123.0, np.nan]).dropna(),
+             np.array([123], dtype=object)]
+    assert {tuple(key_strings(values)) for values in typed} == {('123',)}
+    assert list(key_strings(pd.Series([1.5, 2.0, np.inf]))) == ['1.5', '2', 'inf']
+
+def test_heavy_hitters_and_distinct_counts_share_keys():
+    hitters = HeavyHitters(5)
+    hitters.add(pd.Series([123, 456]))
+    hitters.add(pd.Series([123.0, np.nan]))
+    assert hitters.most_common() == [('123', 2), ('456', 1)]
+
+    patrons = HyperLogLog()
+    patrons.add(pd.Series([7.0, np.nan]))
+    patrons.add(pd.array([7, None], dtype='Int64'))
+    assert patrons.count() == 1
+
+def test_sketch_counts_float_barcodes_and_cards_as_integers():
+    rows = [{'Date': '2024-01-10 10:00:00', 'Transaction': 'Check out', 'Title': 'LET US C',
+             'Barcode': barcode, 'Card Number': card, 'Department': 'CSE', 'Subject': 'Computer Science & Programming'}
+            for barcode, card in ((123, 9), (123.0, 9.0), (None, None))]
+    sketch = CirculationSketch()
+    sketch.update(pd.DataFrame(rows[:1]))
+    sketch.update(pd.DataFrame(rows[1:]))
+    assert sketch.top_barcodes() == [('123', 2)]
+    assert sketch.distinct_patrons() == 1
+    assert sketch.distinct_patrons(department='CSE') == 1
+
+@pytest.mark.parametrize('column', ['Title', 'Barcode'])
+def test_heavy_hitters_find_the_top_keys_within_the_count_min_bound(merged, exact, column):
+    _, checkouts = exact
+    counts = checkouts[column].value_counts()
+    counts.index = counts.index.astype(str)
+    estimated = dict(merged.titles.most_common() if column == 'Title' else merged.barcodes.most_common())
+
+    # A key beating the k-th largest count by more than the bound can't be pushed out of the heap
+    bound = np.e / CMS_WIDTH * len(checkouts)
+    safe = counts[counts > counts.iloc[merged.k - 1] + bound]
+    assert len(safe) and all(key in estimated for key in safe.index)
+    errors = [estimated[key] - count for key, count in counts.items() if key in estimated]
+    assert 0 <= min(errors) and max(errors) <= bound
+
+def test_distinct_patrons_within_three_standard_errors(merged, exact):
+    df, checkouts = exact
+    expected = [(merged.distinct_patrons(), df['Card Number'].nunique())]
+    by_department = df.groupby('Department', observed=True)['Card Number'].nunique()
+    expected += [(merged.distinct_patrons(department=department), count)
+                 for department, count in by_department[by_department >= MIN_GROUP_PATRONS].items()]
+    by_subject = checkouts.groupby('Subject', observed=True)['Card Number'].nunique()
+    expected += [(merged.distinct_patrons(subject=subject), count)
+                 for subject, count in by_subject[by_subject >= MIN_GROUP_PATRONS].items()]
+    assert len(expected) > 3
+    for estimate, count in expected:
+        assert abs(estimate - count) / count <= HLL_TOLERANCE
+
+def test_sliding_window_counts_are_exact(merged, exact):
+    df, _ = exact
+    last_hour = df['Date'].max().floor('h')
+    recent = df[df['Date'] >= last_hour - pd.Timedelta(hours=merged.transactions.window_hours - 1)]
+    assert merged.recent_transactions() == {str(key): int(count)
+                                            for key, count in recent['Transaction'].value_counts().items() if count}
+
+def test_merged_sketches_equal_one_sketch_of_all_rows(merged, exact):
+    df, _ = exact
+    whole = CirculationSketch()
+    whole.update(df)
+    assert without_candidates(merged) == without_candidates(whole)
+
+def test_rows_added_one_at_a_time_match_a_batch(reports):
+    sample = reports[0].iloc[:2500]
+    one_by_one, batch = CirculationSketch(), CirculationSketch()
+    for row in sample.to_dict('records'):
+        one_by_one.add(row)
+    batch.update(sample)
+    assert without_candidates(one_by_one) == without_candidates(batch)
+
+def test_saved_sketch_loads_back_unchanged(merged, tmp_path):
+    path = str(tmp_path / 'sketch.json')
+    merged.save(path)
+    assert CirculationSketch.load(path).to_dict() == merged.to_dict()
+
+def test_k_must_be_positive():
+    for make in (HeavyHitters, CirculationSketch):
+        with pytest.raises(ValueError):
+            make(k=0)
+
+def test_sketches_of_different_sizes_do_not_merge():
+    with pytest.raises(ValueError):
+        HeavyHitters(k=5).merge(HeavyHitters(k=6))
+    with pytest.raises(ValueError):
+        CountMinSketch(width=64).merge(CountMinSketch(width=128))
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+    sketch = CirculationSketch()
+    sketch.update(pd.DataFrame([{'Date': pd.Timestamp('2024-01-10 10:00'), 'Transaction': 'Check out',
+                                 'Title': 'LET US C', 'Barcode': '1', 'Card Number': '9', 'Department': 'CSE',
+                                 'Subject': 'Computer Science & Programming'}]))
+    before = sketch.to_dict()
+    for other in (CirculationSketch(k=10), CirculationSketch(precision=10), CirculationSketch(window_hours=12)):
+        with pytest.raises(ValueError):
+            sketch.merge(other)
+    assert sketch.to_dict() == before
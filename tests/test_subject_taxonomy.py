@@ -0,0 +1,22 @@
+import os
+import pandas as pd
+from subject_taxonomy import SubjectTaxonomy
+
+SUBJECTS = [('Computer Science & Programming', ['python', 'programming']), ('Engineering', ['machines'])]
+TITLES = pd.Series(['THINK PYTHON', 'THEORY OF MACHINES', 'ORGANIC CHEMISTRY', None])
+
+def cached_digests(cache_dir):
+    return sorted(name.removesuffix('.json') for name in os.listdir(cache_dir))
+
+def test_title_cache_keeps_only_the_current_and_previous_taxonomies(tmp_path):
+    edits = [SubjectTaxonomy(SUBJECTS + [('Chemistry', [f"keyword{i}"])]) for i in range(3)]
+    for taxonomy in edits:
+        assert list(taxonomy.classify(TITLES, str(tmp_path))) == [
+            'Computer Science & Programming', 'Engineering', 'Other', 'Unknown']
+    assert cached_digests(tmp_path) == sorted(taxonomy.digest for taxonomy in edits[1:])
+
+    # The next edit still reclassifies from the previous map
+    chemistry = SubjectTaxonomy(SUBJECTS + [('Chemistry', ['chemistry'])])
+    assert list(chemistry.classify(TITLES, str(tmp_path))) == [
+        'Computer Science & Programming', 'Engineering', 'Chemistry', 'Unknown']
+    assert cached_digests(tmp_path) == sorted([edits[-1].digest, chemistry.digest])
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+import store
+import incremental
+from benchmarks.synthetic_data import write_report
+from data_utils import load_report, combine_reports, split_checkouts
+from upload_jobs import UploadJobs
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = UploadJobs(str(tmp_path / 'circulation.db'), str(tmp_path / 'aggregates.pkl'), chunk_rows=397)
+    yield jobs
+    jobs.executor.shutdown()
+
+def upload(jobs, path, filename):
+    job_id = jobs.submit(str(path), filename)
+    jobs.executor.submit(lambda: None).result()
+    return jobs.status(job_id)
+
+def assert_aggregates_match(jobs, paths):
+    df = combine_reports([load_report(str(path), use_cache=False) for path in paths])
+    state = incremental.load_state(jobs.state_path)
+    assert incremental.verify_state(state, df, split_checkouts(df)) == []
+    conn = store.connect(jobs.db_path)
+    assert state['rows'] == conn.execute("SELECT COUNT(*) FROM circulation").fetchone()[0] == len(df)
+    conn.close()
+
+def test_uploads_in_date_order_are_folded(jobs, tmp_path):
+    january = write_report(str(tmp_path), 1000, '2024-01-01', '2024-02-01', seed=1)
+    february = write_report(str(tmp_path), 1000, '2024-02-01', '2024-03-01', seed=2)
+    assert upload(jobs, january, 'january.csv')['aggregates'] == 'folded'
+    assert upload(jobs, february, 'february.csv')['aggregates'] == 'folded'
+    assert_aggregates_match(jobs, [january, february])
+
+def test_earlier_upload_rebuilds_the_aggregates(jobs, tmp_path):
+    march = write_report(str(tmp_path), 1000, '2024-03-01', '2024-04-01', seed=1)
+    january = write_report(str(tmp_path), 1000, '2024-01-01', '2024-02-01', seed=2)
+    upload(jobs, march, 'march.csv')
+    status = upload(jobs, january, 'january.csv')
+    assert (status['state'], status['aggregates']) == ('done', 'rebuilt')
+    assert_aggregates_match(jobs, [march, january])
+
+def test_replaced_upload_rebuilds_the_aggregates(jobs, tmp_path):
+    march = write_report(str(tmp_path), 1000, '2024-03-01', '2024-04-01', seed=1)
+    corrected = tmp_path / 'corrected.csv'
+    pd.read_csv(march).iloc[200:].to_csv(corrected, index=False)
+    upload(jobs, march, 'march.csv')
+    status = upload(jobs, corrected, 'march.csv')
+    assert (status['rows_done'], status['aggregates']) == (800, 'rebuilt')
+    assert_aggregates_match(jobs, [corrected])
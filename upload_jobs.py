@@ -0,0 +1,166 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import store
+import incremental
+from data_utils import iter_report_chunks, missing_report_columns, split_checkouts, classify_titles, CachedReportWriter
+
+# Rows parsed, classified and written at a time
+CHUNK_ROWS = 20000
+
+# Finished jobs kept for status queries
+MAX_FINISHED_JOBS = 100
+
+class UploadJobs:
+    """
+    Ingest uploaded CSVs in a background thread.
+
+    Jobs run one at a time, so the store and the aggregate state have a
+    single writer. A circulation report is read in chunks of CHUNK_ROWS; each
+    chunk is classified once, inserted into the store, written to the
+    columnar cache and folded into the incremental aggregates, so memory use
+    does not grow with the file. The store rows of an earlier upload of the
+    same name are replaced in the same transaction, which commits only after
+    every chunk went in and the aggregates were saved. Folding only adds
+    rows after the aggregates' high-water mark, so when the upload replaces
+    earlier rows or has rows folding skipped, the aggregates are rebuilt
+    from the store instead. Any other CSV is only counted.
+    """
+
+    def __init__(self, db_path=store.DB_FILE, state_path=incremental.STATE_FILE, chunk_rows=CHUNK_ROWS):
+        self.db_path = db_path
+        self.state_path = state_path
+        self.chunk_rows = chunk_rows
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload')
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def submit(self, file_path, filename, on_done=None):
+        """
+        Queue a saved upload for ingestion.
+
+        Args:
+            file_path: Where the upload was saved
+            filename: Name the rows are stored under
+            on_done: Called with the final job status once it finishes
+
+        Returns:
+            job_id: Id for status
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                'id': job_id,
+                'filename': filename,
+                'state': 'queued',
+                'rows_total': None,
+                'rows_done': 0,
+                'progress': 0.0,
+                'error': None,
+                'aggregates': None,
+                'submitted': time.time(),
+                'finished': None,
+            }
+            self._forget_finished()
+        self.executor.submit(self._run, job_id, file_path, filename, on_done)
+        return job_id
+
+    def status(self, job_id):
+        """Return a copy of a job's status, or None for an unknown job."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            job = self.jobs[job_id]
+            job.update(fields)
+            if job['rows_total']:
+                job['progress'] = round(min(job['rows_done'] / job['rows_total'], 1.0), 4)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['finished'] is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    def _run(self, job_id, file_path, filename, on_done):
+        self._update(job_id, state='running')
+        try:
+            # A streaming pass over the lines gives the total for the progress
+            with open(file_path, 'rb') as f:
+                rows_total = max(sum(1 for _ in f) - 1, 0)
+            self._update(job_id, rows_total=rows_total)
+
+            if missing_report_columns(pd.read_csv(file_path, nrows=0).columns):
+                # Not a circulation report: nothing to ingest
+                self._update(job_id, rows_done=rows_total)
+            else:
+                self._ingest_report(job_id, file_path, filename)
+            self._update(job_id, state='done', finished=time.time())
+        except Exception as e:
+            print(f"Error ingesting {filename}: {e}")
+            self._update(job_id, state='failed', error=str(e), finished=time.time())
+
+        if on_done is not None:
+            on_done(self.status(job_id))
+
+    def _ingest_report(self, job_id, file_path, filename):
+        conn = store.connect(self.db_path)
+        writer = CachedReportWriter(file_path)
+        state = incremental.load_state(self.state_path)
+        try:
+            # One transaction: a failed upload leaves the earlier rows of the same name in place
+            with conn:
+                # Aggregates of replaced rows can't be taken back out, so those are rebuilt
+                rebuild = conn.execute("SELECT 1 FROM circulation WHERE source = ? LIMIT 1",
+                                       (filename,)).fetchone() is not None
+                conn.execute("DELETE FROM circulation WHERE source = ?", (filename,))
+                rows_done = 0
+                held = None
+                for chunk in iter_report_chunks(file_path, self.chunk_rows):
+                    subjects = classify_titles(chunk['Title'])
+                    store.insert_rows(conn, chunk, filename, subjects)
+                    writer.write(chunk)
+
+                    # Rows at the chunk's last timestamp are folded with the next chunk, so no
+                    # second is split between two folds
+                    chunk = chunk.assign(Subject=subjects)
+                    if held is not None:
+                        chunk = pd.concat([held, chunk])
+                    last = (chunk['Date'] == chunk['Date'].max()).to_numpy()
+                    if not rebuild:
+                        rebuild = not self._fold(state, chunk[~last])
+                    held = chunk[last]
+
+                    rows_done += len(subjects)
+                    self._update(job_id, rows_done=rows_done)
+                if held is not None and not rebuild:
+                    rebuild = not self._fold(state, held)
+                if rebuild:
+                    # Rows before the high-water mark, e.g. an earlier month uploaded after a later one
+                    state = incremental.rebuild_from_store(conn)
+                incremental.save_state(state, self.state_path)
+                self._update(job_id, aggregates='rebuilt' if rebuild else 'folded')
+            store.refresh_summaries(conn)
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            conn.close()
+
+        # The rows and aggregates are in; the columnar cache only speeds up later loads
+        try:
+            writer.close()
+        except Exception as e:
+            writer.abort()
+            print(f"Could not cache {filename}: {e}")
+
+    def _fold(self, state, rows):
+        """Fold rows into the aggregates; False if any of them was skipped as already folded."""
+        if not len(rows):
+            return True
+        folded = incremental.fold_new_rows(state, rows, split_checkouts(rows, subjects=rows['Subject']))
+        return folded == len(rows)